@@ -0,0 +1,274 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+Encode, truncate and binarize the XGLUE NTG / QG data in one pass.
+
+Every (language, split, side) file is cut into byte ranges with
+``Binarizer.find_offsets``. A process pool encodes the ranges with
+sentencepiece, truncates sources and looks up the dictionary, and writes
+each range into a ``MMapIndexedDatasetBuilder``. The ranges of a file are
+then merged into ``$DATA/bin/{lang}/{split}.src-tgt.{side}.{bin,idx}``,
+the same layout as ``preprocess.py``. Outputs that are up to date with their
+input, sentencepiece model, dictionary and options are skipped, so an
+interrupted run can simply be restarted.
+
+Example::
+
+    python bash_scripts/preprocess/preprocess_xglue.py --task ntg \\
+        --data $DATA --spm-model $MODEL_DIR/sentencepiece.bpe.model \\
+        --dict $MODEL_DIR/dict.txt --workers 64
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+from collections import Counter
+from multiprocessing import Pool
+
+import torch
+
+from fairseq.binarizer import Binarizer, safe_readline
+from fairseq.data import Dictionary, indexed_dataset
+
+
+logging.basicConfig(
+    format='%(asctime)s | %(levelname)s | %(name)s | %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S',
+    level=logging.INFO,
+    stream=sys.stdout,
+)
+logger = logging.getLogger('preprocess_xglue')
+
+
+TASKS = {
+    'ntg': ['en', 'es', 'fr', 'de', 'ru'],
+    'qg': ['en', 'es', 'fr', 'de', 'it', 'pt'],
+}
+
+# raw split name -> fairseq split name
+SPLITS = {'train': 'train', 'dev': 'valid', 'test': 'test'}
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='preprocess XGLUE NTG / QG')
+    # fmt: off
+    parser.add_argument('--task', required=True, choices=TASKS.keys())
+    parser.add_argument('--data', required=True, metavar='DIR',
+                        help='path to XGLUE/NTG or XGLUE/QG')
+    parser.add_argument('--spm-model', required=True, metavar='FP',
+                        help='sentencepiece model')
+    parser.add_argument('--dict', required=True, metavar='FP',
+                        help='dictionary of the pretrained model')
+    parser.add_argument('--langs', metavar='LANGS',
+                        help='comma separated languages (default: all languages of the task)')
+    parser.add_argument('--train-langs', default='en', metavar='LANGS',
+                        help='comma separated languages that have a train split')
+    parser.add_argument('--max-len', type=int, default=512, metavar='N',
+                        help='max source length, including special tokens')
+    parser.add_argument('--append-offset', type=int, default=4, metavar='N',
+                        help='number of special tokens added to sources later on')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), metavar='N',
+                        help='number of worker processes')
+    parser.add_argument('--chunk-bytes', type=int, default=2 ** 24, metavar='N',
+                        help='size of the byte ranges encoded by a worker')
+    parser.add_argument('--force', action='store_true',
+                        help='rebuild outputs that are up to date')
+    # fmt: on
+    return parser
+
+
+def get_jobs(args):
+    """Input file, output prefix and max number of pieces of every file to
+    binarize, as in the former preprocess_{NTG,QG}.sh."""
+    langs = args.langs.split(',') if args.langs else TASKS[args.task]
+    train_langs = set(args.train_langs.split(','))
+    jobs = []
+    for lang in langs:
+        splits = (['train'] if lang in train_langs else []) + ['dev', 'test']
+        for split in splits:
+            # there are no test targets
+            sides = ['src'] if split == 'test' else ['tgt', 'src']
+            for side in sides:
+                input_file = os.path.join(
+                    args.data, 'xglue.{}.{}.{}.{}'.format(args.task, lang, side, split)
+                )
+                output_prefix = os.path.join(
+                    args.data, 'bin', lang, '{}.src-tgt.{}'.format(SPLITS[split], side)
+                )
+                max_pieces = args.max_len - args.append_offset if side == 'src' else None
+                jobs.append((input_file, output_prefix, max_pieces))
+    return jobs
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+
+def get_stamp(args, input_file, max_pieces):
+    return {
+        'input': _file_stamp(input_file),
+        'spm_model': _file_stamp(args.spm_model),
+        'dict': _file_stamp(args.dict),
+        'max_pieces': max_pieces,
+    }
+
+
+def stamp_file_path(prefix_path):
+    return prefix_path + '.stamp.json'
+
+
+def is_up_to_date(output_prefix, stamp):
+    if not indexed_dataset.MMapIndexedDataset.exists(output_prefix) or \
+            not os.path.exists(stamp_file_path(output_prefix)):
+        return False
+    with open(stamp_file_path(output_prefix), 'r', encoding='utf-8') as f:
+        return json.load(f) == stamp
+
+
+_sp = None
+_vocab = None
+
+
+def _init_worker(spm_model, dict_path):
+    global _sp, _vocab
+    import sentencepiece as spm
+
+    _sp = spm.SentencePieceProcessor()
+    _sp.Load(spm_model)
+    _vocab = Dictionary.load(dict_path)
+
+
+def encode_chunk(input_file, output_prefix, max_pieces, offset, end):
+    """Encode the lines of *input_file* in [*offset*, *end*) into the mmap
+    dataset at *output_prefix*.
+
+    Like ``scripts/spm_encode.py``, empty lines are dropped.
+    """
+    ds = indexed_dataset.make_builder(
+        indexed_dataset.data_file_path(output_prefix), impl='mmap', vocab_size=len(_vocab),
+    )
+    nseq, ntok, nempty = 0, 0, 0
+    replaced = Counter()
+    with open(input_file, 'r', encoding='utf-8') as f:
+        f.seek(offset)
+        # next(f) breaks f.tell(), hence readline() must be used
+        line = safe_readline(f)
+        while line:
+            if end > 0 and f.tell() > end:
+                break
+            line = line.strip()
+            if len(line) == 0:
+                nempty += 1
+            else:
+                pieces = _sp.EncodeAsPieces(line)
+                if max_pieces is not None:
+                    pieces = pieces[:max_pieces]
+                ids = torch.IntTensor(len(pieces) + 1)
+                for i, piece in enumerate(pieces):
+                    idx = _vocab.index(piece)
+                    if idx == _vocab.unk_index and piece != _vocab.unk_word:
+                        replaced.update([piece])
+                    ids[i] = idx
+                ids[len(pieces)] = _vocab.eos_index
+                ds.add_item(ids)
+                nseq += 1
+                ntok += len(ids)
+            line = f.readline()
+    ds.finalize(indexed_dataset.index_file_path(output_prefix))
+    return {'nseq': nseq, 'ntok': ntok, 'nempty': nempty, 'replaced': replaced}
+
+
+def merge_chunks(output_prefix, chunk_prefixes, vocab_size):
+    """Concatenate the chunk datasets in order into *output_prefix*, through
+    a temporary file so that a partial output is never up to date."""
+    tmp_prefix = output_prefix + '.tmp'
+    ds = indexed_dataset.make_builder(
+        indexed_dataset.data_file_path(tmp_prefix), impl='mmap', vocab_size=vocab_size,
+    )
+    for chunk_prefix in chunk_prefixes:
+        ds.merge_file_(chunk_prefix)
+        os.remove(indexed_dataset.data_file_path(chunk_prefix))
+        os.remove(indexed_dataset.index_file_path(chunk_prefix))
+    ds.finalize(indexed_dataset.index_file_path(tmp_prefix))
+    os.replace(indexed_dataset.data_file_path(tmp_prefix), indexed_dataset.data_file_path(output_prefix))
+    os.replace(indexed_dataset.index_file_path(tmp_prefix), indexed_dataset.index_file_path(output_prefix))
+
+
+def main(args):
+    vocab = Dictionary.load(args.dict)
+
+    jobs = []
+    for input_file, output_prefix, max_pieces in get_jobs(args):
+        stamp = get_stamp(args, input_file, max_pieces)
+        if not args.force and is_up_to_date(output_prefix, stamp):
+            logger.info('{} is up to date'.format(output_prefix))
+            continue
+        os.makedirs(os.path.dirname(output_prefix), exist_ok=True)
+        if os.path.exists(stamp_file_path(output_prefix)):
+            os.remove(stamp_file_path(output_prefix))
+        num_chunks = max(1, os.path.getsize(input_file) // args.chunk_bytes)
+        offsets = Binarizer.find_offsets(input_file, num_chunks)
+        jobs.append((input_file, output_prefix, max_pieces, stamp, offsets))
+
+    with Pool(
+        processes=max(1, args.workers), initializer=_init_worker,
+        initargs=(args.spm_model, args.dict),
+    ) as pool:
+        results = []
+        for input_file, output_prefix, max_pieces, stamp, offsets in jobs:
+            chunks = []
+            for k in range(len(offsets) - 1):
+                chunk_prefix = '{}.chunk{}'.format(output_prefix, k)
+                chunks.append((chunk_prefix, pool.apply_async(
+                    encode_chunk,
+                    (input_file, chunk_prefix, max_pieces, offsets[k], offsets[k + 1]),
+                )))
+            results.append(chunks)
+
+        # merge files in submission order while later files are encoded
+        for (input_file, output_prefix, _, stamp, _), chunks in zip(jobs, results):
+            stats = Counter()
+            replaced = Counter()
+            for _, result in chunks:
+                res = result.get()
+                replaced.update(res.pop('replaced'))
+                stats.update(res)
+            merge_chunks(output_prefix, [prefix for prefix, _ in chunks], len(vocab))
+            with open(stamp_file_path(output_prefix), 'w', encoding='utf-8') as f:
+                json.dump(stamp, f)
+            logger.info(
+                '{}: {} sents, {} tokens, {} empty lines skipped, {:.3}% replaced by {}'.format(
+                    input_file, stats['nseq'], stats['ntok'], stats['nempty'],
+                    100 * sum(replaced.values()) / max(stats['ntok'], 1), vocab.unk_word,
+                )
+            )
+
+    # dictionaries and references, as expected by the finetuning and
+    # evaluation scripts
+    langs = args.langs.split(',') if args.langs else TASKS[args.task]
+    os.makedirs(os.path.join(args.data, 'ref'), exist_ok=True)
+    for lang in langs:
+        lang_dir = os.path.join(args.data, 'bin', lang)
+        os.makedirs(lang_dir, exist_ok=True)
+        for side in ['src', 'tgt']:
+            vocab.save(os.path.join(lang_dir, 'dict.{}.txt'.format(side)))
+        shutil.copyfile(
+            os.path.join(args.data, 'xglue.{}.{}.tgt.dev'.format(args.task, lang)),
+            os.path.join(args.data, 'ref', '{}.tgt.valid'.format(lang)),
+        )
+    logger.info('Wrote preprocessed data to {}'.format(os.path.join(args.data, 'bin')))
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -0,0 +1,210 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+Compare int8 and fp32 decoding of a checkpoint on CPU.
+
+The dev set of each language is decoded with the fp32 model and then with
+the model quantized by ``--quantize-int8``, with the options of
+``generate_single.sh``. For each language and overall, the benchmark reports
+the model loading time, the generated tokens per second and the BLEU of
+both models, scored as in ``eval_exp.py``, with the speedup and BLEU delta
+of int8. With ``--vocab_shortlist``, the fp32 model also decodes with the
+vocabulary shortlist of each language, and the speedup and BLEU delta of
+the shortlist are reported the same way. The decodes and a JSON summary are
+written to ``--output_dir``.
+
+    python evaluation/benchmark_int8.py --model $MODEL --spe $SPE --data_path $DATA_PATH \\
+        --ref_folder $XGLUE/NTG/ref --output_dir $OUT --threads 8 --quantized_cache_dir $CACHE \\
+        --vocab_shortlist $DATA_PATH/{lg}/shortlist.txt
+"""
+
+import argparse
+import copy
+import json
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+
+from bleu_scorer import load_reference, score_file
+from decode_scheduler import LANGS, generation_args, write_hypotheses
+
+
+logger = logging.getLogger("benchmark_int8")
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="int8 vs fp32 decoding benchmark")
+    parser.add_argument("--task", type=str, default="generation_from_pretrained_bart",
+                        help="dataset type")
+    parser.add_argument("--model", type=str, required=True,
+                        help="path to the checkpoint")
+    parser.add_argument("--spe", type=str, required=True,
+                        help="path to SPE model")
+    parser.add_argument("--data_path", type=str, required=True,
+                        help="path to binary data")
+    parser.add_argument("--ref_folder", type=str, required=True,
+                        help="folder of the {lg}.tgt.{split} references")
+    parser.add_argument("--output_dir", type=str, required=True,
+                        help="where to write the decodes and the summary")
+    parser.add_argument("--dataset", type=str, default="NTG",
+                        help="dataset name, NTG/QG")
+    parser.add_argument("--lgs", type=str, default=None,
+                        help="languages to decode, separated with - (default: all languages of the dataset)")
+    parser.add_argument("--split", type=str, default="valid",
+                        help="dataset split to decode")
+    parser.add_argument("--beam", type=int, default=5,
+                        help="beam size")
+    parser.add_argument("--max_sentences", type=int, default=16,
+                        help="batch size")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="number of CPU threads (default: PyTorch's default)")
+    parser.add_argument("--fuse_layers", action="store_true",
+                        help="fuse the self-attention projections of the int8 model")
+    parser.add_argument("--quantized_cache_dir", type=str, default=None,
+                        help="directory of the quantized checkpoints")
+    parser.add_argument("--vocab_shortlist", type=str, default=None,
+                        help="also decode with the fp32 model and the shortlist of each language, "
+                             "a path where {lg} is replaced with the language")
+    parser.add_argument("--shortlist_source_tokens", action="store_true",
+                        help="with --vocab_shortlist, add the source tokens of each batch to the shortlist")
+    parser.add_argument("--code_root", type=str, default=None,
+                        help="path to code root")
+    return parser
+
+
+def count_tokens(output):
+    """Number of tokens generated for the top hypotheses in the *output* of
+    generate.py, end of sentence included."""
+    num_tokens = 0
+    with open(output, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("P-"):
+                num_tokens += len(line.rstrip("\n").split("\t", 1)[1].split())
+    return num_tokens
+
+
+def run(args, mode):
+    """{lg: results} of decoding all languages with the fp32 model, the int8
+    model or the fp32 model with the vocabulary shortlist."""
+    from fairseq import tasks
+    from fairseq_cli.generate import generate, load_models
+
+    mode_args = copy.copy(args)
+    mode_args.int8 = mode == "int8"
+    fd = os.path.join(args.output_dir, mode)
+    os.makedirs(fd, exist_ok=True)
+
+    results, models = {}, None
+    for lg in args.lgs.split("-"):
+        gen_args = generation_args(mode_args, args.model, lg, args.split, cpu=True)
+        if mode == "shortlist":
+            gen_args.vocab_shortlist = args.vocab_shortlist.format(lg=lg)
+            gen_args.shortlist_source_tokens = args.shortlist_source_tokens
+        task = tasks.setup_task(gen_args)
+        if models is None:
+            start = time.perf_counter()
+            models = load_models(gen_args, task)
+            load_time = time.perf_counter() - start
+            logger.info("{} model loaded in {:.1f}s".format(mode, load_time))
+        task.load_dataset(args.split)
+
+        output = os.path.join(fd, "{}_src-tgt".format(lg))
+        start = time.perf_counter()
+        with open(output, "w", encoding="utf-8") as f:
+            generate(gen_args, task, models, f)
+        elapsed = time.perf_counter() - start
+        hyp = os.path.join(fd, "{}_tgt.{}.hyp".format(lg, args.split))
+        write_hypotheses(output, hyp)
+
+        num_tokens = count_tokens(output)
+        ref = os.path.join(args.ref_folder, "{}.tgt.{}".format(lg, args.split))
+        results[lg] = {
+            "tokens": num_tokens,
+            "seconds": round(elapsed, 3),
+            "tokens_per_s": round(num_tokens / elapsed, 2),
+            "bleu": score_file(hyp, load_reference(lg, ref)),
+        }
+        logger.info("{} {}: {}".format(mode, lg, results[lg]))
+    return {"load_seconds": round(load_time, 3), "languages": results}
+
+
+def summarize(results):
+    """Tokens/s of every mode, with the speedup and BLEU delta of every
+    mode but fp32 relative to fp32."""
+    summary = dict(results)
+    for mode in results:
+        langs = results[mode]["languages"].values()
+        summary[mode]["tokens_per_s"] = round(
+            sum(r["tokens"] for r in langs) / sum(r["seconds"] for r in langs), 2)
+    fp32 = results["fp32"]
+    summary["languages"], summary["speedup"] = {}, {}
+    for lg in fp32["languages"]:
+        a = fp32["languages"][lg]
+        summary["languages"][lg] = {}
+        for mode in results:
+            if mode == "fp32":
+                continue
+            b = results[mode]["languages"][lg]
+            summary["languages"][lg][mode] = {
+                "speedup": round(b["tokens_per_s"] / a["tokens_per_s"], 3),
+                "bleu_delta": round(b["bleu"] - a["bleu"], 2)
+                if a["bleu"] is not None and b["bleu"] is not None else None,
+            }
+    for mode in results:
+        if mode != "fp32":
+            summary["speedup"][mode] = round(summary[mode]["tokens_per_s"] / fp32["tokens_per_s"], 3)
+    return summary
+
+
+def print_summary(summary, modes):
+    others = [mode for mode in modes if mode != "fp32"]
+    header = "{:<6} {:>12} {:>8}".format("lang", "fp32 tok/s", "fp32")
+    for mode in others:
+        header += " {:>16} {:>8} {:>8}".format(mode + " tok/s", "speedup", "delta")
+    print(header)
+    for lg, diffs in summary["languages"].items():
+        a = summary["fp32"]["languages"][lg]
+        line = "{:<6} {:>12.1f} {:>8}".format(lg, a["tokens_per_s"], str(a["bleu"]))
+        for mode in others:
+            b = summary[mode]["languages"][lg]
+            line += " {:>16.1f} {:>8.2f} {:>8}".format(
+                b["tokens_per_s"], diffs[mode]["speedup"], str(diffs[mode]["bleu_delta"]))
+        print(line)
+    line = "{:<6} {:>12.1f} {:>8}".format("all", summary["fp32"]["tokens_per_s"], "")
+    for mode in others:
+        line += " {:>16.1f} {:>8.2f}".format(summary[mode]["tokens_per_s"], summary["speedup"][mode])
+    print(line)
+    print("model loading: " + ", ".join(
+        "{} {:.1f}s".format(mode, summary[mode]["load_seconds"]) for mode in modes))
+
+
+def main():
+    logging.basicConfig(
+        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        level=logging.INFO,
+        stream=sys.stderr,
+    )
+    args = get_parser().parse_args()
+    if args.code_root is not None and args.code_root not in sys.path:
+        sys.path.insert(0, args.code_root)
+    if args.lgs is None:
+        args.lgs = "-".join(LANGS[args.dataset])
+
+    import torch
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    modes = ["fp32", "int8"] + (["shortlist"] if args.vocab_shortlist is not None else [])
+    summary = summarize(OrderedDict((mode, run(args, mode)) for mode in modes))
+    with open(os.path.join(args.output_dir, "benchmark_int8.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    print_summary(summary, modes)
+
+
+if __name__ == "__main__":
+    main()
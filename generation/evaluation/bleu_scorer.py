@@ -0,0 +1,161 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+Score the decodes of an experiment with corpus BLEU, in process.
+
+Scores are the same as ``python -m sacrebleu --force -lc -l {lg}-{lg} ref < hyp``:
+lines are lowercased and tokenized with the sacrebleu tokenizer of the target
+language, and BLEU uses the ``exp`` smoothing. Each language is scored by one
+worker process, which reads and counts the n-grams of its reference once and
+then scores the hypotheses of every epoch against them.
+"""
+
+import csv
+import json
+import math
+import os
+from collections import Counter
+from multiprocessing import Pool
+
+
+NGRAM_ORDER = 4
+
+
+def get_tokenizer(lg):
+    """The tokenizer sacrebleu uses for ``-l {lg}-{lg}``."""
+    name = "zh" if lg == "zh" else "ja-mecab" if lg == "ja" else "13a"
+    try:
+        # sacrebleu >= 2.0
+        from sacrebleu.metrics.bleu import _get_tokenizer
+        return _get_tokenizer(name)()
+    except ImportError:
+        from sacrebleu.tokenizers import TOKENIZERS
+        return TOKENIZERS[name]()
+
+
+def extract_ngrams(tokens):
+    ngrams = Counter()
+    for n in range(1, NGRAM_ORDER + 1):
+        ngrams.update(zip(*[tokens[i:] for i in range(n)]))
+    return ngrams
+
+
+def read_lines(path, tokenize):
+    with open(path, "r", encoding="utf-8") as f:
+        return [tokenize(line.lower().rstrip()).split() for line in f]
+
+
+def corpus_stats(hyps, refs):
+    """Clipped n-gram matches, n-gram totals and lengths of *hyps* against
+    *refs*, a list of (length, n-gram counts) of the reference lines."""
+    correct = [0] * NGRAM_ORDER
+    total = [0] * NGRAM_ORDER
+    sys_len, ref_len = 0, 0
+    for hyp, (rlen, ref_ngrams) in zip(hyps, refs):
+        sys_len += len(hyp)
+        ref_len += rlen
+        for ngram, count in extract_ngrams(hyp).items():
+            n = len(ngram) - 1
+            total[n] += count
+            correct[n] += min(count, ref_ngrams.get(ngram, 0))
+    return correct, total, sys_len, ref_len
+
+
+def compute_bleu(correct, total, sys_len, ref_len):
+    """sacrebleu's corpus BLEU with ``exp`` smoothing."""
+    precisions = [0.0] * NGRAM_ORDER
+    smooth_mteval = 1.0
+    for n in range(NGRAM_ORDER):
+        if total[n] == 0:
+            break
+        if correct[n] == 0:
+            smooth_mteval *= 2
+            precisions[n] = 100.0 / (smooth_mteval * total[n])
+        else:
+            precisions[n] = 100.0 * correct[n] / total[n]
+
+    if sys_len < ref_len:
+        bp = math.exp(1 - ref_len / sys_len) if sys_len > 0 else 0.0
+    else:
+        bp = 1.0
+    if min(precisions) == 0:
+        return 0.0
+    return bp * math.exp(sum(math.log(p) for p in precisions) / NGRAM_ORDER)
+
+
+def load_reference(lg, ref):
+    """The tokenizer of *lg* and the (length, n-gram counts) of the lines of
+    the reference file *ref*."""
+    tokenize = get_tokenizer(lg)
+    return tokenize, [(len(r), extract_ngrams(r)) for r in read_lines(ref, tokenize)]
+
+
+def score_file(fs, reference):
+    """BLEU of the hypothesis file *fs* against a loaded *reference*, or None
+    if its length does not match."""
+    tokenize, refs = reference
+    hyps = read_lines(fs, tokenize)
+    if len(hyps) != len(refs):
+        return None
+    return round(compute_bleu(*corpus_stats(hyps, refs)), 2)
+
+
+def score_language(job):
+    """BLEU of the hypothesis files in *hyp_files* (epoch -> path) against the
+    reference *ref*; files whose length does not match are skipped."""
+    lg, ref, hyp_files = job
+    reference = load_reference(lg, ref)
+    scores = {}
+    for e, fs in hyp_files:
+        score = score_file(fs, reference)
+        if score is not None:
+            scores[e] = score
+    return lg, scores
+
+
+def hyp_file(args, epoch, lg, split):
+    return os.path.join(args.save_dir, "decodes/{}/checkpoint{}/{}".format(args.exp, epoch, split),
+                        "{}_tgt.{}.hyp".format(lg, split))
+
+
+def score_decodes(args, epochs, split, num_workers=None):
+    """{epoch: {language: BLEU}} of the decodes of *split* of every epoch."""
+    jobs = []
+    for lg in args.lgs.split("-"):
+        ref = os.path.join(args.ref_folder, "{}.tgt.{}".format(lg, split))
+        hyp_files = []
+        for e in epochs:
+            fs = hyp_file(args, e, lg, split)
+            if os.path.isfile(fs):
+                hyp_files.append((e, fs))
+        if len(hyp_files) > 0:
+            jobs.append((lg, ref, hyp_files))
+
+    all_scores = {}
+    if len(jobs) == 0:
+        return all_scores
+    num_workers = min(num_workers or os.cpu_count() or 1, len(jobs))
+    if num_workers > 1:
+        with Pool(num_workers) as pool:
+            results = pool.map(score_language, jobs)
+    else:
+        results = map(score_language, jobs)
+    for lg, scores in results:
+        for e, score in scores.items():
+            all_scores.setdefault(e, {})[lg] = score
+    return {e: all_scores[e] for e in sorted(all_scores)}
+
+
+def write_scores(all_scores, lgs, path):
+    """Write the scores to *path*.json and an epoch x language *path*.csv."""
+    dirname = os.path.dirname(path)
+    if dirname and not os.path.exists(dirname):
+        os.makedirs(dirname)
+    with open(path + ".json", "w", encoding="utf-8") as f:
+        json.dump({str(e): s for e, s in all_scores.items()}, f, indent=2)
+    with open(path + ".csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["epoch"] + lgs)
+        for e, s in all_scores.items():
+            writer.writerow([e] + [s.get(lg, "") for lg in lgs])
@@ -0,0 +1,348 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+"""
+Decode the checkpoints of an experiment on all languages of NTG / QG.
+
+One worker process runs per GPU (or ``--cpu_workers`` processes without
+GPUs). Workers pull (checkpoint, language, split) jobs from the scheduler,
+which hands a worker the remaining jobs of the checkpoint it already holds
+before moving it to another checkpoint, so every checkpoint is loaded once
+per worker that decodes it and no worker waits for the others. The job of a
+worker that dies is handed to another worker once, then marked as failed.
+
+Outputs are the same as ``generate_single.sh``:
+``{save_dir}/decodes/{exp}/checkpoint{e}/{split}/{lg}_src-tgt`` and
+``{lg}_tgt.{split}.hyp``.
+"""
+
+import argparse
+import logging
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+import traceback
+from collections import OrderedDict
+
+
+LANGS = {
+    "NTG": ["en", "fr", "es", "de", "ru"],
+    "QG": ["en", "fr", "de", "es", "it", "pt"],
+}
+
+PRETRAIN_LANGS = "af,als,am,an,ang,ar,arz,ast,az,bar,be,bg,bn,br,bs,ca,ceb,ckb,cs,cy,da,de,el,en,eo,es,et,eu,fa,fi,fr,fy,ga,gan,gl,gu,he,hi,hr,hu,hy,ia,id,is,it,ja,jv,ka,kk,kn,ko,ku,la,lb,lt,lv,mk,ml,mn,mr,ms,my,nds,ne,nl,nn,no,oc,pl,pt,ro,ru,scn,sco,sh,si,simple,sk,sl,sq,sr,sv,sw,ta,te,th,tl,tr,tt,uk,ur,uz,vi,war,wuu,yi,zh,zh_classical,zh_min_nan,zh_yue"
+
+logger = logging.getLogger("decode_scheduler")
+
+# seconds between checks that the workers are still alive
+POLL_INTERVAL = 10
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Language transfer")
+    parser.add_argument("--task", type=str, default="generation_from_pretrained_bart",
+                        help="dataset type")
+    parser.add_argument("--ngpu", type=int, default=4,
+                        help="number of gpus")
+    parser.add_argument("--cpu_workers", type=int, default=0,
+                        help="number of CPU worker processes, used when no GPU is available")
+    parser.add_argument("--epoch", type=int, default=20,
+                        help="total number of epochs")
+    parser.add_argument("--start", type=int, default=1,
+                        help="start epochs")
+    parser.add_argument("--spe", type=str,
+                        help="path to SPE model")
+    parser.add_argument("--exp", type=str, required=True,
+                        help="experiment tag")
+    parser.add_argument("--dataset", type=str,
+                        help="dataset name, NTG/QG")
+    parser.add_argument("--lgs", type=str, default=None,
+                        help="languages to decode, separated with - (default: all languages of the dataset)")
+    parser.add_argument("--split", type=str, default="dev",
+                        help="dataset splits to decode, separated with ,")
+    parser.add_argument("--beam", type=int, default=5,
+                        help="beam size")
+    parser.add_argument("--max_sentences", type=int, default=16,
+                        help="batch size")
+    parser.add_argument("--data_path", type=str,
+                        help="path to binary data")
+    parser.add_argument("--code_root", type=str,
+                        help="path to code root")
+    parser.add_argument("--save_dir", type=str,
+                        help="path to the dir to save checkpoints and decoded results")
+    parser.add_argument("--skip_existing", action="store_true",
+                        help="skip decodes that are newer than their checkpoint")
+    parser.add_argument("--int8", action="store_true",
+                        help="decode on CPU workers with int8 dynamic quantization (--quantize-int8)")
+    parser.add_argument("--fuse_layers", action="store_true",
+                        help="with --int8, fuse the self-attention projections")
+    parser.add_argument("--quantized_cache_dir", type=str, default=None,
+                        help="with --int8, directory of the quantized checkpoints")
+    return parser
+
+
+def decode_dir(args, epoch, split):
+    return os.path.join(args.save_dir, "decodes/{}/checkpoint{}/{}".format(args.exp, epoch, split))
+
+
+def hyp_path(args, epoch, lg, split):
+    return os.path.join(decode_dir(args, epoch, split), "{}_tgt.{}.hyp".format(lg, split))
+
+
+def checkpoint_path(args, epoch):
+    return os.path.join(args.save_dir, args.exp, "checkpoint{}.pt".format(epoch))
+
+
+def get_jobs(args, epochs):
+    """(checkpoint, language, split) jobs, grouped by checkpoint."""
+    lgs = args.lgs.split("-") if args.lgs else LANGS[args.dataset]
+    jobs = OrderedDict()
+    for e in epochs:
+        model = checkpoint_path(args, e)
+        if not os.path.exists(model):
+            logger.warning("{} not found, skipping".format(model))
+            continue
+        for split in args.split.split(","):
+            for lg in lgs:
+                hyp = hyp_path(args, e, lg, split)
+                if args.skip_existing and os.path.exists(hyp) and \
+                        os.path.getmtime(hyp) >= os.path.getmtime(model):
+                    continue
+                jobs.setdefault(e, []).append((lg, split))
+    return jobs
+
+
+def generation_args(args, model, lg, split, cpu):
+    """Parsed fairseq-generate arguments, as in generate_single.sh."""
+    from fairseq import options
+
+    parser = options.get_generation_parser()
+    return options.parse_args_and_arch(parser, [
+        os.path.join(args.data_path, lg),
+        "--path", model,
+        "--task", args.task,
+        "--gen-subset", split,
+        "-t", lg, "-s", lg,
+        "--placeholder", "200",
+        "--common_eos", "EOS",
+        "--bpe", "sentencepiece",
+        "--sentencepiece-vocab", args.spe,
+        "--sacrebleu",
+        "--remove-bpe", "sentencepiece",
+        "--max-sentences", str(args.max_sentences),
+        "--langs", PRETRAIN_LANGS,
+        "--beam", str(args.beam),
+        "--no-progress-bar",
+    ] + (["--cpu"] if cpu else []) + quantization_args(args, cpu))
+
+
+def quantization_args(args, cpu):
+    if not getattr(args, "int8", False):
+        return []
+    assert cpu, "--int8 decodes on CPU workers"
+    return ["--quantize-int8"] + (["--quantize-fuse-layers"] if args.fuse_layers else []) + (
+        ["--quantized-cache-dir", args.quantized_cache_dir] if args.quantized_cache_dir else [])
+
+
+def write_hypotheses(output, hyp):
+    """``grep -P "^H" | sort -V | cut -f 3- | sed "s/\\[EOS\\]//g"``"""
+    hypos = []
+    with open(output, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("H-"):
+                sample_id, _, text = line.rstrip("\n").split("\t", 2)
+                hypos.append((int(sample_id[2:]), text.replace("[EOS]", "")))
+    hypos.sort(key=lambda x: x[0])
+    with open(hyp + ".tmp", "w", encoding="utf-8") as f:
+        for _, text in hypos:
+            f.write(text + "\n")
+    os.replace(hyp + ".tmp", hyp)
+
+
+def worker_main(args, worker_id, device, requests, jobs):
+    """Decode the jobs sent on *jobs* with the checkpoint they name, which
+    is kept loaded until a job names another one."""
+    if args.code_root is not None and args.code_root not in sys.path:
+        sys.path.insert(0, args.code_root)
+    logging.basicConfig(
+        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        level=logging.WARNING,
+        stream=sys.stdout,
+    )
+    import torch
+    from fairseq import tasks
+    from fairseq_cli.generate import generate, load_models
+
+    cpu = device == "cpu"
+    if not cpu:
+        torch.cuda.set_device(device)
+    else:
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // max(1, args.cpu_workers)))
+
+    loaded, models = None, None
+    requests.put((worker_id, None, None, None))
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        epoch, lg, split = job
+        start = time.time()
+        error = None
+        try:
+            model = checkpoint_path(args, epoch)
+            gen_args = generation_args(args, model, lg, split, cpu)
+            task = tasks.setup_task(gen_args)
+            if loaded != epoch:
+                loaded, models = None, None
+                models = load_models(gen_args, task)
+                loaded = epoch
+            task.load_dataset(split)
+            fd = decode_dir(args, epoch, split)
+            output = os.path.join(fd, "{}_src-tgt".format(lg))
+            with open(output, "w", encoding="utf-8") as f:
+                generate(gen_args, task, models, f)
+            write_hypotheses(output, hyp_path(args, epoch, lg, split))
+        except Exception:
+            error = traceback.format_exc()
+        requests.put((worker_id, loaded, (job, time.time() - start), error))
+
+
+def next_job(pending, loaded, held):
+    """Pick the next job of a worker holding checkpoint *loaded*: a job of
+    the same checkpoint, else one of the checkpoint with the most pending
+    jobs that no other worker holds, else of any checkpoint."""
+    if loaded in pending:
+        epoch = loaded
+    else:
+        free = [e for e in pending if e not in held]
+        epoch = max(free or pending, key=lambda e: len(pending[e]))
+    lg, split = pending[epoch].pop(0)
+    if len(pending[epoch]) == 0:
+        del pending[epoch]
+    return epoch, lg, split
+
+
+def get_devices(args):
+    import torch
+
+    if torch.cuda.is_available() and args.ngpu > 0 and not getattr(args, "int8", False):
+        return list(range(min(args.ngpu, torch.cuda.device_count())))
+    return ["cpu"] * max(1, args.cpu_workers)
+
+
+def main(args, epochs=None):
+    if args.code_root is not None and args.code_root not in sys.path:
+        sys.path.insert(0, args.code_root)
+    if epochs is None:
+        epochs = range(args.epoch, args.start - 1, -1)
+    pending = get_jobs(args, epochs)
+    num_jobs = sum(len(v) for v in pending.values())
+    for e, v in pending.items():
+        for split in set(split for _, split in v):
+            os.makedirs(decode_dir(args, e, split), exist_ok=True)
+    if num_jobs == 0:
+        logger.info("nothing to decode")
+        return []
+
+    devices = get_devices(args)[:num_jobs]
+    logger.info("decoding {} jobs of {} checkpoints on {}".format(num_jobs, len(pending), devices))
+
+    ctx = mp.get_context("spawn")
+    requests = ctx.Queue()
+    job_queues = [ctx.Queue() for _ in devices]
+    workers = [
+        ctx.Process(target=worker_main, args=(args, i, device, requests, job_queues[i]))
+        for i, device in enumerate(devices)
+    ]
+    for w in workers:
+        w.start()
+
+    held = {}
+    # job of every busy worker, checkpoint of every worker waiting for a job,
+    # and jobs that were running on a worker that died
+    assigned = {}
+    idle = {}
+    retried = set()
+    failed = []
+    active = set(range(len(workers)))
+    while len(active) > 0:
+        try:
+            worker_id, loaded, done, error = requests.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            # a worker that dies outside of a job (import error, CUDA error,
+            # killed for OOM) never reports back
+            for worker_id in sorted(active):
+                if workers[worker_id].is_alive():
+                    continue
+                logger.error("worker {} on {} died with exit code {}".format(
+                    worker_id, devices[worker_id], workers[worker_id].exitcode))
+                active.discard(worker_id)
+                idle.pop(worker_id, None)
+                held.pop(worker_id, None)
+                job = assigned.pop(worker_id, None)
+                if job is None:
+                    continue
+                if job in retried:
+                    logger.error("checkpoint{} {} {} failed: it killed two workers".format(*job))
+                    failed.append(job)
+                else:
+                    retried.add(job)
+                    epoch, lg, split = job
+                    pending.setdefault(epoch, []).insert(0, (lg, split))
+        else:
+            if worker_id not in active:
+                continue
+            assigned.pop(worker_id, None)
+            held.pop(worker_id, None)
+            if done is not None:
+                (epoch, lg, split), elapsed = done
+                if error is not None:
+                    logger.error("checkpoint{} {} {} failed:\n{}".format(epoch, lg, split, error))
+                    failed.append((epoch, lg, split))
+                else:
+                    logger.info("checkpoint{} {} {} decoded in {:.1f}s on {}".format(
+                        epoch, lg, split, elapsed, devices[worker_id]))
+            idle[worker_id] = loaded
+
+        for worker_id in list(idle):
+            if len(pending) == 0:
+                break
+            job = next_job(pending, idle.pop(worker_id), set(held.values()))
+            held[worker_id] = job[0]
+            assigned[worker_id] = job
+            job_queues[worker_id].put(job)
+        # idle workers are kept until no job can be requeued anymore
+        if len(pending) == 0 and len(assigned) == 0:
+            for worker_id in idle:
+                job_queues[worker_id].put(None)
+                active.discard(worker_id)
+            idle.clear()
+
+    if len(pending) > 0:
+        logger.error("all workers died, {} jobs were not decoded".format(
+            sum(len(v) for v in pending.values())))
+        failed.extend((e, lg, split) for e, v in pending.items() for lg, split in v)
+    for w in workers:
+        w.join()
+    logger.info("decoding done!")
+    return failed
+
+
+def cli_main():
+    logging.basicConfig(
+        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        level=logging.INFO,
+        stream=sys.stdout,
+    )
+    args = get_parser().parse_args()
+    failed = main(args)
+    if len(failed) > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli_main()
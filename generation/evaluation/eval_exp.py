@@ -4,42 +4,199 @@
 
 import os
 import sys
+import time
+import signal
 import argparse
 import subprocess
 import numpy as np
 
+from bleu_scorer import hyp_file, load_reference, score_decodes, score_file, write_scores
+
 
 def compute_bleus(args, epochs, split):
-    all_scores = {}
-    lgs = args.lgs.split("-")
-    ref_folder = args.ref_folder
-    for e in epochs:
-        fd = os.path.join(args.save_dir, 
-                          "decodes/{}/checkpoint{}/{}".format(args.exp, e, split)) 
-        scores = {}
-        for lg in lgs:
-            fs = os.path.join(fd, "{}_tgt.{}.hyp".format(lg, split))
-            ref = os.path.join(ref_folder, "{}.tgt.{}".format(lg, split))
-            if os.path.isfile(fs):
-                hp = open(fs, 'r')
-                hps = hp.readlines()
-                hp.close()
-                rf = open(ref, 'r')
-                rfs = rf.readlines()
-                rf.close()
-                if len(hps) == len(rfs):
-                    cmd = "python -m sacrebleu --force -lc -l {}-{} {} < {}".format(lg, lg, ref, fs)
-                    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, shell=True)
-                    result = p.communicate()[0].decode("utf-8")
-                    x = result.split("=")[1].split()[0]
-                    print(fd, lg, split) 
-                    print(x)
-                    scores[lg] = float(x)
-        if len(scores) > 0:
-            all_scores[e] = scores
+    all_scores = score_decodes(args, epochs, split, args.num_workers)
+    for e, scores in all_scores.items():
+        fd = os.path.join(args.save_dir,
+                          "decodes/{}/checkpoint{}/{}".format(args.exp, e, split))
+        for lg, score in scores.items():
+            print(fd, lg, split)
+            print(score)
+    write_scores(all_scores, args.lgs.split("-"),
+                 os.path.join(args.save_dir, "decodes/{}/results/bleu.{}".format(args.exp, split)))
     return all_scores
 
 
+def select_best(args, all_scores):
+    """The epoch whose test decode is used for each language, and a summary
+    of the selection; None if no epoch has all the scores it needs yet."""
+    lgs = args.lgs.split("-")
+
+    if not args.multilingual:
+        LG = args.supervised_lg
+        all_LG = []
+        all_others = []
+        for e in all_scores:
+            ss = all_scores[e]
+            if LG in ss:
+                all_LG.append((e, ss[LG]))
+            bleus = []
+            for lg in lgs:
+                if lg != LG and lg in ss:
+                    bleus.append(ss[lg])
+            if len(bleus) == len(lgs) -1:
+                all_others.append((e, np.mean(bleus)))
+        if len(all_LG) == 0 or len(all_others) == 0:
+            return None, []
+
+        all_LG.sort(key=lambda x: x[1], reverse=True)
+        all_others.sort(key=lambda x: x[1], reverse=True)
+
+        max_LG_ep, max_LG_valid = all_LG[0]
+        max_other_ep, max_other_valid = all_others[0]
+
+        summary = [
+            "largest {} at Epoch {} : {}".format(LG, max_LG_ep, max_LG_valid),
+            "largest others at Epoch {} : avg - {}; {}".format(max_other_ep, max_other_valid, all_scores[max_other_ep]),
+        ]
+        best_test = {lg : max_other_ep for lg in lgs}
+        best_test[LG] = max_LG_ep
+    else:
+        all_lgs = []
+        for e in all_scores:
+            ss = all_scores[e]
+            bleus = []
+            for lg in lgs:
+                if lg in ss:
+                    bleus.append(ss[lg])
+            if len(bleus) == len(lgs):
+                all_lgs.append((e, np.mean(bleus)))
+        if len(all_lgs) == 0:
+            return None, []
+
+        all_lgs.sort(key=lambda x: x[1], reverse=True)
+        max_lgs_ep, max_lgs_valid = all_lgs[0]
+
+        summary = [
+            "largest average validation bleus at Epoch {} : avg - {}; {}".format(max_lgs_ep, max_lgs_valid, all_scores[max_lgs_ep]),
+        ]
+        best_test = {lg :  max_lgs_ep for lg in lgs}
+    return best_test, summary
+
+
+def best_table(args, all_scores):
+    """Best epoch and score of each language and of the average over all
+    languages."""
+    lgs = args.lgs.split("-")
+    rows = []
+    for lg in lgs:
+        scored = [(ss[lg], e) for e, ss in all_scores.items() if lg in ss]
+        if len(scored) > 0:
+            score, e = max(scored)
+            rows.append((lg, e, score))
+    averages = [(np.mean([ss[lg] for lg in lgs]), e) for e, ss in all_scores.items()
+                if all(lg in ss for lg in lgs)]
+    if len(averages) > 0:
+        score, e = max(averages)
+        rows.append(("avg", e, round(score, 2)))
+    return rows
+
+
+def test_decode_cmd(args, epoch):
+    decode_script = os.path.join(args.code_root, "evaluation/decode_all.py")
+    return "python {0} --beam {1} --start {2} --ngpu {3} --epoch {4} --split {5} --exp {6} " \
+           "--data_path {7} --dataset {8} --code_root {9} --task {10} --spe {11} --save_dir {12}".format(decode_script,
+             args.test_beam, epoch, args.ngpu, epoch, args.test_split, args.exp,
+             args.data_path, args.dataset, args.code_root, args.task, args.spe, args.save_dir)
+
+
+def start_test_decode(args, epoch):
+    """Runs the test decode of an epoch in the background, in its own process
+    group so that it can be stopped with the decoders it started."""
+    print("test start for Epoch {}".format(epoch))
+    return subprocess.Popen(test_decode_cmd(args, epoch), shell=True, start_new_session=True)
+
+
+def stop_test_decode(epoch, proc):
+    if proc.poll() is None:
+        print("test stop for Epoch {}: no longer selected".format(epoch))
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait()
+
+
+def watch(args):
+    """Score validation decodes as they are written and keep a test decode
+    running for each epoch of the current selection, stopping the ones of
+    epochs that are no longer selected, until the decodes of all epochs are
+    scored or no new one was scored for args.max_wait seconds. Returns the
+    final selection, None if there is none."""
+    lgs = args.lgs.split("-")
+    epochs = [e+1 for e in range(args.epoch)]
+    references = {}
+    scored = {}
+    all_scores = {}
+    test_decodes = {}
+    best_test = None
+    last_update = time.time()
+    while True:
+        updated = False
+        for e in epochs:
+            for lg in lgs:
+                fs = hyp_file(args, e, lg, args.valid_split)
+                if not os.path.isfile(fs):
+                    continue
+                mtime = os.path.getmtime(fs)
+                if scored.get((e, lg)) == mtime:
+                    continue
+                if lg not in references:
+                    ref = os.path.join(args.ref_folder, "{}.tgt.{}".format(lg, args.valid_split))
+                    references[lg] = load_reference(lg, ref)
+                score = score_file(fs, references[lg])
+                if score is None:
+                    # still being written, unless it has not changed for a while
+                    if time.time() - mtime > args.poll_interval:
+                        print("{} does not match the reference, skipped".format(fs))
+                        scored[(e, lg)] = mtime
+                    continue
+                scored[(e, lg)] = mtime
+                all_scores.setdefault(e, {})[lg] = score
+                updated = True
+                last_update = time.time()
+                print("Epoch {} {} {} : {}".format(e, lg, args.valid_split, score))
+
+        if updated:
+            all_scores = {e: all_scores[e] for e in sorted(all_scores)}
+            write_scores(all_scores, lgs,
+                         os.path.join(args.save_dir, "decodes/{}/results/bleu.{}".format(args.exp, args.valid_split)))
+            print("best epochs: {}".format(
+                "; ".join("{} - Epoch {} : {}".format(*row) for row in best_table(args, all_scores))))
+            best_test, summary = select_best(args, all_scores)
+            if best_test is not None:
+                for line in summary:
+                    print(line)
+                selected = set(best_test.values())
+                for e in sorted(set(test_decodes) - selected):
+                    stop_test_decode(e, test_decodes.pop(e))
+                for e in sorted(selected - set(test_decodes)):
+                    test_decodes[e] = start_test_decode(args, e)
+
+        if len(scored) == len(epochs) * len(lgs):
+            break
+        if args.max_wait is not None and time.time() - last_update > args.max_wait:
+            missing = ["{} {}".format(e, lg) for e in epochs for lg in lgs if (e, lg) not in scored]
+            print("no new validation decode for {} seconds, giving up on: {}".format(args.max_wait, "; ".join(missing)))
+            break
+        time.sleep(args.poll_interval)
+
+    if best_test is None:
+        print("no complete selection: some languages have no validation score")
+        return None
+    for e in sorted(set(best_test.values())):
+        if test_decodes[e].wait() != 0:
+            print("test decode of Epoch {} failed, retrying".format(e))
+            os.system(test_decode_cmd(args, e))
+    return best_test
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Language transfer")
     parser.add_argument("--exp", type=str, required=True,
@@ -79,72 +236,35 @@ if __name__ == "__main__":
                         help="dir to save all checkpoints and decoded results")
     parser.add_argument("--code_root", type=str,
                         help="path to code root")
+    parser.add_argument("--num_workers", type=int, default=None,
+                        help="number of processes scoring BLEU (default: number of CPUs)")
 
-    args = parser.parse_args()
-    all_scores = compute_bleus(args, [e+1 for e in range(args.epoch)], args.valid_split) 
+    parser.add_argument("--watch", action="store_true",
+                        help="score validation decodes as they are written and decode the test set of the best epochs right away")
+    parser.add_argument("--poll_interval", type=float, default=60,
+                        help="seconds between two scans of the decodes in --watch mode")
+    parser.add_argument("--max_wait", type=float, default=None,
+                        help="in --watch mode, stop waiting for the missing validation decodes once none was scored "
+                             "for this many seconds, and select among the scored ones (default: wait for all of them)")
 
-    decode_script = os.path.join(args.code_root, "evaluation/decode_all.py")
+    args = parser.parse_args()
     lgs = args.lgs.split("-")
 
-    if not args.multilingual:
-        LG = args.supervised_lg
-        all_LG = []
-        all_others = []
-        for e in all_scores:
-            ss = all_scores[e]
-            if LG in ss:
-                all_LG.append((e, ss[LG]))
-            bleus = []
-            for lg in lgs:
-                if lg != LG and lg in ss:
-                    bleus.append(ss[lg])
-            if len(bleus) == len(lgs) -1:
-                all_others.append((e, np.mean(bleus)))
-
-        all_LG.sort(key=lambda x: x[1], reverse=True)
-        all_others.sort(key=lambda x: x[1], reverse=True)
-        
-        max_LG_ep, max_LG_valid = all_LG[0]
-        max_other_ep, max_other_valid = all_others[0]
-
-        print("largest {} at Epoch {} : {}".format(LG, max_LG_ep, max_LG_valid))
-        print("largest others at Epoch {} : avg - {}; {}".format(max_other_ep, max_other_valid, all_scores[max_other_ep]))
-
-        print("best others test start") 
-        os.system("python {0} --beam {1} --start {2} --ngpu {3} --epoch {4} --split {5} --exp {6} " \
-                  "--data_path {7} --dataset {8} --code_root {9} --task {10} --spe {11} --save_dir {12}".format(decode_script, 
-                    args.test_beam, max_other_ep, args.ngpu, max_other_ep, args.test_split, args.exp, 
-                    args.data_path, args.dataset, args.code_root, args.task, args.spe, args.save_dir))
-        print("best {} test start".format(LG)) 
-        os.system("python {0} --beam {1} --start {2} --ngpu {3} --epoch {4} --split {5} --exp {6} " \
-                  "--data_path {7} --dataset {8} --code_root {9} --task {10} --spe {11} --save_dir {12}".format(decode_script, 
-                    args.test_beam, max_LG_ep, args.ngpu, max_LG_ep, args.test_split, args.exp, 
-                   args.data_path, args.dataset, args.code_root, args.task, args.spe, args.save_dir))
-        
-        best_test = {lg : max_other_ep for lg in lgs}
-        best_test[LG] = max_LG_ep
+    if args.watch:
+        best_test = watch(args)
+        if best_test is None:
+            sys.exit(1)
     else:
-        all_lgs = []
-        for e in all_scores:
-            ss = all_scores[e]
-            bleus = []
-            for lg in lgs:
-                if lg in ss:
-                    bleus.append(ss[lg])
-            if len(bleus) == len(lgs):
-                all_lgs.append((e, np.mean(bleus)))
-
-        all_lgs.sort(key=lambda x: x[1], reverse=True)
-        max_lgs_ep, max_lgs_valid = all_lgs[0]
-
-        print("largest average validation bleus at Epoch {} : avg - {}; {}".format(max_lgs_ep, max_lgs_valid, all_scores[max_lgs_ep]))
-        print("test start") 
-        os.system("python {0} --beam {1} --start {2} --ngpu {3} --epoch {4} --split {5} --exp {6} " \
-                  "--data_path {7} --dataset {8} --code_root {9} --task {10} --spe {11} --save_dir {12}".format(decode_script, 
-                    args.test_beam, max_lgs_ep, args.ngpu, max_lgs_ep, args.test_split, args.exp, 
-                    args.data_path, args.dataset, args.code_root, args.task, args.spe, args.save_dir))
-
-        best_test = {lg :  max_lgs_ep for lg in lgs}
+        all_scores = compute_bleus(args, [e+1 for e in range(args.epoch)], args.valid_split)
+        best_test, summary = select_best(args, all_scores)
+        if best_test is None:
+            print("no complete selection: some languages have no validation score")
+            sys.exit(1)
+        for line in summary:
+            print(line)
+        for e in sorted(set(best_test.values()), reverse=True):
+            print("test start for Epoch {}".format(e))
+            os.system(test_decode_cmd(args, e))
 
     fd = os.path.join(args.save_dir, "decodes/{}/results".format(args.exp))
     if not os.path.exists(fd):
@@ -48,6 +48,7 @@ from .token_block_dataset import TokenBlockDataset
 from .transform_eos_dataset import TransformEosDataset
 from .transform_eos_lang_pair_dataset import TransformEosLangPairDataset
 from .truncate_dataset import TruncateDataset
+from .word_starts_dataset import WordStartsDataset
 
 from .iterators import (
     CountingIterator,
@@ -107,4 +108,5 @@ __all__ = [
     'TransformEosLangPairDataset',
     'TruncateDataset',
     'TruncatedDictionary',
+    'WordStartsDataset',
 ]
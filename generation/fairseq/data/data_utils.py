@@ -48,7 +48,7 @@ def collate_tokens(values, pad_idx, eos_idx=None, left_pad=False, move_eos_to_be
     return res
 
 
-def load_indexed_dataset(path, dictionary, dataset_impl=None, combine=False, default='cached'):
+def load_indexed_dataset(path, dictionary, dataset_impl=None, combine=False, default='cached', skip_warmup=False):
     """A helper function for loading indexed datasets.
 
     Args:
@@ -61,6 +61,8 @@ def load_indexed_dataset(path, dictionary, dataset_impl=None, combine=False, def
             datasets. For example, if *path* is 'data-bin/train', then we will
             combine 'data-bin/train', 'data-bin/train1', ... and return a
             single ConcatDataset instance.
+        skip_warmup (bool, optional): don't read mmap datasets into the page
+            cache when opening them, pages are then loaded on first access.
     """
     from fairseq.data.concat_dataset import ConcatDataset
     import fairseq.data.indexed_dataset as indexed_dataset
@@ -78,6 +80,7 @@ def load_indexed_dataset(path, dictionary, dataset_impl=None, combine=False, def
             impl=dataset_impl_k or default,
             fix_lua_indexing=True,
             dictionary=dictionary,
+            skip_warmup=skip_warmup,
         )
         if dataset is None:
             break
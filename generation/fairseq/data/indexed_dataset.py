@@ -48,7 +48,7 @@ def make_builder(out_file, impl, vocab_size=None):
         return IndexedDatasetBuilder(out_file)
 
 
-def make_dataset(path, impl, fix_lua_indexing=False, dictionary=None):
+def make_dataset(path, impl, fix_lua_indexing=False, dictionary=None, skip_warmup=False):
     if impl == 'raw' and IndexedRawTextDataset.exists(path):
         assert dictionary is not None
         return IndexedRawTextDataset(path, dictionary)
@@ -57,7 +57,7 @@ def make_dataset(path, impl, fix_lua_indexing=False, dictionary=None):
     elif impl == 'cached' and IndexedDataset.exists(path):
         return IndexedCachedDataset(path, fix_lua_indexing=fix_lua_indexing)
     elif impl == 'mmap' and MMapIndexedDataset.exists(path):
-        return MMapIndexedDataset(path)
+        return MMapIndexedDataset(path, skip_warmup=skip_warmup)
     return None
 
 
@@ -438,26 +438,28 @@ class MMapIndexedDataset(torch.utils.data.Dataset):
         def __len__(self):
             return self._len
 
-    def __init__(self, path):
+    def __init__(self, path, skip_warmup=False):
         super().__init__()
 
         self._path = None
         self._index = None
         self._bin_buffer = None
 
-        self._do_init(path)
+        self._do_init(path, skip_warmup)
 
     def __getstate__(self):
-        return self._path
+        return self._path, self._skip_warmup
 
     def __setstate__(self, state):
-        self._do_init(state)
+        self._do_init(*state)
 
-    def _do_init(self, path):
+    def _do_init(self, path, skip_warmup=False):
         self._path = path
+        self._skip_warmup = skip_warmup
         self._index = self.Index(index_file_path(self._path))
 
-        _warmup_mmap_file(data_file_path(self._path))
+        if not skip_warmup:
+            _warmup_mmap_file(data_file_path(self._path))
         self._bin_buffer_mmap = np.memmap(data_file_path(self._path), mode='r', order='C')
         self._bin_buffer = memoryview(self._bin_buffer_mmap)
 
@@ -318,6 +318,296 @@ class EpochBatchIterator(EpochBatchIterating):
         )
 
 
+class TemperatureSampledEpochBatchIterator(EpochBatchIterating):
+    """A multi-epoch iterator over several datasets (e.g., one per language)
+    that streams batches sampled with fixed dataset probabilities.
+
+    This replaces a :class:`ResamplingDataset` per dataset wrapped in a
+    :class:`SortDataset`, without materializing sampled or sorted indices for
+    the whole epoch. Every step draws a dataset according to
+    *sample_probs*, takes the next *chunk_size* examples of a random
+    permutation of that dataset (at most the whole dataset), sorts them by size and cuts them into
+    batches with :func:`data_utils.batch_by_size`. Batches are drawn at
+    random from a pool that is refilled with new chunks whenever it holds
+    fewer than *pool_chunks* x *chunk_size* examples, so batches of several
+    chunks, and of different datasets, are interleaved. An epoch draws as many
+    examples as the datasets hold in total; empty datasets are never drawn.
+
+    Batches only depend on *seed* and the epoch, so iterators can be
+    serialized with :func:`state_dict` and restored with
+    :func:`load_state_dict`, which replays the batch indices (but doesn't
+    load data) up to the saved position.
+
+    Args:
+        datasets (List[~fairseq.data.FairseqDataset]): datasets to sample
+            from; they are iterated as a :class:`ConcatDataset`
+        sample_probs (List[float]): probability to sample from each dataset
+        max_tokens (int, optional): max number of tokens in each batch
+            (default: None).
+        max_sentences (int, optional): max number of sentences in each
+            batch (default: None).
+        max_positions (optional): max sentence length supported by the
+            model (default: None).
+        ignore_invalid_inputs (bool, optional): don't raise Exception for
+            sentences that are too long (default: False).
+        required_batch_size_multiple (int, optional): require batch size to
+            be a multiple of N (default: 1).
+        seed (int, optional): seed for random number generator for
+            reproducibility (default: 1).
+        num_shards (int, optional): shard the data iterator into N
+            shards (default: 1).
+        shard_id (int, optional): which shard of the data iterator to
+            return (default: 0).
+        num_workers (int, optional): how many subprocesses to use for data
+            loading. 0 means the data will be loaded in the main process
+            (default: 0).
+        epoch (int, optional): the epoch to start the iterator from
+            (default: 1).
+        chunk_size (int, optional): number of examples drawn from a dataset
+            at a time (default: 4096).
+        pool_chunks (int, optional): size of the pool of batches, in
+            chunks of *chunk_size* examples (default: 8).
+    """
+
+    def __init__(
+        self, datasets, sample_probs, max_tokens=None, max_sentences=None,
+        max_positions=None, ignore_invalid_inputs=False, required_batch_size_multiple=1,
+        seed=1, num_shards=1, shard_id=0, num_workers=0, epoch=1,
+        chunk_size=4096, pool_chunks=8,
+    ):
+        from .concat_dataset import ConcatDataset
+
+        assert len(datasets) == len(sample_probs)
+        self.datasets = datasets
+        self.dataset = ConcatDataset(datasets)
+        self.collate_fn = self.dataset.collater
+        self.sample_probs = np.array(sample_probs, dtype=np.float64)
+        self.sample_probs /= self.sample_probs.sum()
+        self.offsets = np.cumsum([0] + [len(d) for d in datasets[:-1]])
+        self.epoch_size = sum(len(d) for d in datasets)
+        self.max_tokens = max_tokens
+        self.max_sentences = max_sentences
+        self.required_batch_size_multiple = required_batch_size_multiple
+        self.seed = seed
+        self.num_shards = num_shards
+        self.shard_id = shard_id
+        self.num_workers = num_workers
+        self.chunk_size = chunk_size
+        self.pool_chunks = pool_chunks
+        # chunks of small datasets are capped to the dataset size, so that a
+        # chunk doesn't repeat examples; they are drawn more often instead
+        self.chunk_sizes = np.minimum(chunk_size, [len(d) for d in datasets])
+        self.chunk_probs = np.where(
+            self.chunk_sizes > 0, self.sample_probs / np.maximum(self.chunk_sizes, 1), 0.
+        )
+        if self.chunk_probs.sum() > 0:
+            self.chunk_probs /= self.chunk_probs.sum()
+
+        # number of tokens of every example, -1 for examples that are too long
+        self.num_tokens = [
+            self._num_tokens(d, max_positions, ignore_invalid_inputs) for d in datasets
+        ]
+
+        self.epoch = max(epoch, 1)  # we use 1-based indexing for epochs
+        self.shuffle = True
+        self._cur_epoch_itr = None
+        self._next_epoch_itr = None
+        self._num_batches = {}
+
+    @staticmethod
+    def _num_tokens(dataset, max_positions, ignore_invalid_inputs):
+        src_sizes = getattr(dataset, 'src_sizes', None)
+        tgt_sizes = getattr(dataset, 'tgt_sizes', None)
+        if src_sizes is None:
+            num_tokens = np.array(dataset.sizes, dtype=np.int64)
+        elif tgt_sizes is None:
+            num_tokens = np.array(src_sizes, dtype=np.int64)
+        else:
+            num_tokens = np.maximum(src_sizes, tgt_sizes).astype(np.int64)
+        if max_positions is not None:
+            indices = np.arange(len(dataset), dtype=np.int64)
+            valid = data_utils.filter_by_size(
+                indices, dataset, max_positions, raise_exception=(not ignore_invalid_inputs),
+            )
+            invalid = np.ones(len(dataset), dtype=bool)
+            invalid[valid] = False
+            num_tokens[invalid] = -1
+        return num_tokens
+
+    def __len__(self):
+        return self._get_num_batches(self.epoch)
+
+    @property
+    def next_epoch_idx(self):
+        """Return the epoch index after *next_epoch_itr* is called."""
+        if self._next_epoch_itr is not None:
+            return self.epoch
+        elif self._cur_epoch_itr is not None and self.end_of_epoch():
+            return self.epoch + 1
+        else:
+            return self.epoch
+
+    def next_epoch_itr(self, shuffle=True, fix_batches_to_gpus=False):
+        """Return a new iterator over the dataset.
+
+        Batches are always sampled at random, *shuffle* and
+        *fix_batches_to_gpus* are ignored.
+        """
+        self.epoch = self.next_epoch_idx
+        if self._next_epoch_itr is not None:
+            self._cur_epoch_itr = self._next_epoch_itr
+            self._next_epoch_itr = None
+        else:
+            self._cur_epoch_itr = self._get_iterator_for_epoch(self.epoch)
+        self.dataset.set_epoch(self.epoch)
+        self.shuffle = shuffle
+        return self._cur_epoch_itr
+
+    def end_of_epoch(self) -> bool:
+        """Returns whether the most recent epoch iterator has been exhausted"""
+        return not self._cur_epoch_itr.has_next()
+
+    @property
+    def iterations_in_epoch(self):
+        """The number of consumed batches in the current epoch."""
+        if self._cur_epoch_itr is not None:
+            return self._cur_epoch_itr.count
+        elif self._next_epoch_itr is not None:
+            return self._next_epoch_itr.count
+        return 0
+
+    def state_dict(self):
+        """Returns a dictionary containing a whole state of the iterator."""
+        return {
+            'epoch': self.epoch,
+            'iterations_in_epoch': self.iterations_in_epoch,
+            'shuffle': self.shuffle,
+        }
+
+    def load_state_dict(self, state_dict):
+        """Copies the state of the iterator from the given *state_dict*."""
+        self.epoch = state_dict['epoch']
+        itr_pos = state_dict.get('iterations_in_epoch', 0)
+        if itr_pos > 0:
+            # fast-forward epoch iterator
+            self._next_epoch_itr = self._get_iterator_for_epoch(self.epoch, offset=itr_pos)
+            if self._next_epoch_itr is None:
+                # we finished the epoch, increment epoch counter
+                self.epoch += 1
+        else:
+            self._next_epoch_itr = None
+
+    def _get_num_batches(self, epoch):
+        """Number of batches of this shard, by replaying the batch indices."""
+        if epoch not in self._num_batches:
+            num_batches = sum(1 for _ in self._sample_batches(epoch))
+            self._num_batches[epoch] = int(math.ceil(num_batches / float(self.num_shards)))
+        return self._num_batches[epoch]
+
+    def _get_iterator_for_epoch(self, epoch, offset=0):
+        num_batches = self._get_num_batches(epoch)
+        if offset > 0 and offset >= num_batches:
+            return None
+
+        if self.num_workers > 0:
+            os.environ['PYTHONWARNINGS'] = 'ignore:semaphore_tracker:UserWarning'
+
+        return CountingIterator(
+            torch.utils.data.DataLoader(
+                self.dataset,
+                collate_fn=self.collate_fn,
+                batch_sampler=_SampledBatches(self, epoch, num_batches, offset),
+                num_workers=self.num_workers,
+            ),
+            start=offset,
+        )
+
+    def _shard_batches(self, epoch, num_batches, offset):
+        batches = itertools.islice(
+            self._sample_batches(epoch), self.shard_id, None, self.num_shards,
+        )
+        batches = itertools.chain(batches, itertools.repeat([]))
+        return itertools.islice(batches, offset, num_batches)
+
+    def _sample_batches(self, epoch):
+        """Yield the batches (lists of indices into :attr:`dataset`) of all
+        shards for *epoch*."""
+        rng = np.random.RandomState([42, self.seed % (2 ** 32), epoch])
+        # position in the current random permutation of every dataset
+        walks = [[len(d), 0, 0] for d in self.datasets]
+        pool = []
+        pool_examples = 0
+        num_sampled = 0
+        while True:
+            while num_sampled < self.epoch_size and pool_examples < self.pool_chunks * self.chunk_size:
+                i = rng.choice(len(self.datasets), p=self.chunk_probs)
+                chunk = self._next_chunk(rng, walks[i], min(self.chunk_sizes[i], self.epoch_size - num_sampled))
+                num_sampled += len(chunk)
+                # drop examples that are too long and sort by size
+                num_tokens = self.num_tokens[i][chunk]
+                valid = num_tokens >= 0
+                order = np.argsort(num_tokens[valid], kind='mergesort')
+                chunk = chunk[valid][order] + self.offsets[i]
+                num_tokens = num_tokens[valid][order]
+                batches = data_utils.batch_by_size(
+                    np.arange(len(chunk), dtype=np.int64),
+                    num_tokens.__getitem__,
+                    max_tokens=self.max_tokens,
+                    max_sentences=self.max_sentences,
+                    required_batch_size_multiple=self.required_batch_size_multiple,
+                )
+                pool.extend(chunk[batch].tolist() for batch in batches)
+                pool_examples += sum(len(batch) for batch in batches)
+            if len(pool) == 0:
+                return
+            j = rng.randint(len(pool))
+            pool[j], pool[-1] = pool[-1], pool[j]
+            batch = pool.pop()
+            pool_examples -= len(batch)
+            yield batch
+
+    @staticmethod
+    def _next_chunk(rng, walk, size):
+        """Next indices, at most *size*, of a pseudo-random permutation of a
+        dataset, which is restarted with new parameters once exhausted. A chunk
+        stops at the end of the permutation, so it never repeats an example.
+        *walk* holds the dataset size, the position in the permutation and its
+        parameters.
+
+        The permutation is the affine map ``i -> (a * i + b) mod n`` with *a*
+        coprime with *n*, so no index array is kept per dataset.
+        """
+        n = walk[0]
+        if walk[1] % n == 0:
+            a = 1
+            while n > 1:
+                a = rng.randint(1, n)
+                if math.gcd(a, n) == 1:
+                    break
+            walk[1], walk[2] = 0, (a, rng.randint(n))
+        a, b = walk[2]
+        length = min(size, n - walk[1])
+        chunk = (a * np.arange(walk[1], walk[1] + length, dtype=np.int64) + b) % n
+        walk[1] += length
+        return chunk
+
+
+class _SampledBatches(object):
+    """Batch sampler of one shard of a :class:`TemperatureSampledEpochBatchIterator`."""
+
+    def __init__(self, epoch_iter, epoch, num_batches, offset):
+        self.epoch_iter = epoch_iter
+        self.epoch = epoch
+        self.num_batches = num_batches
+        self.offset = offset
+
+    def __len__(self):
+        return self.num_batches - self.offset
+
+    def __iter__(self):
+        return self.epoch_iter._shard_batches(self.epoch, self.num_batches, self.offset)
+
+
 class GroupedIterator(object):
     """Wrapper around an iterable that returns groups (chunks) of items.
 
@@ -3,12 +3,20 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import copy
+import hashlib
+import logging
+import os
+
 import numpy as np
 import torch
 
 from fairseq.data import FairseqDataset, plasma_utils
 
 
+logger = logging.getLogger(__name__)
+
+
 class TokenBlockDataset(FairseqDataset):
     """Break a Dataset of tokens into blocks.
 
@@ -30,6 +38,9 @@ class TokenBlockDataset(FairseqDataset):
         document_sep_len (int, optional): document separator size (required for
             'complete_doc' break mode). Typically 1 if the sentences have eos
             and 0 otherwise.
+        cache_path (str, optional): file to cache the block indices in. The
+            indices are loaded from it if it was written for the same sizes,
+            block size and break mode, and written to it otherwise.
     """
     def __init__(
         self,
@@ -41,6 +52,7 @@ class TokenBlockDataset(FairseqDataset):
         break_mode=None,
         include_targets=False,
         document_sep_len=1,
+        cache_path=None,
     ):
         try:
             from fairseq.data.token_block_utils_fast import (
@@ -75,31 +87,81 @@ class TokenBlockDataset(FairseqDataset):
         if break_mode == "eos" and block_size is None:
             block_size = 0
 
-        slice_indices = _get_slice_indices_fast(sizes, break_mode, block_size, document_sep_len)
-        self._sizes = slice_indices[:, 1] - slice_indices[:, 0]
+        # the digest tells apart datasets with the same number and total of tokens
+        digest = hashlib.blake2b(np.ascontiguousarray(sizes).tobytes(), digest_size=8).digest()
+        cache_key = np.array(
+            [len(sizes), sizes.sum(), block_size, document_sep_len]
+            + np.frombuffer(digest, dtype=np.int64).tolist(),
+            dtype=np.int64,
+        )
+        block_indices = None
+        if cache_path is not None:
+            block_indices = self._load_cache(cache_path, cache_key, break_mode)
 
-        # build index mapping block indices to the underlying dataset indices
-        if break_mode == "eos":
-            # much faster version for eos break mode
-            block_to_dataset_index = np.stack(
-                [
-                    np.arange(len(sizes)),  # starting index in dataset
-                    np.zeros(
-                        len(sizes), dtype=np.long
-                    ),  # starting offset within starting index
-                    np.arange(len(sizes)),  # ending index in dataset
-                ],
-                1,
-            )
+        if block_indices is not None:
+            slice_indices, block_to_dataset_index = block_indices
         else:
-            block_to_dataset_index = _get_block_to_dataset_index_fast(
-                sizes,
-                slice_indices,
-            )
+            slice_indices = _get_slice_indices_fast(sizes, break_mode, block_size, document_sep_len)
+
+            # build index mapping block indices to the underlying dataset indices
+            if break_mode == "eos":
+                # much faster version for eos break mode
+                block_to_dataset_index = np.stack(
+                    [
+                        np.arange(len(sizes)),  # starting index in dataset
+                        np.zeros(
+                            len(sizes), dtype=np.long
+                        ),  # starting offset within starting index
+                        np.arange(len(sizes)),  # ending index in dataset
+                    ],
+                    1,
+                )
+            else:
+                block_to_dataset_index = _get_block_to_dataset_index_fast(
+                    sizes,
+                    slice_indices,
+                )
+            if cache_path is not None:
+                self._save_cache(
+                    cache_path, cache_key, break_mode, slice_indices, block_to_dataset_index
+                )
+        self._sizes = slice_indices[:, 1] - slice_indices[:, 0]
+
         self._slice_indices = plasma_utils.PlasmaArray(slice_indices)
         self._sizes = plasma_utils.PlasmaArray(self._sizes)
         self._block_to_dataset_index = plasma_utils.PlasmaArray(block_to_dataset_index)
 
+    @staticmethod
+    def _load_cache(cache_path, cache_key, break_mode):
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            with np.load(cache_path) as cache:
+                if (
+                    np.array_equal(cache['key'], cache_key)
+                    and str(cache['break_mode']) == break_mode
+                ):
+                    return cache['slice_indices'], cache['block_to_dataset_index']
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning('unable to read block index cache {}: {}'.format(cache_path, e))
+        return None
+
+    @staticmethod
+    def _save_cache(cache_path, cache_key, break_mode, slice_indices, block_to_dataset_index):
+        tmp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    key=cache_key,
+                    break_mode=np.array(break_mode),
+                    slice_indices=slice_indices,
+                    block_to_dataset_index=block_to_dataset_index,
+                )
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning('unable to write block index cache {}: {}'.format(cache_path, e))
+
     @property
     def slice_indices(self):
         return self._slice_indices.array
@@ -112,6 +174,15 @@ class TokenBlockDataset(FairseqDataset):
     def block_to_dataset_index(self):
         return self._block_to_dataset_index.array
 
+    def aligned(self, dataset):
+        """Return a TokenBlockDataset with the same blocks over *dataset*,
+        whose items must have the same lengths as the items of the wrapped
+        dataset (e.g., a :class:`WordStartsDataset` sidecar)."""
+        assert len(dataset) == len(self.dataset)
+        blocks = copy.copy(self)
+        blocks.dataset = dataset
+        return blocks
+
     def attr(self, attr: str, index: int):
         start_ds_idx, _, _ = self.block_to_dataset_index[index]
         return self.dataset.attr(attr, start_ds_idx)
@@ -0,0 +1,63 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+"""
+Vocabulary shortlists: the candidate target tokens of a language, used to
+restrict the output projection of the decoder during generation.
+
+Shortlists are saved in the format of dictionaries, one ``<symbol> <count>``
+line per token, so that they stay valid if the dictionary is extended.
+"""
+
+import numpy as np
+import torch
+
+
+def count_tokens(dataset, vocab_size, chunk_size=10000):
+    """Number of occurrences of each token id in a dataset of token tensors."""
+    counts = np.zeros(vocab_size, dtype=np.int64)
+    for start in range(0, len(dataset), chunk_size):
+        end = min(start + chunk_size, len(dataset))
+        chunk = np.concatenate([np.asarray(dataset[i]) for i in range(start, end)])
+        counts += np.bincount(chunk, minlength=vocab_size)
+    return counts
+
+
+def select_shortlist(counts, coverage=1.0, max_size=None, min_count=1):
+    """Ids of the most frequent tokens covering a ``coverage`` fraction of
+    the occurrences, in decreasing order of frequency.
+
+    Args:
+        counts (np.ndarray): number of occurrences of each token id
+        coverage (float, optional): fraction of the occurrences covered by
+            the shortlist (default: 1.0)
+        max_size (int, optional): maximum number of tokens
+        min_count (int, optional): tokens seen fewer times are left out
+            (default: 1)
+    """
+    order = np.argsort(-counts, kind="stable")
+    order = order[counts[order] >= min_count]
+    covered = np.cumsum(counts[order])
+    # smallest prefix of the tokens whose occurrences reach the coverage
+    size = int(np.searchsorted(covered, coverage * counts.sum() - 1e-6)) + 1
+    size = min(size, len(order))
+    if max_size is not None:
+        size = min(size, max_size)
+    return order[:size]
+
+
+def save_shortlist(path, ids, counts, dictionary):
+    with open(path, "w", encoding="utf-8") as f:
+        for idx in ids:
+            f.write("{} {}\n".format(dictionary[idx], counts[idx]))
+
+
+def load_shortlist(path, dictionary):
+    """Sorted ids of the symbols of the shortlist at ``path`` in
+    ``dictionary``, together with its special symbols."""
+    ids = set(range(dictionary.nspecial))
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            symbol = line.rstrip("\n").rsplit(" ", 1)[0]
+            if symbol in dictionary.indices:
+                ids.add(dictionary.indices[symbol])
+    return torch.LongTensor(sorted(ids))
@@ -0,0 +1,148 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import hashlib
+import logging
+import os
+import struct
+
+import numpy as np
+import torch
+
+from . import FairseqDataset
+from .indexed_dataset import data_file_path, index_file_path, MMapIndexedDataset
+
+
+logger = logging.getLogger(__name__)
+
+
+def word_starts_file_path(prefix_path):
+    return prefix_path + '.wst'
+
+
+def _mask_digest(mask_whole_words, num_types):
+    mask = np.asarray(mask_whole_words, dtype=np.uint8)[:num_types]
+    return hashlib.sha1(mask.tobytes()).digest()
+
+
+def make_word_starts(path, mask_whole_words, chunk_size=2 ** 24):
+    """Write the word start sidecar of the :class:`MMapIndexedDataset` at
+    *path*.
+
+    The sidecar holds one byte per token of the ``.bin`` file, the value of
+    *mask_whole_words* (a byte mask over vocab indices) for that token, so
+    that the word starts of a sentence are a slice of the sidecar at the
+    same offsets as its tokens. The header records a digest of the mask
+    entries the corpus uses, to detect sidecars built with another
+    dictionary or BPE.
+    """
+    if torch.is_tensor(mask_whole_words):
+        mask_whole_words = mask_whole_words.numpy()
+    mask = np.asarray(mask_whole_words, dtype=np.uint8)
+
+    index = MMapIndexedDataset.Index(index_file_path(path))
+    tokens = np.memmap(data_file_path(path), dtype=index.dtype, mode='r')
+    num_types = 0
+    for start in range(0, len(tokens), chunk_size):
+        num_types = max(num_types, int(tokens[start:start + chunk_size].max()) + 1)
+    assert num_types <= len(mask), \
+        'token {} is out of range of the word start mask'.format(num_types - 1)
+
+    tmp_path = word_starts_file_path(path) + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(WordStartsDataset._HDR_MAGIC)
+        f.write(struct.pack('<Q', 1))
+        f.write(struct.pack('<Q', len(tokens)))
+        f.write(struct.pack('<Q', num_types))
+        f.write(_mask_digest(mask, num_types))
+        for start in range(0, len(tokens), chunk_size):
+            f.write(mask[tokens[start:start + chunk_size]].tobytes(order='C'))
+    os.replace(tmp_path, word_starts_file_path(path))
+    del tokens
+
+
+class WordStartsDataset(FairseqDataset):
+    """Word start masks of the sentences of a :class:`MMapIndexedDataset`,
+    read from the sidecar written by :func:`make_word_starts`.
+
+    Items are ByteTensors with the same length as the sentences of the
+    dataset at *path*, so they can be wrapped in the same
+    :class:`TokenBlockDataset` / :class:`PrependTokenDataset` /
+    :class:`AppendTokenDataset` pipeline as the tokens.
+    """
+
+    _HDR_MAGIC = b'WSTIDX\x00\x00\x00'
+    _HDR_SIZE = len(_HDR_MAGIC) + 3 * 8 + 20
+
+    def __init__(self, path):
+        super().__init__()
+        self._do_init(path)
+
+    def __getstate__(self):
+        return self._path
+
+    def __setstate__(self, state):
+        self._do_init(state)
+
+    def _do_init(self, path):
+        self._path = path
+        self._index = MMapIndexedDataset.Index(index_file_path(path))
+        self._dtype_size = self._index.dtype().itemsize
+        with open(word_starts_file_path(path), 'rb') as stream:
+            magic_test = stream.read(len(self._HDR_MAGIC))
+            assert self._HDR_MAGIC == magic_test, (
+                'Word start file {} doesn\'t match expected format.'.format(
+                    word_starts_file_path(path)
+                )
+            )
+            version = struct.unpack('<Q', stream.read(8))
+            assert (1,) == version
+            self.num_tokens_total, self.num_types = struct.unpack('<QQ', stream.read(16))
+            self.digest = stream.read(20)
+        self._buffer_mmap = np.memmap(word_starts_file_path(path), mode='r', order='C')
+        self._buffer = memoryview(self._buffer_mmap)
+
+    def __del__(self):
+        self._buffer_mmap._mmap.close()
+        del self._buffer_mmap
+        del self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getitem__(self, i):
+        ptr, size = self._index[i]
+        np_array = np.frombuffer(
+            self._buffer, dtype=np.uint8, count=size,
+            offset=self._HDR_SIZE + ptr // self._dtype_size,
+        )
+        return torch.from_numpy(np_array.copy())
+
+    @property
+    def sizes(self):
+        return self._index.sizes
+
+    @property
+    def supports_prefetch(self):
+        return False
+
+    def matches(self, mask_whole_words):
+        """Whether the sidecar was built with *mask_whole_words* for a
+        ``.bin`` file of the current size."""
+        if torch.is_tensor(mask_whole_words):
+            mask_whole_words = mask_whole_words.numpy()
+        num_tokens_bin = os.path.getsize(data_file_path(self._path)) // self._dtype_size
+        return (
+            self.num_tokens_total == num_tokens_bin
+            and self.num_types <= len(mask_whole_words)
+            and self.digest == _mask_digest(mask_whole_words, self.num_types)
+        )
+
+    @staticmethod
+    def exists(path):
+        return (
+            os.path.exists(word_starts_file_path(path))
+            and MMapIndexedDataset.exists(path)
+        )
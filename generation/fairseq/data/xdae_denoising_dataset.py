@@ -8,6 +8,7 @@ import torch
 import math
 
 from . import data_utils, FairseqDataset
+from .xdae_noising import XDAEBatchNoising, XDAENoising
 
 
 def collate(
@@ -91,6 +92,14 @@ class XDAEDenoisingDataset(FairseqDataset):
           Default: ``True``
         seed: Seed for random number generator for reproducibility.
         args: argparse arguments.
+        batched_noise (bool, optional): return unnoised samples from
+            :func:`__getitem__` and noise whole batches in :func:`collater`
+            instead (only sentence permutation stays per sample).
+            Default: ``False``
+        word_start_dataset (~torch.utils.data.Dataset, optional): dataset
+            aligned with *dataset* giving the word start mask of every sample
+            (see :class:`WordStartsDataset`), used instead of looking up
+            *mask_whole_words* for every token. Default: ``None``
     """
 
     def __init__(
@@ -105,9 +114,12 @@ class XDAEDenoisingDataset(FairseqDataset):
         args,
         eos=None,
         bos=None,
-        no_prepend_bos=False
+        no_prepend_bos=False,
+        batched_noise=False,
+        word_start_dataset=None,
     ):
         self.dataset = dataset
+        self.word_start_dataset = word_start_dataset if mask_whole_words is not None else None
 
         self.sizes = sizes
 
@@ -159,6 +171,9 @@ class XDAEDenoisingDataset(FairseqDataset):
             ps = torch.FloatTensor(ps)
             self.mask_span_distribution = torch.distributions.Categorical(ps)
 
+        self.noising = XDAENoising(self)
+        self.batch_noising = XDAEBatchNoising(self) if batched_noise else None
+
         self.epoch = 0
 
     def set_epoch(self, epoch, **unused):
@@ -168,39 +183,65 @@ class XDAEDenoisingDataset(FairseqDataset):
         with data_utils.numpy_seed(self.seed, self.epoch, index):
             tokens = self.dataset[index]
             assert tokens[-1] == self.eos
-            source, target = tokens, tokens.clone()
-
-            if self.permute_sentence_ratio > 0.0:
-                source = self.permute_sentences(source, self.permute_sentence_ratio)
-
-            if self.mask_ratio > 0:
-                source = self.add_whole_word_mask(source, self.mask_ratio)
-
-            if self.word_shuffle > 0:
-                source = self.add_word_shuffle(source)
-
-            if self.word_dropout > 0:
-                source = self.add_word_dropout(source)
-
-            if self.word_blank > 0:
-                source = self.add_word_blank(source)
-
-            if self.insert_ratio > 0:
-                source = self.add_insertion_noise(source, self.insert_ratio)
-
-            if self.rotate_ratio > 0.0 and np.random.random() < self.rotate_ratio:
-                source = self.add_rolling_noise(source)
+            word_starts = None
+            if self.word_start_dataset is not None and self.mask_ratio > 0:
+                word_starts = self.word_start_dataset[index]
+                assert word_starts.size() == tokens.size()
+            if self.batch_noising is None:
+                source = self.noising(tokens, word_starts)
+            elif self.permute_sentence_ratio > 0.0:
+                source = self.permute_sentences(tokens, self.permute_sentence_ratio)
+                # word starts no longer line up with the permuted tokens
+                word_starts = None
+            else:
+                source = tokens
+            target = tokens
 
         assert (source >= 0).all()
         assert (source[1:-1] >= 1).all()
         assert (source <= len(self.vocab)).all()
         assert self.no_prepend_bos or source[0] == self.vocab.bos()
         assert source[-1] == self.eos
-        return {
+        sample = {
             'id': index,
             'source': source,
             'target': target,
         }
+        if self.batch_noising is not None:
+            # batches may mix languages with and without whole word masking
+            sample['mask_whole_word'] = self.mask_whole_word
+            sample['word_starts'] = word_starts
+        return sample
+
+    def add_noise_by_stage(self, source):
+        """
+        Apply the noise functions one after the other. This is the reference
+        implementation of :class:`XDAENoising`, which is used by
+        :func:`__getitem__` and must give the same result for the same random
+        state. *source* may be modified in place.
+        """
+        if self.permute_sentence_ratio > 0.0:
+            source = self.permute_sentences(source, self.permute_sentence_ratio)
+
+        if self.mask_ratio > 0:
+            source = self.add_whole_word_mask(source, self.mask_ratio)
+
+        if self.word_shuffle > 0:
+            source = self.add_word_shuffle(source)
+
+        if self.word_dropout > 0:
+            source = self.add_word_dropout(source)
+
+        if self.word_blank > 0:
+            source = self.add_word_blank(source)
+
+        if self.insert_ratio > 0:
+            source = self.add_insertion_noise(source, self.insert_ratio)
+
+        if self.rotate_ratio > 0.0 and np.random.random() < self.rotate_ratio:
+            source = self.add_rolling_noise(source)
+
+        return source
 
     def __len__(self):
         return len(self.dataset)
@@ -436,6 +477,17 @@ class XDAEDenoisingDataset(FairseqDataset):
         Returns:
             dict: a mini-batch of data
         """
+        if self.batch_noising is not None and len(samples) > 0:
+            ids = [s['id'] for s in samples]
+            with data_utils.numpy_seed(self.seed, self.epoch, *ids):
+                sources = self.batch_noising(
+                    [s['source'] for s in samples],
+                    [s.get('mask_whole_word', self.mask_whole_word) for s in samples],
+                    [s.get('word_starts') for s in samples],
+                )
+            samples = [
+                dict(s, source=source) for s, source in zip(samples, sources)
+            ]
         return collate(samples, self.vocab.pad(), self.bos_idx, self.vocab)
 
     def num_tokens(self, index):
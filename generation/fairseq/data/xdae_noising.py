@@ -0,0 +1,585 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import math
+
+import numpy as np
+import torch
+
+from . import data_utils
+
+
+class XDAENoising(object):
+    """
+    Fused version of the noise pipeline of :class:`XDAEDenoisingDataset`.
+
+    All noise functions (sentence permutation, whole word / span masking, word
+    shuffle, word dropout, word blank, insertion and rotation) are applied in a
+    single call. Tokens stay in two NumPy scratch buffers that are reused
+    across samples and every stage only uses vectorized index operations.
+
+    Random numbers are drawn from the same generators, in the same order and
+    with the same shapes as the per-stage methods of the dataset, so for a
+    given random state the output is bit-identical to
+    :func:`XDAEDenoisingDataset.add_noise_by_stage`.
+
+    Args:
+        dataset (XDAEDenoisingDataset): dataset providing the noise configuration
+    """
+
+    def __init__(self, dataset):
+        self.mask_idx = dataset.mask_idx
+        self.vocab_size = len(dataset.vocab)
+        self.full_stop_index = dataset.full_stop_index
+        self.permute_sentence_ratio = dataset.permute_sentence_ratio
+        self.mask_ratio = dataset.mask_ratio
+        self.random_ratio = dataset.random_ratio
+        self.insert_ratio = dataset.insert_ratio
+        self.rotate_ratio = dataset.rotate_ratio
+        self.word_shuffle = dataset.word_shuffle
+        self.word_dropout = dataset.word_dropout
+        self.word_blank = dataset.word_blank
+        self.replace_length = dataset.replace_length
+
+        self.word_start_table = None
+        if dataset.mask_whole_word is not None:
+            self.word_start_table = dataset.mask_whole_word.numpy().astype(np.int64)
+
+        self.span_probs = None
+        if dataset.mask_span_distribution is not None:
+            # same call Categorical.sample() makes, without the per-call
+            # argument validation
+            self.span_probs = dataset.mask_span_distribution.probs.reshape(1, -1)
+
+        self._buffers = [np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)]
+        self._current = 0
+
+    def __call__(self, tokens, word_starts=None):
+        """Return a noised copy of *tokens* (a 1d LongTensor) as a LongTensor.
+
+        *word_starts* optionally gives the word start mask of *tokens* (a
+        ByteTensor of the same length, e.g. read from a
+        :class:`WordStartsDataset` sidecar), which is then used instead of a
+        lookup in the word start table.
+        """
+        source = self._swap(tokens.numel())
+        source[:] = tokens.numpy()
+        if word_starts is not None:
+            word_starts = word_starts.numpy()
+
+        if self.permute_sentence_ratio > 0.0:
+            source, word_starts = self.permute_sentences(
+                source, self.permute_sentence_ratio, word_starts,
+            )
+
+        if self.mask_ratio > 0:
+            source = self.whole_word_mask(source, self.mask_ratio, word_starts)
+
+        if self.word_shuffle > 0:
+            source = self.shuffle_words(source)
+
+        if self.word_dropout > 0:
+            source = self.drop_words(source)
+
+        if self.word_blank > 0:
+            source = self.blank_words(source)
+
+        if self.insert_ratio > 0:
+            source = self.insert_noise(source, self.insert_ratio)
+
+        if self.rotate_ratio > 0.0 and np.random.random() < self.rotate_ratio:
+            source = self.rotate(source)
+
+        return torch.from_numpy(source.copy())
+
+    def _swap(self, size):
+        """Return a view of *size* elements of the scratch buffer that does not
+        back the current source, growing it if needed."""
+        self._current = 1 - self._current
+        buffer = self._buffers[self._current]
+        if buffer.shape[0] < size:
+            buffer = np.empty(max(size, 2 * buffer.shape[0]), dtype=np.int64)
+            self._buffers[self._current] = buffer
+        return buffer[:size]
+
+    @staticmethod
+    def _ranges(starts, counts):
+        """Concatenation of ``arange(s, s + c)`` for every (s, c) pair."""
+        total = int(counts.sum())
+        offsets = np.cumsum(counts) - counts
+        return np.repeat(starts - offsets, counts) + np.arange(total)
+
+    def permute_sentences(self, source, p, word_starts=None):
+        """Permute the sentences of *source*; *word_starts*, if given, is
+        permuted the same way. Returns both."""
+        full_stops = source == self.full_stop_index
+        # Pretend it ends with a full stop so last span is a sentence
+        full_stops[-2] = True
+
+        # Tokens that are full stops, where the previous token is not
+        sentence_ends = np.flatnonzero(full_stops[1:] & ~full_stops[:-1]) + 2
+
+        num_sentences = sentence_ends.shape[0]
+        num_to_permute = math.ceil((num_sentences * 2 * p) / 2.0)
+        substitutions = torch.randperm(num_sentences)[:num_to_permute]
+        ordering = torch.arange(0, num_sentences)
+        ordering[substitutions] = substitutions[torch.randperm(num_to_permute)]
+        if num_sentences == 0:
+            return source, word_starts
+        ordering = ordering.numpy()
+
+        # Ignore <bos> at start
+        sentence_starts = np.concatenate(([1], sentence_ends[:-1]))
+        lengths = (sentence_ends - sentence_starts)[ordering]
+        end = int(sentence_ends[-1])
+        permutation = self._ranges(sentence_starts[ordering], lengths)
+
+        result = self._swap(source.shape[0])
+        result[0] = source[0]
+        np.take(source, permutation, out=result[1:end])
+        result[end:] = source[end:]
+        if word_starts is not None:
+            word_starts = np.concatenate(
+                (word_starts[:1], word_starts[permutation], word_starts[end:])
+            )
+        return result, word_starts
+
+    def _span_lengths(self, num_to_mask):
+        return torch.multinomial(self.span_probs, num_to_mask, True).T.reshape(-1).numpy()
+
+    def whole_word_mask(self, source, p, word_starts=None):
+        source_length = source.shape[0]
+        if word_starts is not None:
+            is_word_start = word_starts.astype(np.int64)
+        elif self.word_start_table is not None:
+            is_word_start = self.word_start_table[source]
+        else:
+            is_word_start = np.ones(source_length, dtype=np.int64)
+        is_word_start[0] = 0
+        is_word_start[-1] = 0
+        # XDAEDenoisingDataset computes the budget in float32
+        num_to_mask = int(math.ceil(np.float32(is_word_start.sum()) * np.float32(p)))
+        num_inserts = 0
+        if num_to_mask == 0:
+            return source
+
+        if self.span_probs is not None:
+            lengths = self._span_lengths(num_to_mask)
+
+            # Make sure we have enough to mask
+            cum_length = np.cumsum(lengths)
+            while cum_length[-1] < num_to_mask:
+                lengths = np.concatenate([lengths, self._span_lengths(num_to_mask)])
+                cum_length = np.cumsum(lengths)
+
+            # Trim to masking budget
+            i = int(np.searchsorted(cum_length, num_to_mask, side='left'))
+            lengths[i] = num_to_mask - (0 if i == 0 else cum_length[i - 1])
+            num_to_mask = i + 1
+            lengths = lengths[:num_to_mask]
+
+            # Handle 0-length mask (inserts) separately
+            lengths = lengths[lengths > 0]
+            num_inserts = num_to_mask - lengths.shape[0]
+            num_to_mask -= num_inserts
+            if num_to_mask == 0:
+                return self.insert_noise(source, num_inserts / source_length)
+            budgets = lengths - 1
+        else:
+            budgets = 0
+
+        word_starts = np.flatnonzero(is_word_start)
+        indices = word_starts[torch.randperm(word_starts.shape[0])[:num_to_mask].numpy()]
+        mask_random = torch.FloatTensor(num_to_mask).uniform_().numpy() < np.float32(self.random_ratio)
+
+        to_keep = np.ones(source_length, dtype=bool)
+        if self.replace_length == 0:
+            to_keep[indices] = False
+        else:
+            # keep index, but replace it with [MASK]
+            source[indices] = self.mask_idx
+            source[indices[mask_random]] = self._random_tokens(np.count_nonzero(mask_random))
+
+        # Every span keeps growing one token at a time until it has consumed
+        # its length in word starts; the last token acts as a long length so
+        # spans don't go over the end of doc. With prefix sums of the word
+        # starts, the end of each span is a single search.
+        is_word_start[-1] = 255
+        word_start_counts = np.cumsum(is_word_start)
+        span_ends = np.searchsorted(
+            word_start_counts, word_start_counts[indices] + budgets, side='right',
+        )
+        extensions = span_ends - indices - 1
+        positions = self._ranges(indices + 1, extensions)
+
+        if self.replace_length != -1:
+            # delete token
+            to_keep[positions] = False
+        elif positions.shape[0] > 0:
+            # The reference implementation extends all spans in lock-step and
+            # draws random tokens once per step, so order the writes by step.
+            steps = positions - np.repeat(indices, extensions)
+            order = np.argsort(steps, kind='stable')
+            positions = positions[order]
+            is_random = np.repeat(mask_random, extensions)[order]
+            values = np.full(positions.shape[0], self.mask_idx, dtype=np.int64)
+            values[is_random] = self._random_tokens(np.count_nonzero(is_random))
+            # Overlapping spans: the write from the latest step wins
+            _, last = np.unique(positions[::-1], return_index=True)
+            last = positions.shape[0] - 1 - last
+            source[positions[last]] = values[last]
+
+        result = self._swap(int(np.count_nonzero(to_keep)))
+        np.compress(to_keep, source, out=result)
+
+        if num_inserts > 0:
+            result = self.insert_noise(result, num_inserts / result.shape[0])
+
+        return result
+
+    def _random_tokens(self, num):
+        return torch.randint(1, self.vocab_size, size=(num,)).numpy()
+
+    def shuffle_words(self, source):
+        assert self.word_shuffle > 1
+        length = source.shape[0]
+        noise = np.random.uniform(0, self.word_shuffle, size=(length - 2,))
+        noise[0] = -1  # do not move start sentence symbol
+        permutation = (np.arange(length - 2) + noise).argsort()
+
+        result = self._swap(length)
+        np.take(source, permutation, out=result[:length - 2])
+        result[length - 2:] = source[length - 2:]
+        return result
+
+    def drop_words(self, source):
+        assert 0 < self.word_dropout < 1
+        length = source.shape[0]
+        keep = np.random.rand(length - 2) >= self.word_dropout
+        keep[0] = True  # do not drop the start sentence symbol
+
+        num_kept = int(np.count_nonzero(keep))
+        # we need to have at least one word in the sentence (more than the
+        # start / end sentence symbols)
+        pad_word = num_kept == 1
+        result = self._swap(num_kept + pad_word + 2)
+        np.compress(keep, source[:length - 2], out=result[:num_kept])
+        if pad_word:
+            result[1] = source[np.random.randint(1, length - 2)]
+        result[-2:] = source[-2:]
+        return result
+
+    def blank_words(self, source):
+        assert 0 < self.word_blank < 1
+        length = source.shape[0]
+        blank = np.random.rand(length - 2) < self.word_blank
+        blank[0] = False  # do not blank the start sentence symbol
+        source[:length - 2][blank] = self.mask_idx
+        return source
+
+    def insert_noise(self, source, p):
+        if p == 0.0:
+            return source
+
+        num_tokens = source.shape[0]
+        n = int(math.ceil(num_tokens * p))
+
+        noise_indices = (torch.randperm(num_tokens + n - 2)[:n] + 1).numpy()
+        noise_mask = np.zeros(num_tokens + n, dtype=bool)
+        noise_mask[noise_indices] = True
+
+        result = self._swap(num_tokens + n)
+        num_random = int(math.ceil(n * self.random_ratio))
+        result[noise_indices[num_random:]] = self.mask_idx
+        result[noise_indices[:num_random]] = self._random_tokens(num_random)
+        result[~noise_mask] = source
+        return result
+
+    def rotate(self, source):
+        length = source.shape[0]
+        offset = np.random.randint(1, max(1, length - 1) + 1)
+
+        result = self._swap(length)
+        result[0] = source[0]
+        result[1:length - offset] = source[offset:-1]
+        result[length - offset:-1] = source[1:offset]
+        result[-1] = source[-1]
+        return result
+
+
+class XDAEBatchNoising(object):
+    """
+    Batch-level version of the xDAE noise pipeline.
+
+    Applies whole word / span masking, word shuffle, word dropout, word blank,
+    insertion and rotation to a whole right-padded batch at once: span lengths
+    for every sample come from a single draw of the span distribution and
+    positions are chosen with batched random permutations (argsort of random
+    keys). Sentence permutation has no cheap batched form and is still done
+    per sample by the dataset.
+
+    The noise follows the same distributions as :class:`XDAENoising`, but
+    samples are not bit-identical to the per-sample pipeline. Random numbers
+    come from a :class:`torch.Generator` seeded from the NumPy random state,
+    so batches are reproducible under :func:`data_utils.numpy_seed`.
+
+    Args:
+        dataset (XDAEDenoisingDataset): dataset providing the noise configuration
+    """
+
+    def __init__(self, dataset):
+        self.pad = dataset.vocab.pad()
+        self.mask_idx = dataset.mask_idx
+        self.vocab_size = len(dataset.vocab)
+        self.mask_ratio = dataset.mask_ratio
+        self.random_ratio = dataset.random_ratio
+        self.insert_ratio = dataset.insert_ratio
+        self.rotate_ratio = dataset.rotate_ratio
+        self.word_shuffle = dataset.word_shuffle
+        self.word_dropout = dataset.word_dropout
+        self.word_blank = dataset.word_blank
+        self.replace_length = dataset.replace_length
+
+        self.mask_whole_word = dataset.mask_whole_word
+
+        self.span_probs = None
+        if dataset.mask_span_distribution is not None:
+            self.span_probs = dataset.mask_span_distribution.probs.reshape(1, -1)
+
+    def __call__(self, sources, mask_whole_words=None, word_starts=None):
+        """Noise a list of 1d LongTensors and return the noised list.
+
+        *mask_whole_words* optionally gives the word start mask (or ``None``)
+        of every sample, for batches mixing languages with and without whole
+        word masking. It defaults to the mask of the dataset. *word_starts*
+        optionally gives the precomputed word starts (or ``None``) of every
+        sample, which take precedence over *mask_whole_words*.
+        """
+        generator = torch.Generator()
+        generator.manual_seed(int(np.random.randint(2 ** 31)))
+
+        tokens = data_utils.collate_tokens(sources, self.pad)
+        lengths = torch.LongTensor([s.numel() for s in sources])
+        if mask_whole_words is None:
+            mask_whole_words = [self.mask_whole_word] * len(sources)
+        if word_starts is None:
+            word_starts = [None] * len(sources)
+
+        if self.mask_ratio > 0:
+            tokens, lengths = self.whole_word_mask(
+                tokens, lengths, self.mask_ratio, mask_whole_words, word_starts, generator,
+            )
+
+        if self.word_shuffle > 0:
+            tokens = self.shuffle_words(tokens, lengths, generator)
+
+        if self.word_dropout > 0:
+            tokens, lengths = self.drop_words(tokens, lengths, generator)
+
+        if self.word_blank > 0:
+            tokens = self.blank_words(tokens, lengths, generator)
+
+        if self.insert_ratio > 0:
+            num_inserts = torch.ceil(lengths.double() * self.insert_ratio).long()
+            tokens, lengths = self.insert_noise(tokens, lengths, num_inserts, generator)
+
+        if self.rotate_ratio > 0.0:
+            tokens = self.rotate(tokens, lengths, generator)
+
+        return [t[:n] for t, n in zip(tokens, lengths.tolist())]
+
+    @staticmethod
+    def _positions(lengths, width):
+        return torch.arange(width).unsqueeze(0).expand(lengths.size(0), width)
+
+    @staticmethod
+    def _sample_positions(candidates, counts, generator):
+        """Batched ``torch.randperm``: pick ``counts[i]`` distinct positions
+        uniformly among the *candidates* of every row. Returns the positions
+        and a mask of the valid entries."""
+        keys = torch.rand(candidates.size(), generator=generator)
+        keys.masked_fill_(~candidates, 2.0)
+        width = int(counts.max())
+        _, positions = keys.topk(width, dim=1, largest=False)
+        valid = torch.arange(width).unsqueeze(0) < counts.unsqueeze(1)
+        return positions, valid
+
+    def _compact(self, tokens, keep):
+        """Drop the tokens that are not in *keep* and left-align every row."""
+        lengths = keep.sum(dim=1)
+        result = tokens.new_full((tokens.size(0), int(lengths.max())), self.pad)
+        result[self._positions(lengths, result.size(1)) < lengths.unsqueeze(1)] = tokens[keep]
+        return result, lengths
+
+    def _random_tokens(self, num, generator):
+        return torch.randint(1, self.vocab_size, size=(num,), generator=generator)
+
+    def _word_starts(self, tokens, body, mask_whole_words, word_starts):
+        is_word_start = body.long()
+        precomputed = [i for i, w in enumerate(word_starts) if w is not None]
+        if len(precomputed) > 0:
+            rows = torch.LongTensor(precomputed)
+            starts = data_utils.collate_tokens([word_starts[i] for i in precomputed], 0)
+            is_word_start[rows, :starts.size(1)] *= starts.long()
+        mask_whole_words = [
+            None if w is not None else t for t, w in zip(mask_whole_words, word_starts)
+        ]
+        for table in {id(t): t for t in mask_whole_words if t is not None}.values():
+            rows = torch.LongTensor([
+                i for i, t in enumerate(mask_whole_words) if t is table
+            ])
+            is_word_start[rows] = table[tokens[rows]].long() * is_word_start[rows]
+        return is_word_start
+
+    def whole_word_mask(self, tokens, lengths, p, mask_whole_words, word_starts, generator):
+        bsz, width = tokens.size()
+        positions = self._positions(lengths, width)
+        inside = positions < lengths.unsqueeze(1)
+        body = (positions > 0) & (positions < (lengths - 1).unsqueeze(1))
+        is_word_start = self._word_starts(tokens, body, mask_whole_words, word_starts)
+        num_to_mask = torch.ceil(is_word_start.sum(dim=1).float() * p).long()
+        if num_to_mask.max() == 0:
+            return tokens, lengths
+
+        if self.span_probs is not None:
+            probs = self.span_probs.expand(bsz, -1)
+            budget = num_to_mask.unsqueeze(1)
+            span_lengths = torch.multinomial(probs, int(budget.max()), True, generator=generator)
+            # Make sure we have enough to mask
+            cum_length = span_lengths.cumsum(dim=1)
+            while (cum_length[:, -1:] < budget).any():
+                span_lengths = torch.cat([
+                    span_lengths,
+                    torch.multinomial(probs, int(budget.max()), True, generator=generator),
+                ], dim=1)
+                cum_length = span_lengths.cumsum(dim=1)
+
+            # Trim to masking budget
+            prev_length = cum_length - span_lengths
+            in_budget = prev_length < budget
+            span_lengths = torch.min(span_lengths, budget - prev_length)
+
+            # Handle 0-length mask (inserts) separately
+            is_span = in_budget & (span_lengths > 0)
+            num_inserts = (in_budget & (span_lengths == 0)).sum(dim=1)
+            num_spans = is_span.sum(dim=1)
+            _, order = (~is_span).long().sort(dim=1, stable=True)
+            budgets = span_lengths.gather(1, order) - 1
+        else:
+            num_inserts = None
+            num_spans = num_to_mask
+            budgets = 0
+
+        if num_spans.max() > 0:
+            starts, valid = self._sample_positions(is_word_start.bool(), num_spans, generator)
+            if self.span_probs is not None:
+                budgets = budgets[:, :starts.size(1)]
+            mask_random = (torch.rand(starts.size(), generator=generator) < self.random_ratio) & valid
+
+            # Spans grow until they have consumed their length in word starts;
+            # the last token acts as a long length so spans don't go over the
+            # end of doc.
+            word_start_counts = is_word_start.masked_fill(~body & (positions > 0), 255).cumsum(dim=1)
+            span_ends = torch.searchsorted(
+                word_start_counts, word_start_counts.gather(1, starts) + budgets, right=True,
+            )
+            span_ends = torch.where(valid, span_ends, starts + 1)
+
+            is_start = torch.zeros_like(inside).scatter_(1, starts, valid)
+            is_random_start = torch.zeros_like(inside).scatter_(1, starts, mask_random)
+            extended = self._coverage(starts + 1, span_ends, valid, width)
+            extended_random = self._coverage(starts + 1, span_ends, mask_random, width)
+
+            if self.replace_length == 0:
+                keep = inside & ~is_start & ~extended
+            elif self.replace_length == 1:
+                keep = inside & ~extended
+                is_random = is_random_start
+                tokens = tokens.masked_fill(is_start, self.mask_idx)
+            else:
+                keep = inside
+                is_random = is_random_start | extended_random
+                tokens = tokens.masked_fill(is_start | extended, self.mask_idx)
+            if self.replace_length != 0:
+                tokens[is_random] = self._random_tokens(int(is_random.sum()), generator)
+            if self.replace_length != -1:
+                tokens, lengths = self._compact(tokens, keep)
+
+        if num_inserts is not None and num_inserts.max() > 0:
+            tokens, lengths = self.insert_noise(tokens, lengths, num_inserts, generator)
+        return tokens, lengths
+
+    @staticmethod
+    def _coverage(begin, end, valid, width):
+        """Mask of the positions inside any of the valid ``[begin, end)`` ranges."""
+        diff = torch.zeros(begin.size(0), width + 1, dtype=torch.long)
+        ones = valid.long()
+        diff.scatter_add_(1, begin, ones)
+        diff.scatter_add_(1, end, -ones)
+        return diff.cumsum(dim=1)[:, :width] > 0
+
+    def shuffle_words(self, tokens, lengths, generator):
+        assert self.word_shuffle > 1
+        positions = self._positions(lengths, tokens.size(1))
+        scores = positions + torch.rand(tokens.size(), generator=generator) * self.word_shuffle
+        scores[:, 0] = -1  # do not move start sentence symbol
+        # the last two tokens and the padding stay in place
+        tail = positions >= (lengths - 2).unsqueeze(1)
+        scores = torch.where(tail, positions + float(tokens.size(1) + self.word_shuffle), scores)
+        return tokens.gather(1, scores.argsort(dim=1))
+
+    def drop_words(self, tokens, lengths, generator):
+        assert 0 < self.word_dropout < 1
+        positions = self._positions(lengths, tokens.size(1))
+        droppable = (positions > 0) & (positions < (lengths - 2).unsqueeze(1))
+        drop = droppable & (torch.rand(tokens.size(), generator=generator) < self.word_dropout)
+        keep = (positions < lengths.unsqueeze(1)) & ~drop
+
+        # we need to have at least one word in the sentence (more than the
+        # start / end sentence symbols)
+        empty = ((keep & droppable).sum(dim=1) == 0) & (droppable.sum(dim=1) > 0)
+        if empty.any():
+            num_words = droppable.sum(dim=1)[empty]
+            rescued = 1 + (torch.rand(num_words.size(), generator=generator) * num_words).long()
+            keep[empty.nonzero().squeeze(1), rescued] = True
+        return self._compact(tokens, keep)
+
+    def blank_words(self, tokens, lengths, generator):
+        assert 0 < self.word_blank < 1
+        positions = self._positions(lengths, tokens.size(1))
+        blankable = (positions > 0) & (positions < (lengths - 2).unsqueeze(1))
+        blank = blankable & (torch.rand(tokens.size(), generator=generator) < self.word_blank)
+        return tokens.masked_fill(blank, self.mask_idx)
+
+    def insert_noise(self, tokens, lengths, num_inserts, generator):
+        new_lengths = lengths + num_inserts
+        width = int(new_lengths.max())
+        positions = self._positions(new_lengths, width)
+        slots = (positions > 0) & (positions < (new_lengths - 1).unsqueeze(1))
+        noise_positions, valid = self._sample_positions(slots, num_inserts, generator)
+
+        num_random = torch.ceil(num_inserts.double() * self.random_ratio).long()
+        is_random = valid & (torch.arange(valid.size(1)).unsqueeze(0) < num_random.unsqueeze(1))
+        is_noise = torch.zeros(tokens.size(0), width, dtype=torch.bool).scatter_(1, noise_positions, valid)
+        is_random = torch.zeros_like(is_noise).scatter_(1, noise_positions, is_random)
+
+        result = tokens.new_full((tokens.size(0), width), self.pad)
+        result[is_noise] = self.mask_idx
+        result[is_random] = self._random_tokens(int(is_random.sum()), generator)
+        inside = self._positions(lengths, tokens.size(1)) < lengths.unsqueeze(1)
+        result[(positions < new_lengths.unsqueeze(1)) & ~is_noise] = tokens[inside]
+        return result, new_lengths
+
+    def rotate(self, tokens, lengths, generator):
+        bsz, width = tokens.size()
+        inner = lengths - 2
+        rotated = (torch.rand(bsz, generator=generator) < self.rotate_ratio) & (inner > 0)
+        if not rotated.any():
+            return tokens
+        offset = (torch.rand(bsz, generator=generator) * (lengths - 1)).long()
+        positions = self._positions(lengths, width)
+        body = (positions > 0) & (positions <= inner.unsqueeze(1)) & rotated.unsqueeze(1)
+        source_positions = 1 + (positions - 1 + offset.unsqueeze(1)) % inner.clamp(min=1).unsqueeze(1)
+        return tokens.gather(1, torch.where(body, source_positions, positions))
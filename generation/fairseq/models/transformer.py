@@ -652,6 +652,8 @@ class TransformerDecoder(FairseqIncrementalDecoder):
         self.num_layers = len(self.layers)
 
         self.adaptive_softmax = None
+        # output embedding matrix as a module, see build_output_projection_
+        self.output_projection = None
 
         self.project_out_dim = (
             Linear(embed_dim, self.output_embed_dim, bias=False)
@@ -699,6 +701,7 @@ class TransformerDecoder(FairseqIncrementalDecoder):
         alignment_heads: Optional[int] = None,
         src_lengths: Optional[Any] = None,
         return_all_hiddens: bool = False,
+        vocab_subset: Optional[Tensor] = None,
     ):
         """
         Args:
@@ -710,6 +713,8 @@ class TransformerDecoder(FairseqIncrementalDecoder):
                 :ref:`Incremental decoding`
             features_only (bool, optional): only return features without
                 applying output layer (default: False).
+            vocab_subset (LongTensor, optional): only project onto these
+                entries of the vocabulary, in this order (default: None).
 
         Returns:
             tuple:
@@ -724,7 +729,12 @@ class TransformerDecoder(FairseqIncrementalDecoder):
             alignment_heads=alignment_heads,
         )
         if not features_only:
-            x = self.output_layer(x)
+            if vocab_subset is not None:
+                x = self.output_layer(
+                    x, vocab_subset=vocab_subset, incremental_state=incremental_state
+                )
+            else:
+                x = self.output_layer(x)
         return x, extra
 
     def extract_features(
@@ -848,17 +858,66 @@ class TransformerDecoder(FairseqIncrementalDecoder):
 
         return x, {"attn": [attn], "inner_states": inner_states}
 
-    def output_layer(self, features):
-        """Project features to the vocabulary size."""
+    def output_layer(
+        self,
+        features,
+        vocab_subset: Optional[Tensor] = None,
+        incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]] = None,
+    ):
+        """Project features to the vocabulary size, or to the entries of
+        *vocab_subset*."""
         if self.adaptive_softmax is None:
+            if self.output_projection is not None and vocab_subset is None:
+                return self.output_projection(features)
             # project back to size of vocabulary
             if self.share_input_output_embed:
-                return F.linear(features, self.embed_tokens.weight)
+                weight = self.embed_tokens.weight
             else:
-                return F.linear(features, self.embed_out)
+                weight = self.embed_out
+            if vocab_subset is not None:
+                weight = self._output_weight_subset(
+                    weight, vocab_subset, incremental_state
+                )
+            return F.linear(features, weight)
         else:
+            assert vocab_subset is None, "vocab_subset requires a full softmax"
             return features
 
+    def build_output_projection_(self):
+        """Wrap the output embedding matrix in an ``nn.Linear`` used to
+        project the features, so that module-level transforms such as
+        dynamic quantization also apply to the output projection."""
+        assert self.adaptive_softmax is None
+        if self.share_input_output_embed:
+            weight = self.embed_tokens.weight
+        else:
+            weight = self.embed_out
+        # built small, then given the shared parameter, so that no other
+        # vocabulary-sized matrix is allocated
+        output_projection = nn.Linear(1, 1, bias=False)
+        output_projection.in_features = weight.size(1)
+        output_projection.out_features = weight.size(0)
+        output_projection.weight = weight
+        self.output_projection = output_projection
+
+    def _output_weight_subset(
+        self,
+        weight,
+        vocab_subset: Tensor,
+        incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]],
+    ):
+        # during incremental decoding the rows are only gathered on the first step
+        saved_state = self.get_incremental_state(incremental_state, "output_weight")
+        if saved_state is not None and "weight" in saved_state:
+            subset_weight = saved_state["weight"]
+            assert subset_weight is not None
+            return subset_weight
+        subset_weight = weight.index_select(0, vocab_subset)
+        if incremental_state is not None:
+            state: Dict[str, Optional[Tensor]] = {"weight": subset_weight}
+            self.set_incremental_state(incremental_state, "output_weight", state)
+        return subset_weight
+
     def max_positions(self):
         """Maximum output length supported by the decoder."""
         if self.embed_positions is None:
@@ -60,6 +60,9 @@ class MultiheadAttention(nn.Module):
         self.q_proj = nn.Linear(embed_dim, embed_dim, bias=bias)
 
         self.out_proj = nn.Linear(embed_dim, embed_dim, bias=bias)
+        # query, key and value projections of self-attention in a single
+        # matrix, see fuse_qkv_projections_
+        self.qkv_proj = None
 
         if add_bias_kv:
             self.bias_k = Parameter(torch.Tensor(1, 1, embed_dim))
@@ -82,6 +85,28 @@ class MultiheadAttention(nn.Module):
     def prepare_for_onnx_export_(self):
         self.onnx_trace = True
 
+    def fuse_qkv_projections_(self):
+        """Replace the query, key and value projections of self-attention
+        with a single projection, computed with one matrix product.
+
+        For inference only: the separate projections are removed and
+        :func:`F.multi_head_attention_forward` is no longer used.
+        """
+        assert self.self_attention, "only self-attention projections can be fused"
+        if self.qkv_proj is not None:
+            return
+        projections = [self.q_proj, self.k_proj, self.v_proj]
+        has_bias = self.q_proj.bias is not None
+        qkv_proj = nn.Linear(self.embed_dim, 3 * self.embed_dim, bias=has_bias)
+        qkv_proj.to(self.q_proj.weight)
+        with torch.no_grad():
+            qkv_proj.weight.copy_(torch.cat([p.weight for p in projections]))
+            if has_bias:
+                qkv_proj.bias.copy_(torch.cat([p.bias for p in projections]))
+        self.qkv_proj = qkv_proj
+        self.q_proj = self.k_proj = self.v_proj = None
+        self.enable_torch_version = False
+
     def reset_parameters(self):
         if self.qkv_same_dim:
             # Empirically observed the convergence to be much better with
@@ -185,9 +210,12 @@ class MultiheadAttention(nn.Module):
             saved_state = None
 
         if self.self_attention:
-            q = self.q_proj(query)
-            k = self.k_proj(query)
-            v = self.v_proj(query)
+            if self.qkv_proj is not None:
+                q, k, v = self.qkv_proj(query).chunk(3, dim=-1)
+            else:
+                q = self.q_proj(query)
+                k = self.k_proj(query)
+                v = self.v_proj(query)
         elif self.encoder_decoder_attention:
             # encoder-decoder attention
             q = self.q_proj(query)
@@ -203,7 +231,8 @@ class MultiheadAttention(nn.Module):
             q = self.q_proj(query)
             k = self.k_proj(key)
             v = self.v_proj(value)
-        q *= self.scaling
+        # out of place: with qkv_proj, q is a view of the fused projection
+        q = q * self.scaling
 
         if self.bias_k is not None:
             assert self.bias_v is not None
@@ -240,7 +269,17 @@ class MultiheadAttention(nn.Module):
                 .transpose(0, 1)
             )
 
-        if saved_state is not None:
+        if saved_state is not None and self._can_cache_in_place(
+            saved_state, key_padding_mask
+        ):
+            assert k is not None and v is not None
+            k, v, key_padding_mask = self._append_to_kv_cache(
+                saved_state, k, v, key_padding_mask, bsz
+            )
+            # In this branch incremental_state is never None
+            assert incremental_state is not None
+            incremental_state = self._set_input_buffer(incremental_state, saved_state)
+        elif saved_state is not None:
             # saved states are stored with shape (bsz, num_heads, seq_len, head_dim)
             if "prev_key" in saved_state:
                 _prev_key = saved_state["prev_key"]
@@ -362,6 +401,122 @@ class MultiheadAttention(nn.Module):
 
         return attn, attn_weights
 
+    def _can_cache_in_place(
+        self, saved_state: Dict[str, Optional[Tensor]], key_padding_mask: Optional[Tensor]
+    ) -> bool:
+        if "slot_index" in saved_state:
+            return True
+        # states restored from prev_key (e.g. when tracing), padded first steps
+        # and bias_k keep the concatenating cache
+        return (
+            self.self_attention
+            and not self.onnx_trace
+            and self.bias_k is None
+            and key_padding_mask is None
+            and "prev_key" not in saved_state
+        )
+
+    def _append_to_kv_cache(
+        self,
+        saved_state: Dict[str, Optional[Tensor]],
+        k: Tensor,
+        v: Tensor,
+        key_padding_mask: Optional[Tensor],
+        bsz: int,
+    ) -> Tuple[Tensor, Tensor, Optional[Tensor]]:
+        """Write the keys and values of the new steps in place into
+        preallocated buffers, and return the keys, values and padding mask of
+        every step.
+
+        The buffers are not reordered with the beams: the keys of a step stay in
+        the row of the hypothesis that produced them, and ``slot_index`` holds
+        the row of every step of every current hypothesis.
+        """
+        new_len = k.size(1)
+        prev_len = 0
+        if "slot_index" in saved_state:
+            _key_cache = saved_state["key_cache"]
+            _value_cache = saved_state["value_cache"]
+            _slot_buffer = saved_state["slot_buffer"]
+            _slot_index = saved_state["slot_index"]
+            assert _key_cache is not None and _value_cache is not None
+            assert _slot_buffer is not None and _slot_index is not None
+            key_cache, value_cache = _key_cache, _value_cache
+            slot_buffer = _slot_buffer
+            prev_len = _slot_index.size(1)
+        else:
+            key_cache = k.new_empty([bsz, self.num_heads, 0, self.head_dim])
+            value_cache = v.new_empty([bsz, self.num_heads, 0, self.head_dim])
+            slot_buffer = torch.zeros([bsz, 0], dtype=torch.long, device=k.device)
+        src_len = prev_len + new_len
+
+        if src_len > key_cache.size(2) or bsz > key_cache.size(0):
+            # grow geometrically so that appending stays amortized constant time
+            capacity = max(max(2 * key_cache.size(2), src_len), 16)
+            num_rows = max(key_cache.size(0), bsz)
+            new_key_cache = key_cache.new_empty(
+                [num_rows, self.num_heads, capacity, self.head_dim]
+            )
+            new_value_cache = value_cache.new_empty(
+                [num_rows, self.num_heads, capacity, self.head_dim]
+            )
+            new_slot_buffer = slot_buffer.new_zeros([bsz, capacity])
+            new_key_cache[: key_cache.size(0), :, :prev_len] = key_cache[:, :, :prev_len]
+            new_value_cache[: value_cache.size(0), :, :prev_len] = value_cache[
+                :, :, :prev_len
+            ]
+            new_slot_buffer[:, :prev_len] = slot_buffer[:, :prev_len]
+            key_cache, value_cache = new_key_cache, new_value_cache
+            slot_buffer = new_slot_buffer
+            if "padding_buffer" in saved_state:
+                padding_buffer = saved_state["padding_buffer"]
+                assert padding_buffer is not None
+                new_padding_buffer = padding_buffer.new_zeros([bsz, capacity])
+                new_padding_buffer[:, :prev_len] = padding_buffer[:, :prev_len]
+                saved_state["padding_buffer"] = new_padding_buffer
+
+        key_cache[:bsz, :, prev_len:src_len] = k.view(
+            bsz, self.num_heads, new_len, self.head_dim
+        )
+        value_cache[:bsz, :, prev_len:src_len] = v.view(
+            bsz, self.num_heads, new_len, self.head_dim
+        )
+        slot_buffer[:, prev_len:src_len] = torch.arange(
+            bsz, device=k.device
+        ).unsqueeze(1)
+        slot_index = slot_buffer[:, :src_len]
+        if key_padding_mask is not None and "padding_buffer" not in saved_state:
+            # padding of the hypotheses, only kept once a padded step is seen
+            saved_state["padding_buffer"] = torch.zeros(
+                [bsz, slot_buffer.size(1)], dtype=torch.bool, device=k.device
+            )
+        if "padding_buffer" in saved_state:
+            padding_buffer = saved_state["padding_buffer"]
+            assert padding_buffer is not None
+            if key_padding_mask is not None:
+                padding_buffer[:, prev_len:src_len] = key_padding_mask.to(torch.bool)
+            else:
+                padding_buffer[:, prev_len:src_len] = 0
+            key_padding_mask = padding_buffer[:, :src_len]
+        saved_state["key_cache"] = key_cache
+        saved_state["value_cache"] = value_cache
+        saved_state["slot_buffer"] = slot_buffer
+        saved_state["slot_index"] = slot_index
+
+        # index of the (row, head, step) vector holding each key, in the flattened buffers
+        capacity = key_cache.size(2)
+        heads = torch.arange(self.num_heads, device=k.device).view(1, -1, 1)
+        steps = torch.arange(src_len, device=k.device).view(1, 1, -1)
+        index = (slot_index.unsqueeze(1) * self.num_heads + heads) * capacity + steps
+        index = index.view(-1)
+        k = key_cache.view(-1, self.head_dim).index_select(0, index)
+        v = value_cache.view(-1, self.head_dim).index_select(0, index)
+        return (
+            k.view(bsz * self.num_heads, src_len, self.head_dim),
+            v.view(bsz * self.num_heads, src_len, self.head_dim),
+            key_padding_mask,
+        )
+
     @staticmethod
     def _append_prev_key_padding_mask(
         key_padding_mask: Optional[Tensor],
@@ -412,7 +567,15 @@ class MultiheadAttention(nn.Module):
                 if input_buffer_k is not None:
                     if self.encoder_decoder_attention and input_buffer_k.size(0) == new_order.size(0):
                         break
+                    if k in ["key_cache", "value_cache", "slot_index"]:
+                        # the cached keys stay in place, only their slots follow the beams
+                        continue
                     input_buffer[k] = input_buffer_k.index_select(0, new_order)
+            if "slot_index" in input_buffer:
+                slot_index = input_buffer["slot_index"]
+                slot_buffer = input_buffer["slot_buffer"]
+                assert slot_index is not None and slot_buffer is not None
+                input_buffer["slot_index"] = slot_buffer[:, : slot_index.size(1)]
             incremental_state = self._set_input_buffer(incremental_state, input_buffer)
         return incremental_state
 
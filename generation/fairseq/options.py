@@ -42,6 +42,12 @@ def get_interactive_generation_parser(default_task="translation"):
     return get_generation_parser(interactive=True, default_task=default_task)
 
 
+def get_serving_parser(default_task="translation"):
+    parser = get_generation_parser(default_task=default_task)
+    add_serving_args(parser)
+    return parser
+
+
 def get_eval_lm_parser(default_task="language_modeling"):
     parser = get_parser("Evaluate Language Model", default_task)
     add_dataset_args(parser, gen=True)
@@ -538,6 +544,19 @@ def add_generation_args(parser):
                        help='initialize generation by target prefix of given length')
     group.add_argument('--no-repeat-ngram-size', default=0, type=int, metavar='N',
                        help='ngram blocking such that this size ngram cannot be repeated in the generation')
+    group.add_argument('--vocab-shortlist', default=None, metavar='FILE',
+                       help='only generate the tokens of this shortlist of the target dictionary, '
+                            'built with scripts/build_vocab_shortlist.py')
+    group.add_argument('--shortlist-source-tokens', action='store_true',
+                       help='add the source tokens of each batch to the vocabulary shortlist')
+    group.add_argument('--quantize-int8', action='store_true',
+                       help='run the linear layers of the model with dynamic int8 quantization, on CPU')
+    group.add_argument('--quantize-fuse-layers', action='store_true',
+                       help='with --quantize-int8, fuse the query, key and value projections '
+                            'of self-attention into one matrix product')
+    group.add_argument('--quantized-cache-dir', default=None, metavar='DIR',
+                       help='with --quantize-int8, save the quantized models to this directory '
+                            'and load them from it on later runs')
     group.add_argument('--sampling', action='store_true',
                        help='sample hypotheses instead of using beam search')
     group.add_argument('--sampling-topk', default=-1, type=int, metavar='PS',
@@ -586,6 +605,21 @@ def add_interactive_args(parser):
     # fmt: on
 
 
+def add_serving_args(parser):
+    group = parser.add_argument_group("Serving")
+    # fmt: off
+    group.add_argument('--host', default='localhost', type=str, metavar='HOST',
+                       help='address to listen on')
+    group.add_argument('--port', default=8080, type=int, metavar='N',
+                       help='port to listen on')
+    group.add_argument('--max-latency-ms', default=10., type=float, metavar='MS',
+                       help='maximum time a request waits for others to be batched with, '
+                            'before its batch starts running')
+    group.add_argument('--max-request-size', default=1 << 20, type=int, metavar='N',
+                       help='maximum size of a request body, in bytes')
+    # fmt: on
+
+
 def add_model_args(parser):
     group = parser.add_argument_group("Model configuration")
     # fmt: off
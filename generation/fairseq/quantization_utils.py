@@ -0,0 +1,134 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+"""
+Int8 inference on CPU: dynamic quantization of the ``nn.Linear`` layers of
+a model, including the output projection of its Transformer decoder, and a
+disk cache of the quantized models so that the conversion runs once per
+checkpoint.
+
+Weights are stored as int8 and activations are quantized on the fly for
+each matrix product; embeddings and layer norms stay in fp32.
+"""
+
+import hashlib
+import inspect
+import json
+import logging
+import os
+
+import torch
+import torch.nn as nn
+
+from fairseq import checkpoint_utils
+from fairseq.modules import MultiheadAttention
+
+
+logger = logging.getLogger(__name__)
+
+# bump when the structure of the quantized models changes
+CACHE_VERSION = 1
+
+
+def fuse_layers_(model):
+    """Fuse the query, key and value projections of the self-attention
+    layers of *model*, see :meth:`MultiheadAttention.fuse_qkv_projections_`."""
+    for module in list(model.modules()):
+        if isinstance(module, MultiheadAttention) and module.self_attention:
+            module.fuse_qkv_projections_()
+    return model
+
+
+def quantize_model_(model, fuse_layers=False):
+    """Convert *model* in place for int8 inference on CPU, and return it.
+
+    Args:
+        model (nn.Module): model to convert, on CPU
+        fuse_layers (bool, optional): fuse the self-attention projections
+            before quantizing them (default: False)
+    """
+    model.eval()
+    if fuse_layers:
+        fuse_layers_(model)
+    for module in list(model.modules()):
+        if isinstance(module, MultiheadAttention):
+            # F.multi_head_attention_forward reads the float weights of the
+            # projections directly
+            module.enable_torch_version = False
+        elif hasattr(module, "build_output_projection_") and module.adaptive_softmax is None:
+            module.build_output_projection_()
+    torch.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
+
+
+def quantized_cache_path(cache_dir, filename, fuse_layers=False, arg_overrides=None):
+    """Path of the quantized model of checkpoint *filename* in *cache_dir*.
+
+    The name depends on the checkpoint file, the conversion options and the
+    versions of PyTorch and of the cache, so that stale entries are never
+    loaded.
+    """
+    stat = os.stat(filename)
+    key = json.dumps({
+        "checkpoint": os.path.realpath(filename),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "fuse_layers": fuse_layers,
+        "arg_overrides": arg_overrides,
+        "torch": torch.__version__,
+        "engine": torch.backends.quantized.engine,
+        "version": CACHE_VERSION,
+    }, sort_keys=True, default=str)
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(
+        cache_dir, "{}.int8.{}.pt".format(name, hashlib.sha1(key.encode("utf-8")).hexdigest()[:16])
+    )
+
+
+def _load_cached(path):
+    kwargs = {}
+    if "weights_only" in inspect.signature(torch.load).parameters:
+        # the cache holds whole modules rather than tensors
+        kwargs["weights_only"] = False
+    return torch.load(path, map_location="cpu", **kwargs)
+
+
+def load_quantized_model_ensemble(
+    filenames, arg_overrides=None, task=None, fuse_layers=False, cache_dir=None,
+):
+    """Load an ensemble of models converted with :func:`quantize_model_`.
+
+    Args:
+        filenames (List[str]): checkpoint files to load
+        arg_overrides (Dict[str,Any], optional): override model args that
+            were used during model training
+        task (fairseq.tasks.FairseqTask, optional): task to use for loading
+        fuse_layers (bool, optional): see :func:`quantize_model_`
+        cache_dir (str, optional): directory where the quantized models are
+            saved, and loaded from when they were already converted
+    """
+    ensemble, args = [], None
+    for filename in filenames:
+        cache_path = None
+        if cache_dir is not None:
+            cache_path = quantized_cache_path(cache_dir, filename, fuse_layers, arg_overrides)
+        if cache_path is not None and os.path.exists(cache_path):
+            logger.info("loading the quantized model from {}".format(cache_path))
+            state = _load_cached(cache_path)
+            model, args = state["model"], state["args"]
+        else:
+            models, args = checkpoint_utils.load_model_ensemble(
+                [filename], arg_overrides=arg_overrides, task=task,
+            )
+            model = quantize_model_(models[0], fuse_layers=fuse_layers)
+            if cache_path is not None:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_path = "{}.tmp{}".format(cache_path, os.getpid())
+                try:
+                    torch.save({"args": args, "model": model}, tmp_path)
+                    os.replace(tmp_path, cache_path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                logger.info("saved the quantized model to {}".format(cache_path))
+        ensemble.append(model)
+    return ensemble, args
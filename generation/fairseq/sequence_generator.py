@@ -16,6 +16,8 @@ from torch import Tensor
 
 
 class SequenceGenerator(nn.Module):
+    vocab_shortlist: Optional[Tensor]
+
     def __init__(
         self,
         models,
@@ -33,6 +35,8 @@ class SequenceGenerator(nn.Module):
         no_repeat_ngram_size=0,
         search_strategy=None,
         eos=None,
+        vocab_shortlist=None,
+        shortlist_source_tokens=False,
     ):
         """Generates translations of a given source sentence.
 
@@ -57,6 +61,11 @@ class SequenceGenerator(nn.Module):
                 sharper samples (default: 1.0)
             match_source_len (bool, optional): outputs should match the source
                 length (default: False)
+            vocab_shortlist (LongTensor, optional): ids of the only tokens
+                that can be generated, the output projection of the decoder
+                is restricted to them (see :mod:`fairseq.data.vocab_shortlist`)
+            shortlist_source_tokens (bool, optional): add the tokens of the
+                source sentences of each batch to the shortlist (default: False)
         """
         super().__init__()
         if isinstance(models, EnsembleModel):
@@ -81,6 +90,15 @@ class SequenceGenerator(nn.Module):
         self.temperature = temperature
         self.match_source_len = match_source_len
         self.no_repeat_ngram_size = no_repeat_ngram_size
+        self.vocab_shortlist = vocab_shortlist
+        self.shortlist_source_tokens = shortlist_source_tokens
+        # the (n-1)-gram prefixes are packed into int64 keys of up to ngram_key_chunk_len tokens each
+        self.ngram_key_chunk_len = 1
+        while self.vocab_size ** (self.ngram_key_chunk_len + 1) <= 2 ** 63:
+            self.ngram_key_chunk_len += 1
+        self.ngram_key_chunks = max(
+            1, math.ceil((no_repeat_ngram_size - 1) / self.ngram_key_chunk_len)
+        )
         assert temperature > 0, "--temperature must be greater than 0"
 
         self.search = (
@@ -218,6 +236,15 @@ class SequenceGenerator(nn.Module):
         )  # +2 for eos and pad
         tokens[:, 0] = self.eos if bos_token is None else bos_token
         attn: Optional[Tensor] = None
+        vocab_subset: Optional[Tensor] = None
+        if self.vocab_shortlist is not None:
+            vocab_subset = self._vocab_subset(src_tokens, prefix_tokens)
+        # key of the prefix of each n-gram of tokens, indexed by the n-gram start
+        ngram_keys: Optional[Tensor] = None
+        if self.no_repeat_ngram_size > 0:
+            ngram_keys = torch.zeros(
+                bsz * beam_size, max_len + 2, self.ngram_key_chunks
+            ).to(tokens)
 
         # The blacklist indicates candidates that should be ignored.
         # For example, suppose we're sampling and have already finalized 2/5
@@ -265,8 +292,13 @@ class SequenceGenerator(nn.Module):
                 )
 
             lprobs, avg_attn_scores = self.model.forward_decoder(
-                tokens[:, : step + 1], encoder_outs, self.temperature
+                tokens[:, : step + 1], encoder_outs, self.temperature, vocab_subset
             )
+            if vocab_subset is not None:
+                # map the log-probabilities of the shortlist back to the vocabulary
+                lprobs = torch.full(
+                    (lprobs.size(0), self.vocab_size), -math.inf
+                ).to(lprobs).index_copy_(1, vocab_subset, lprobs)
             lprobs[lprobs != lprobs] = torch.tensor(-math.inf).to(lprobs)
 
             lprobs[:, self.pad] = -math.inf  # never select pad
@@ -283,8 +315,8 @@ class SequenceGenerator(nn.Module):
                 and step < prefix_tokens.size(1)
                 and step < max_len
             ):
-                lprobs, tokens, scores = self._prefix_tokens(
-                    step, lprobs, scores, tokens, prefix_tokens, beam_size
+                lprobs, tokens, scores, ngram_keys = self._prefix_tokens(
+                    step, lprobs, scores, tokens, ngram_keys, prefix_tokens, beam_size
                 )
             elif step < self.min_len:
                 # minimum length constraint (does not apply if using prefix_tokens)
@@ -308,8 +340,8 @@ class SequenceGenerator(nn.Module):
 
             self.search.set_src_lengths(src_lengths)
 
-            if self.no_repeat_ngram_size > 0:
-                lprobs = self._no_repeat_ngram(tokens, lprobs, bsz, beam_size, step)
+            if ngram_keys is not None:
+                lprobs = self._no_repeat_ngram(tokens, lprobs, ngram_keys, step)
 
             cand_scores, cand_indices, cand_beams = self.search.step(
                 step,
@@ -384,6 +416,10 @@ class SequenceGenerator(nn.Module):
                     attn = attn.view(bsz, -1)[batch_idxs].view(
                         new_bsz * beam_size, attn.size(1), -1
                     )
+                if ngram_keys is not None:
+                    ngram_keys = ngram_keys.view(bsz, -1)[batch_idxs].view(
+                        new_bsz * beam_size, ngram_keys.size(1), -1
+                    )
                 bsz = new_bsz
             else:
                 batch_idxs = None
@@ -430,6 +466,11 @@ class SequenceGenerator(nn.Module):
                 cand_scores, dim=1, index=active_hypos
             )
 
+            if ngram_keys is not None:
+                ngram_keys[:, : step + 1] = torch.index_select(
+                    ngram_keys[:, : step + 1], dim=0, index=active_bbsz_idx
+                )
+
             # copy attention for active hypotheses
             if attn is not None:
                 attn[:, :, : step + 2] = torch.index_select(
@@ -453,8 +494,30 @@ class SequenceGenerator(nn.Module):
 
         return finalized
 
+    def _vocab_subset(self, src_tokens, prefix_tokens: Optional[Tensor]):
+        """Sorted ids of the tokens that can be generated for a batch."""
+        # TorchScript only refines the type of local variables
+        vocab_shortlist = self.vocab_shortlist
+        assert vocab_shortlist is not None
+        candidates = [
+            vocab_shortlist.to(src_tokens),
+            torch.tensor([self.eos, self.unk]).to(src_tokens),
+        ]
+        if self.shortlist_source_tokens:
+            candidates.append(src_tokens.view(-1))
+        if prefix_tokens is not None:
+            candidates.append(prefix_tokens.view(-1))
+        return torch.unique(torch.cat(candidates))
+
     def _prefix_tokens(
-        self, step: int, lprobs, scores, tokens, prefix_tokens, beam_size: int
+        self,
+        step: int,
+        lprobs,
+        scores,
+        tokens,
+        ngram_keys: Optional[Tensor],
+        prefix_tokens,
+        beam_size: int,
     ):
         """Handle prefix tokens"""
         prefix_toks = prefix_tokens[:, step].unsqueeze(-1).repeat(1, beam_size).view(-1)
@@ -480,7 +543,13 @@ class SequenceGenerator(nn.Module):
             tokens = self.replicate_first_beam(tokens, eos_mask_batch_dim, beam_size)
             scores = self.replicate_first_beam(scores, eos_mask_batch_dim, beam_size)
             lprobs = self.replicate_first_beam(lprobs, eos_mask_batch_dim, beam_size)
-        return lprobs, tokens, scores
+            if ngram_keys is not None:
+                ngram_keys = self.replicate_first_beam(
+                    ngram_keys.view(ngram_keys.size(0), -1),
+                    eos_mask_batch_dim,
+                    beam_size,
+                ).view(ngram_keys.size())
+        return lprobs, tokens, scores, ngram_keys
 
     def replicate_first_beam(self, tensor, mask, beam_size: int):
         tensor = tensor.view(-1, beam_size, tensor.size(-1))
@@ -600,60 +669,35 @@ class SequenceGenerator(nn.Module):
             return True
         return False
 
-    def calculate_banned_tokens(
-        self,
-        tokens,
-        step: int,
-        gen_ngrams: List[Dict[str, List[int]]],
-        no_repeat_ngram_size: int,
-        bbsz_idx: int,
-    ):
-        tokens_list: List[int] = tokens[
-            bbsz_idx, step + 2 - no_repeat_ngram_size : step + 1
-        ].tolist()
-        # before decoding the next token, prevent decoding of ngrams that have already appeared
-        ngram_index = ",".join([str(x) for x in tokens_list])
-        return gen_ngrams[bbsz_idx].get(ngram_index, torch.jit.annotate(List[int], []))
-
-    def transpose_list(self, l: List[List[int]]):
-        # GeneratorExp aren't supported in TS so ignoring the lint
-        min_len = min([len(x) for x in l])  # noqa
-        l2 = [[row[i] for row in l] for i in range(min_len)]
-        return l2
-
-    def _no_repeat_ngram(self, tokens, lprobs, bsz: int, beam_size: int, step: int):
-        # for each beam and batch sentence, generate a list of previous ngrams
-        gen_ngrams: List[Dict[str, List[int]]] = [
-            torch.jit.annotate(Dict[str, List[int]], {})
-            for bbsz_idx in range(bsz * beam_size)
-        ]
-        cpu_tokens = tokens.cpu()
-        for bbsz_idx in range(bsz * beam_size):
-            gen_tokens: List[int] = cpu_tokens[bbsz_idx].tolist()
-            for ngram in self.transpose_list(
-                [gen_tokens[i:] for i in range(self.no_repeat_ngram_size)]
-            ):
-                key = ",".join([str(x) for x in ngram[:-1]])
-                gen_ngrams[bbsz_idx][key] = gen_ngrams[bbsz_idx].get(
-                    key, torch.jit.annotate(List[int], [])
-                ) + [ngram[-1]]
-
-        if step + 2 - self.no_repeat_ngram_size >= 0:
-            # no banned tokens if we haven't generated no_repeat_ngram_size tokens yet
-            banned_tokens = [
-                self.calculate_banned_tokens(
-                    tokens, step, gen_ngrams, self.no_repeat_ngram_size, bbsz_idx
-                )
-                for bbsz_idx in range(bsz * beam_size)
-            ]
-        else:
-            banned_tokens = [
-                torch.jit.annotate(List[int], []) for bbsz_idx in range(bsz * beam_size)
-            ]
-        for bbsz_idx in range(bsz * beam_size):
-            lprobs[bbsz_idx][
-                torch.tensor(banned_tokens[bbsz_idx]).long()
-            ] = torch.tensor(-math.inf, dtype=torch.float)
+    def _ngram_prefix_keys(self, window):
+        """Packs each row of ``window``, the (n-1)-gram prefixes, into exact int64 keys."""
+        keys = torch.zeros(window.size(0), self.ngram_key_chunks).to(window)
+        for i in range(window.size(1)):
+            chunk = i // self.ngram_key_chunk_len
+            keys[:, chunk] = keys[:, chunk] * self.vocab_size + window[:, i]
+        return keys
+
+    def _no_repeat_ngram(self, tokens, lprobs, ngram_keys, step: int):
+        """
+        Bans the tokens that would repeat an n-gram of the hypothesis. ``ngram_keys`` holds the key of the
+        prefix of every n-gram of ``tokens``; it is reordered with the beams, and only the n-gram completed by
+        the last token is added here.
+        """
+        # no banned tokens if we haven't generated no_repeat_ngram_size tokens yet
+        num_ngrams = step + 2 - self.no_repeat_ngram_size
+        if num_ngrams <= 0:
+            return lprobs
+        start = num_ngrams - 1
+        ngram_keys[:, start] = self._ngram_prefix_keys(
+            tokens[:, start : start + self.no_repeat_ngram_size - 1]
+        )
+        prefix = self._ngram_prefix_keys(tokens[:, num_ngrams : step + 1])
+        matches = ngram_keys[:, :num_ngrams].eq(prefix.unsqueeze(1)).all(dim=-1)
+        # tokens following a matching prefix are banned, the others point at pad, which is already -inf
+        banned = tokens[:, self.no_repeat_ngram_size - 1 : step + 1].masked_fill(
+            ~matches, self.pad
+        )
+        lprobs.scatter_(1, banned, -math.inf)
         return lprobs
 
 
@@ -717,7 +761,11 @@ class EnsembleModel(nn.Module):
 
     @torch.jit.export
     def forward_decoder(
-        self, tokens, encoder_outs: List[EncoderOut], temperature: float = 1.0
+        self,
+        tokens,
+        encoder_outs: List[EncoderOut],
+        temperature: float = 1.0,
+        vocab_subset: Optional[Tensor] = None,
     ):
         log_probs = []
         avg_attn: Optional[Tensor] = None
@@ -726,7 +774,17 @@ class EnsembleModel(nn.Module):
             if self.has_encoder():
                 encoder_out = encoder_outs[i]
             # decode each model
-            if self.has_incremental_states():
+            if vocab_subset is not None:
+                # the decoder only projects onto the shortlist, whose log-probabilities are returned
+                decoder_out = model.decoder.forward(
+                    tokens,
+                    encoder_out=encoder_out,
+                    incremental_state=self.incremental_states[i]
+                    if self.has_incremental_states()
+                    else None,
+                    vocab_subset=vocab_subset,
+                )
+            elif self.has_incremental_states():
                 decoder_out = model.decoder.forward(
                     tokens,
                     encoder_out=encoder_out,
@@ -0,0 +1,463 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+"""
+Serving of generation models to concurrent callers over HTTP.
+
+Requests are queued by a :class:`DynamicBatcher`, which groups the ones of
+similar source length into batches, within a maximum waiting time, and runs
+:class:`GenerationBackend` once per batch in a worker thread while the event
+loop keeps accepting requests. :class:`GenerationServer` is a minimal
+HTTP/1.1 JSON front end on top of it, with the routes:
+
+- ``POST /generate``: ``{"source": "..."}`` or ``{"sources": ["...", ...]}``,
+  answers ``{"hypotheses": [...]}`` or ``{"hypotheses": [[...], ...]}``, the
+  n-best ``{"text": ..., "score": ...}`` of each source
+- ``GET /metrics``: the :meth:`ServingMetrics.summary` of the server
+- ``GET /health``
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import copy
+import json
+import logging
+import time
+
+import numpy as np
+import torch
+
+from fairseq import utils
+
+
+logger = logging.getLogger(__name__)
+
+
+class ServingMetrics(object):
+    """Latencies, batch sizes and queue depth of the last ``window``
+    requests and batches."""
+
+    def __init__(self, window=10000):
+        self.latencies = collections.deque(maxlen=window)
+        self.batch_sizes = collections.deque(maxlen=window)
+        self.batch_times = collections.deque(maxlen=window)
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.num_requests = 0
+        self.num_batches = 0
+        self.num_errors = 0
+        self.start_time = time.monotonic()
+
+    def set_queue_depth(self, depth):
+        self.queue_depth = depth
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def record_request(self, latency):
+        self.latencies.append(latency)
+        self.num_requests += 1
+
+    def record_batch(self, size, duration):
+        self.batch_sizes.append(size)
+        self.batch_times.append(duration)
+        self.num_batches += 1
+
+    @staticmethod
+    def _distribution(values, scale=1.0):
+        if len(values) == 0:
+            return None
+        values = np.asarray(values, dtype=np.float64) * scale
+        p50, p90, p99 = np.percentile(values, [50, 90, 99])
+        return {
+            'mean': round(float(values.mean()), 3),
+            'p50': round(float(p50), 3),
+            'p90': round(float(p90), 3),
+            'p99': round(float(p99), 3),
+            'max': round(float(values.max()), 3),
+        }
+
+    def summary(self):
+        """JSON-serializable summary, with the times in milliseconds."""
+        uptime = time.monotonic() - self.start_time
+        return {
+            'uptime_s': round(uptime, 3),
+            'requests': self.num_requests,
+            'batches': self.num_batches,
+            'errors': self.num_errors,
+            'requests_per_s': round(self.num_requests / max(uptime, 1e-9), 3),
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'latency_ms': self._distribution(self.latencies, 1000.0),
+            'batch_size': self._distribution(self.batch_sizes),
+            'batch_time_ms': self._distribution(self.batch_times, 1000.0),
+        }
+
+
+class _Request(object):
+    __slots__ = ('item', 'length', 'arrival', 'future')
+
+    def __init__(self, item, length, arrival, future):
+        self.item = item
+        self.length = length
+        self.arrival = arrival
+        self.future = future
+
+
+class DynamicBatcher(object):
+    """Queues items and runs them in batches.
+
+    A batch is formed when the oldest queued item has waited ``max_latency``
+    seconds, or as soon as the queue could fill a whole batch. It takes the
+    oldest item and the queued items closest to it in length, as long as the
+    batch stays within ``max_sentences`` items and ``max_tokens`` padded
+    tokens. Batches run one at a time in a worker thread, so that requests
+    keep being queued while the model is busy.
+
+    Args:
+        run_batch (callable): maps a list of items to the list of their
+            results
+        max_sentences (int, optional): maximum number of items in a batch
+            (default: 32)
+        max_tokens (int, optional): maximum number of padded tokens in a
+            batch, i.e. the number of items times the largest length
+        max_latency (float, optional): maximum time the oldest item waits
+            for other items to batch with, in seconds (default: 0.01)
+        length_fn (callable, optional): length of an item (default: ``len``)
+        metrics (ServingMetrics, optional): where to record the latencies
+            and batch sizes
+    """
+
+    def __init__(
+        self, run_batch, max_sentences=32, max_tokens=None, max_latency=0.01,
+        length_fn=len, metrics=None,
+    ):
+        assert max_sentences is not None or max_tokens is not None, \
+            'one of max_sentences or max_tokens must be set'
+        self.run_batch = run_batch
+        self.max_sentences = max_sentences
+        self.max_tokens = max_tokens
+        self.max_latency = max_latency
+        self.length_fn = length_fn
+        self.metrics = metrics if metrics is not None else ServingMetrics()
+        self._pending = []
+        self._pending_tokens = 0
+        self._wakeup = None
+        self._task = None
+        self._executor = None
+
+    def start(self):
+        """Starts forming batches, in the running event loop."""
+        assert self._task is None, 'the batcher is already started'
+        self._wakeup = asyncio.Event()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._task = asyncio.get_event_loop().create_task(self._schedule())
+
+    async def close(self):
+        """Stops forming batches and fails the requests still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for request in self._pending:
+            if not request.future.done():
+                request.future.set_exception(RuntimeError('the batcher was closed'))
+        self._pending = []
+        self._pending_tokens = 0
+        self.metrics.set_queue_depth(0)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def submit(self, item):
+        """Queues ``item`` and returns its result once its batch has run."""
+        assert self._task is not None, 'the batcher is not started'
+        loop = asyncio.get_event_loop()
+        request = _Request(item, self.length_fn(item), loop.time(), loop.create_future())
+        self._pending.append(request)
+        self._pending_tokens += request.length
+        self.metrics.set_queue_depth(len(self._pending))
+        self._wakeup.set()
+        return await request.future
+
+    def _is_full(self):
+        if self.max_sentences is not None and len(self._pending) >= self.max_sentences:
+            return True
+        return self.max_tokens is not None and self._pending_tokens >= self.max_tokens
+
+    def _next_batch(self):
+        # requests abandoned by their caller are not run
+        self._pending = [r for r in self._pending if not r.future.done()]
+        if len(self._pending) == 0:
+            return []
+        oldest = self._pending[0]
+        order = sorted(
+            range(len(self._pending)),
+            key=lambda i: (abs(self._pending[i].length - oldest.length), i),
+        )
+        selected = []
+        max_length = 0
+        for i in order:
+            if self.max_sentences is not None and len(selected) >= self.max_sentences:
+                break
+            length = max(max_length, self._pending[i].length)
+            if (
+                len(selected) > 0 and self.max_tokens is not None
+                and length * (len(selected) + 1) > self.max_tokens
+            ):
+                continue
+            selected.append(i)
+            max_length = length
+        taken = set(selected)
+        batch = [self._pending[i] for i in selected]
+        self._pending = [r for i, r in enumerate(self._pending) if i not in taken]
+        self._pending_tokens = sum(r.length for r in self._pending)
+        self.metrics.set_queue_depth(len(self._pending))
+        return batch
+
+    async def _schedule(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            if len(self._pending) == 0:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            timeout = self._pending[0].arrival + self.max_latency - loop.time()
+            if timeout > 0 and not self._is_full():
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            batch = self._next_batch()
+            if len(batch) > 0:
+                await self._run(batch)
+
+    async def _run(self, batch):
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        try:
+            results = await loop.run_in_executor(
+                self._executor, self.run_batch, [r.item for r in batch]
+            )
+        except asyncio.CancelledError:
+            for request in batch:
+                request.future.cancel()
+            raise
+        except Exception as e:
+            logger.exception('failed to run a batch of {} requests'.format(len(batch)))
+            self.metrics.num_errors += len(batch)
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+        end = loop.time()
+        self.metrics.record_batch(len(batch), end - start)
+        for request, result in zip(batch, results):
+            if not request.future.done():
+                request.future.set_result(result)
+            self.metrics.record_request(end - request.arrival)
+
+
+class GenerationBackend(object):
+    """Runs the generator of a :class:`~fairseq.hub_utils.GeneratorHubInterface`
+    on batches of encoded sources, built once for all the batches.
+
+    Args:
+        hub (GeneratorHubInterface): models, task and tokenization to use
+        beam (int, optional): beam size (default: 5)
+        nbest (int, optional): number of hypotheses returned for each source
+            (default: 1)
+        kwargs: other generation arguments, which override the ones of
+            ``hub.args``
+    """
+
+    def __init__(self, hub, beam=5, nbest=1, **kwargs):
+        self.hub = hub
+        self.nbest = nbest
+        gen_args = copy.copy(hub.args)
+        gen_args.beam = beam
+        for k, v in kwargs.items():
+            setattr(gen_args, k, v)
+        self.generator = hub.task.build_generator(hub.models, gen_args)
+        self.max_source_positions = hub.max_positions
+        if isinstance(self.max_source_positions, tuple):
+            self.max_source_positions = self.max_source_positions[0]
+
+    def encode(self, sentence):
+        """Source tokens of ``sentence``, or ``ValueError`` if it is too long
+        for the models."""
+        tokens = self.hub.encode(sentence)
+        if self.max_source_positions is not None and tokens.numel() > self.max_source_positions:
+            raise ValueError('the source has {} tokens, more than the {} supported by the model'.format(
+                tokens.numel(), self.max_source_positions))
+        return tokens
+
+    def decode(self, tokens):
+        # generators of the multilingual tasks end the hypotheses with
+        # a language symbol rather than with the eos of the dictionary
+        sentence = self.hub.tgt_dict.string(
+            tokens, extra_symbols_to_ignore=[getattr(self.generator, 'eos', self.hub.tgt_dict.eos())],
+        )
+        sentence = self.hub.remove_bpe(sentence)
+        return self.hub.detokenize(sentence)
+
+    def __call__(self, batch_tokens):
+        """n-best ``{"text", "score"}`` hypotheses of each of the encoded
+        sources of ``batch_tokens``."""
+        lengths = torch.LongTensor([t.numel() for t in batch_tokens])
+        dataset = self.hub.task.build_dataset_for_inference(batch_tokens, lengths)
+        sample = dataset.collater([dataset[i] for i in range(len(dataset))])
+        sample = utils.apply_to_sample(lambda t: t.to(self.hub.device), sample)
+        with torch.no_grad():
+            translations = self.hub.task.inference_step(self.generator, self.hub.models, sample)
+        results = [None] * len(batch_tokens)
+        for id, hypos in zip(sample['id'].tolist(), translations):
+            results[id] = [
+                {'text': self.decode(hypo['tokens'].cpu()), 'score': float(hypo['score'])}
+                for hypo in hypos[:self.nbest]
+            ]
+        return results
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+_REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    413: 'Payload Too Large', 500: 'Internal Server Error',
+}
+
+
+class GenerationServer(object):
+    """HTTP/1.1 JSON front end of a :class:`DynamicBatcher`, see the module
+    documentation for the routes.
+
+    Args:
+        backend (GenerationBackend): encodes the sources and runs the batches
+        max_sentences, max_tokens, max_latency: batching limits, see
+            :class:`DynamicBatcher`
+        max_request_size (int, optional): maximum size of a request body, in
+            bytes (default: 1 MiB)
+    """
+
+    def __init__(
+        self, backend, max_sentences=32, max_tokens=None, max_latency=0.01,
+        max_request_size=1 << 20,
+    ):
+        self.backend = backend
+        self.metrics = ServingMetrics()
+        self.batcher = DynamicBatcher(
+            backend, max_sentences=max_sentences, max_tokens=max_tokens,
+            max_latency=max_latency, length_fn=lambda tokens: tokens.numel(),
+            metrics=self.metrics,
+        )
+        self.max_request_size = max_request_size
+
+    async def generate(self, sources):
+        tokens = [self.backend.encode(source) for source in sources]
+        return await asyncio.gather(*[self.batcher.submit(t) for t in tokens])
+
+    async def _route(self, method, path, body):
+        if path == '/health':
+            return {'status': 'ok'}
+        if path == '/metrics':
+            return self.metrics.summary()
+        if path != '/generate':
+            raise HTTPError(404, 'unknown path {}'.format(path))
+        if method != 'POST':
+            raise HTTPError(405, 'use POST for /generate')
+        try:
+            request = json.loads(body.decode('utf-8'))
+        except ValueError:
+            raise HTTPError(400, 'the body is not valid JSON')
+        if not isinstance(request, dict):
+            raise HTTPError(400, 'the body must be a JSON object')
+        if isinstance(request.get('source'), str):
+            sources, single = [request['source']], True
+        elif isinstance(request.get('sources'), list) and all(isinstance(s, str) for s in request['sources']):
+            sources, single = request['sources'], False
+        else:
+            raise HTTPError(400, 'expected a "source" string or a "sources" list of strings')
+        try:
+            hypotheses = await self.generate(sources)
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        return {'hypotheses': hypotheses[0] if single else hypotheses}
+
+    async def _read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, version = request_line.decode('latin-1').split()
+        except ValueError:
+            raise HTTPError(400, 'malformed request line')
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0) or 0)
+        if length > self.max_request_size:
+            raise HTTPError(413, 'the body is larger than {} bytes'.format(self.max_request_size))
+        body = await reader.readexactly(length) if length > 0 else b''
+        keep_alive = (
+            headers.get('connection', '').lower() != 'close'
+            if version == 'HTTP/1.1' else headers.get('connection', '').lower() == 'keep-alive'
+        )
+        return method, target.split('?', 1)[0], body, keep_alive
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, path, body, keep_alive = request
+                    status, response = 200, await self._route(method, path, body)
+                except HTTPError as e:
+                    status, response = e.status, {'error': e.message}
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as e:
+                    logger.exception('failed to handle a request')
+                    status, response = 500, {'error': str(e)}
+                payload = json.dumps(response).encode('utf-8')
+                writer.write(
+                    'HTTP/1.1 {} {}\r\nContent-Type: application/json\r\n'
+                    'Content-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+                        status, _REASONS.get(status, ''), len(payload),
+                        'keep-alive' if keep_alive else 'close',
+                    ).encode('latin-1') + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='localhost', port=8080):
+        """Serves requests on ``host:port`` until cancelled."""
+        self.batcher.start()
+        server = await asyncio.start_server(self._handle, host, port)
+        logger.info('serving on {}'.format(', '.join(
+            '{}:{}'.format(*s.getsockname()[:2]) for s in server.sockets)))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.close()
@@ -308,8 +308,18 @@ class FairseqTask(object):
             match_source_len=getattr(args, "match_source_len", False),
             no_repeat_ngram_size=getattr(args, "no_repeat_ngram_size", 0),
             search_strategy=search_strategy,
+            vocab_shortlist=self.build_vocab_shortlist(args),
+            shortlist_source_tokens=getattr(args, "shortlist_source_tokens", False),
         )
 
+    def build_vocab_shortlist(self, args):
+        """Load the ``--vocab-shortlist`` of the target dictionary, if any."""
+        if getattr(args, "vocab_shortlist", None) is None:
+            return None
+        from fairseq.data.vocab_shortlist import load_shortlist
+
+        return load_shortlist(args.vocab_shortlist, self.target_dictionary)
+
     def train_step(
         self, sample, model, criterion, optimizer, update_num, ignore_grad=False
     ):
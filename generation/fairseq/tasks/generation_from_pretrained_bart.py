@@ -266,6 +266,8 @@ class GenerationFromPretrainedBARTTask(TranslationTask):
                 temperature=getattr(args, 'temperature', 1.),
                 match_source_len=getattr(args, 'match_source_len', False),
                 no_repeat_ngram_size=getattr(args, 'no_repeat_ngram_size', 0),
+                vocab_shortlist=self.build_vocab_shortlist(args),
+                shortlist_source_tokens=getattr(args, 'shortlist_source_tokens', False),
                 eos=self.tgt_dict.index('[{}]'.format(tgt_lang))
             )
 
@@ -277,5 +279,6 @@ class GenerationFromPretrainedBARTTask(TranslationTask):
         for s_t in src_tokens:
             s_t = torch.cat([s_t, s_t.new(1).fill_(src_lang_id)])
             source_tokens.append(s_t)
-        dataset = LanguagePairDataset(src_tokens, src_lengths, self.source_dictionary)
+        source_lengths = [s_t.numel() for s_t in source_tokens]
+        dataset = LanguagePairDataset(source_tokens, source_lengths, self.source_dictionary)
         return dataset
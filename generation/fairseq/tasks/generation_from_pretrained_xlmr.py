@@ -258,6 +258,8 @@ class GenerationFromPretrainedXLMRTask(TranslationTask):
                 temperature=getattr(args, 'temperature', 1.),
                 match_source_len=getattr(args, 'match_source_len', False),
                 no_repeat_ngram_size=getattr(args, 'no_repeat_ngram_size', 0),
+                vocab_shortlist=self.build_vocab_shortlist(args),
+                shortlist_source_tokens=getattr(args, 'shortlist_source_tokens', False),
                 eos=self.tgt_dict.eos()
             )
 
@@ -6,22 +6,28 @@
 import logging
 import os
 import glob
+import threading
+import time
 
 import numpy as np
 
 from fairseq.data import (
     data_utils,
+    iterators,
     Dictionary,
     AppendTokenDataset,
+    MMapIndexedDataset,
     ConcatDataset,
     XDAEDenoisingDataset,
     PrependTokenDataset,
     ResamplingDataset,
     SortDataset,
     TokenBlockDataset,
+    WordStartsDataset,
 )
 from .denoising import DenoisingTask
 from fairseq.data.encoders.utils import get_whole_word_mask
+from fairseq.data.indexed_dataset import _warmup_mmap_file, data_file_path
 from fairseq.tasks import register_task
 
 
@@ -50,6 +56,26 @@ class XDAEMultilingualDenoisingTask(DenoisingTask):
                             help="Randomly dropout input words (0 to disable)")
         parser.add_argument("--word-blank", type=float, default=0,
                             help="Randomly blank input words (0 to disable)")
+        parser.add_argument('--batched-noise', default=False, action='store_true',
+                            help='apply the noise to whole batches in the collater '
+                                 'instead of per sample in __getitem__')
+
+        parser.add_argument('--block-cache-dir', type=str, default=None, metavar='DIR',
+                            help='directory to cache the block indices of the shards in '
+                                 '(default: next to each shard)')
+        parser.add_argument('--no-block-cache', default=False, action='store_true',
+                            help='always rebuild the block indices of the shards')
+
+        parser.add_argument('--no-shard-prefetch', default=False, action='store_true',
+                            help='with --sampled-data, don\'t open the shards of the next '
+                                 'epoch in the background')
+
+        parser.add_argument('--streaming-sampler', default=False, action='store_true',
+                            help='sample train batches from the languages while iterating '
+                                 'instead of resampling and sorting all blocks every epoch')
+        parser.add_argument('--streaming-chunk-size', type=int, default=4096, metavar='N',
+                            help='number of blocks drawn from a language at a time, '
+                                 'batches are made by size within them')
 
         parser.add_argument('--sampled-data', default=False, action='store_true')
         parser.add_argument('--langs', type=str, help="language ids we are considering", default=None)
@@ -103,6 +129,45 @@ class XDAEMultilingualDenoisingTask(DenoisingTask):
         self.langs = args.langs
         self.args = args
         self.path_cache = {}
+        # language datasets of the last load of every split, by shard
+        self.lang_dataset_cache = {}
+        # background loads of the shards of the next epoch, by split
+        self.shard_prefetch = {}
+
+    def get_batch_iterator(
+        self, dataset, max_tokens=None, max_sentences=None, max_positions=None,
+        ignore_invalid_inputs=False, required_batch_size_multiple=1,
+        seed=1, num_shards=1, shard_id=0, num_workers=0, epoch=1,
+    ):
+        if (
+            not self.args.streaming_sampler
+            or dataset is not self.datasets.get(self.args.train_subset)
+        ):
+            return super().get_batch_iterator(
+                dataset, max_tokens, max_sentences, max_positions,
+                ignore_invalid_inputs, required_batch_size_multiple,
+                seed, num_shards, shard_id, num_workers, epoch,
+            )
+        if dataset in self.dataset_to_epoch_iter:
+            return self.dataset_to_epoch_iter[dataset]
+
+        epoch_iter = iterators.TemperatureSampledEpochBatchIterator(
+            datasets=dataset.datasets,
+            sample_probs=self.train_sample_probs,
+            max_tokens=max_tokens,
+            max_sentences=max_sentences,
+            max_positions=max_positions,
+            ignore_invalid_inputs=ignore_invalid_inputs,
+            required_batch_size_multiple=required_batch_size_multiple,
+            seed=seed,
+            num_shards=num_shards,
+            shard_id=shard_id,
+            num_workers=num_workers,
+            epoch=epoch,
+            chunk_size=self.args.streaming_chunk_size,
+        )
+        self.dataset_to_epoch_iter[dataset] = epoch_iter
+        return epoch_iter
 
     def _get_sample_prob(self, dataset_lens):
         """
@@ -115,7 +180,7 @@ class XDAEMultilingualDenoisingTask(DenoisingTask):
         return smoothed_prob
 
     def get_languages(self, data_folder):
-        files = [path for path in os.listdir(data_folder)]
+        files = [path for path in os.listdir(data_folder) if path.endswith('.bin')]
         lgs = set([x.split('.')[-2] for x in files])
         return lgs
 
@@ -149,12 +214,181 @@ class XDAEMultilingualDenoisingTask(DenoisingTask):
                 paths[lg] = path
         return paths
 
+    def _block_cache_path(self, split_path, dataset):
+        """File caching the block indices of the shard at *split_path*, keyed
+        by tokens per sample and break mode."""
+        if self.args.no_block_cache or not isinstance(dataset, MMapIndexedDataset):
+            return None
+        cache_name = '{}.blocks.{}.{}.npz'.format(
+            os.path.basename(split_path),
+            self.args.tokens_per_sample,
+            self.args.sample_break_mode,
+        )
+        if self.args.block_cache_dir is None:
+            return os.path.join(os.path.dirname(split_path), cache_name)
+        cache_dir = os.path.join(
+            self.args.block_cache_dir,
+            os.path.relpath(os.path.dirname(os.path.abspath(split_path)), '/'),
+        )
+        os.makedirs(cache_dir, exist_ok=True)
+        return os.path.join(cache_dir, cache_name)
+
+    def _load_lang_dataset(self, split, split_path, language, lang_mask_whole_words, combine):
+        """Open the shard of one language at *split_path* and build its
+        denoising dataset. The mmap data is not read ahead, pages are loaded
+        as blocks are sampled, and the block indices are cached on disk."""
+        dataset = data_utils.load_indexed_dataset(
+            split_path,
+            self.source_dictionary,
+            self.args.dataset_impl,
+            combine=combine,
+            skip_warmup=True,
+        )
+        if dataset is None:
+            raise FileNotFoundError('Dataset not found: {} ({})'.format(split, split_path))
+
+        word_starts = None
+        if (
+            lang_mask_whole_words is not None
+            and isinstance(dataset, MMapIndexedDataset)
+            and WordStartsDataset.exists(split_path)
+        ):
+            word_starts = WordStartsDataset(split_path)
+            if word_starts.matches(lang_mask_whole_words):
+                logger.info('| using word start sidecar of: {}'.format(split_path))
+            else:
+                logger.warning(
+                    '| ignoring stale word start sidecar of {}, rebuild it with '
+                    'scripts/build_word_starts.py'.format(split_path)
+                )
+                word_starts = None
+
+        #end_token = self.source_dictionary.index('[{}]'.format(language)) \
+        #    if self.args.add_lang_token else self.source_dictionary.eos()
+
+        lg_tag = language if self.args.common_eos is None else self.args.common_eos 
+        end_token = self.source_dictionary.index('[{}]'.format(lg_tag)) \
+                    if self.args.add_lang_token else self.source_dictionary.eos()
+
+        bos_idx = None
+        if self.args.add_lang_token:
+            bos_idx = self.source_dictionary.index('[{}]'.format(language))
+        # create continuous blocks of tokens
+        dataset = TokenBlockDataset(
+            dataset,
+            dataset.sizes,
+            self.args.tokens_per_sample - 2,  # one less for <s>
+            pad=self.source_dictionary.pad(),
+            eos=end_token,
+            break_mode=self.args.sample_break_mode,
+            cache_path=self._block_cache_path(split_path, dataset),
+        )
+        if word_starts is not None:
+            word_starts = dataset.aligned(word_starts)
+
+        def word_start(token):
+            return int(lang_mask_whole_words[token])
+
+        # prepend beginning-of-sentence token (<s>, equiv. to [CLS] in BERT)
+        if not self.args.no_prepend_sent_bos:
+            dataset = PrependTokenDataset(dataset, self.source_dictionary.bos())
+            if word_starts is not None:
+                word_starts = PrependTokenDataset(
+                    word_starts, word_start(self.source_dictionary.bos())
+                )
+
+        if self.args.add_lang_token:
+            dataset = PrependTokenDataset(dataset, bos_idx)
+            if word_starts is not None:
+                word_starts = PrependTokenDataset(word_starts, word_start(bos_idx))
+
+        dataset = AppendTokenDataset(dataset, end_token)
+        if word_starts is not None:
+            word_starts = AppendTokenDataset(word_starts, word_start(end_token))
+
+        lang_dataset = XDAEDenoisingDataset(
+            dataset,
+            dataset.sizes,
+            self.dictionary,
+            self.mask_idx,
+            lang_mask_whole_words,
+            shuffle=self.args.shuffle_instance,
+            seed=self.seed,
+            args=self.args,
+            eos=None if not self.args.add_lang_token else self.source_dictionary.index('[{}]'.format(lg_tag)),
+            bos=bos_idx,
+            no_prepend_bos=self.args.no_prepend_sent_bos,
+            batched_noise=self.args.batched_noise,
+            word_start_dataset=word_starts,
+        )
+        return lang_dataset
+
+    def _prefetch_lang_datasets(self, jobs, results):
+        for key, (split, split_path, language, lang_mask_whole_words, combine) in jobs:
+            try:
+                start = time.time()
+                if MMapIndexedDataset.exists(split_path):
+                    _warmup_mmap_file(data_file_path(split_path))
+                results[key] = self._load_lang_dataset(
+                    split, split_path, language, lang_mask_whole_words, combine,
+                )
+                logger.info('| prefetched {} blocks from: {} in {:.2f}s'.format(
+                    len(results[key]), split_path, time.time() - start,
+                ))
+            except Exception as e:
+                logger.warning('| unable to prefetch {}: {}'.format(split_path, e))
+
+    def _start_shard_prefetch(self, split, epoch, mask_whole_words, combine):
+        """Open the shards sampled for *epoch* in a background thread: their
+        pages are read into the page cache and their datasets built, so that
+        :func:`load_dataset` can pick them up at the next epoch boundary.
+
+        The shard choices are computed here, in the calling thread, since
+        :func:`get_dataset_path` reseeds the global NumPy random state.
+        """
+        paths = self.args.data.split(':')
+        data_path = paths[(epoch - 1) % len(paths)]
+        languages = None if self.langs is None else self.langs.split(',')
+        all_lg_path = self.get_dataset_path(split, data_path, epoch, languages)
+        language_without_segmentations = self.args.no_whole_word_mask_langs.split(',')
+        current = self.lang_dataset_cache.get(split, {})
+        jobs = []
+        for language, split_path in all_lg_path.items():
+            key = (split_path, language)
+            if key in current:
+                continue
+            lang_mask_whole_words = mask_whole_words if language not in language_without_segmentations else None
+            jobs.append((key, (split, split_path, language, lang_mask_whole_words, combine)))
+
+        results = {}
+        thread = threading.Thread(
+            target=self._prefetch_lang_datasets, args=(jobs, results), daemon=True,
+        )
+        thread.start()
+        self.shard_prefetch[split] = (epoch, thread, results)
+
+    def _join_shard_prefetch(self, split, epoch):
+        """Wait for the background load of *split* started for *epoch*, and
+        return the prefetched language datasets by shard."""
+        if split not in self.shard_prefetch:
+            return {}
+        prefetch_epoch, thread, results = self.shard_prefetch.pop(split)
+        start = time.time()
+        thread.join()
+        if prefetch_epoch != epoch:
+            return {}
+        logger.info('| waited {:.2f}s for {} prefetched shards'.format(
+            time.time() - start, len(results),
+        ))
+        return results
+
     def load_dataset(self, split, epoch=1, combine=False, **kwargs):
         """Load a given dataset split.
 
         Args:
             split (str): name of the split (e.g., train, valid, test)
         """
+        load_start = time.time()
         paths = self.args.data.split(':')
         assert len(paths) > 0
         data_path = paths[(epoch - 1) % len(paths)]
@@ -188,63 +422,33 @@ class XDAEMultilingualDenoisingTask(DenoisingTask):
         mask_whole_words = get_whole_word_mask(self.args, self.dictionary)
         language_without_segmentations = self.args.no_whole_word_mask_langs.split(',')
         lang_datasets = []
+        prev_lang_datasets = dict(self.lang_dataset_cache.get(split, {}))
+        prev_lang_datasets.update(self._join_shard_prefetch(split, epoch))
+        lang_dataset_cache = {}
+        num_reused = 0
 
         for language in languages:
             split_path = os.path.join(data_path, language, split) if all_lg_path is None else all_lg_path[language]
-            dataset = data_utils.load_indexed_dataset(
-                split_path,
-                self.source_dictionary,
-                self.args.dataset_impl,
-                combine=combine,
-            )
-            if dataset is None:
-                raise FileNotFoundError('Dataset not found: {} ({})'.format(split, split_path))
-
-            #end_token = self.source_dictionary.index('[{}]'.format(language)) \
-            #    if self.args.add_lang_token else self.source_dictionary.eos()
-           
-            lg_tag = language if self.args.common_eos is None else self.args.common_eos 
-            end_token = self.source_dictionary.index('[{}]'.format(lg_tag)) \
-                        if self.args.add_lang_token else self.source_dictionary.eos()
-
-            bos_idx = None
-            if self.args.add_lang_token:
-                bos_idx = self.source_dictionary.index('[{}]'.format(language))
-            # create continuous blocks of tokens
-            dataset = TokenBlockDataset(
-                dataset,
-                dataset.sizes,
-                self.args.tokens_per_sample - 2,  # one less for <s>
-                pad=self.source_dictionary.pad(),
-                eos=end_token,
-                break_mode=self.args.sample_break_mode,
-            )
-            logger.info('| loaded {} blocks from: {}'.format(len(dataset), split_path))
-
-            # prepend beginning-of-sentence token (<s>, equiv. to [CLS] in BERT)
-            if not self.args.no_prepend_sent_bos:
-                dataset = PrependTokenDataset(dataset, self.source_dictionary.bos())
-
-            if self.args.add_lang_token:
-                dataset = PrependTokenDataset(dataset, bos_idx)
-
-            dataset = AppendTokenDataset(dataset, end_token)
             lang_mask_whole_words = mask_whole_words if language not in language_without_segmentations else None
-
-            lang_dataset = XDAEDenoisingDataset(
-                dataset,
-                dataset.sizes,
-                self.dictionary,
-                self.mask_idx,
-                lang_mask_whole_words,
-                shuffle=self.args.shuffle_instance,
-                seed=self.seed,
-                args=self.args,
-                eos=None if not self.args.add_lang_token else self.source_dictionary.index('[{}]'.format(lg_tag)),
-                bos=bos_idx,
-                no_prepend_bos=self.args.no_prepend_sent_bos
-            )
+            key = (split_path, language)
+            if key in prev_lang_datasets:
+                lang_dataset = prev_lang_datasets[key]
+                num_reused += 1
+            else:
+                start = time.time()
+                lang_dataset = self._load_lang_dataset(
+                    split, split_path, language, lang_mask_whole_words, combine,
+                )
+                logger.info('| loaded {} blocks from: {} in {:.2f}s'.format(
+                    len(lang_dataset), split_path, time.time() - start,
+                ))
             lang_datasets.append(lang_dataset)
+            lang_dataset_cache[key] = lang_dataset
+        # only keep the datasets of this epoch, so that sampled shards are closed
+        self.lang_dataset_cache[split] = lang_dataset_cache
+
+        if sampled and split == self.args.train_subset and not self.args.no_shard_prefetch:
+            self._start_shard_prefetch(split, epoch + 1, mask_whole_words, combine)
 
         dataset_lengths = np.array(
             [len(d) for d in lang_datasets],
@@ -271,20 +475,25 @@ class XDAEMultilingualDenoisingTask(DenoisingTask):
                     }
                 )
 
-                resampled_lang_datasets = [
-                    ResamplingDataset(
-                        lang_datasets[i],
-                        size_ratio=size_ratio[i],
-                        seed=self.args.seed,
-                        epoch=epoch,
-                        replace=size_ratio[i] >= 1.0,
-                    )
-                    for i, d in enumerate(lang_datasets)
-                ]
-                dataset = ConcatDataset(
-                    resampled_lang_datasets,
-                    )
+                if self.args.streaming_sampler:
+                    self.train_sample_probs = sample_probs
+                    dataset = ConcatDataset(lang_datasets)
+                else:
+                    resampled_lang_datasets = [
+                        ResamplingDataset(
+                            lang_datasets[i],
+                            size_ratio=size_ratio[i],
+                            seed=self.args.seed,
+                            epoch=epoch,
+                            replace=size_ratio[i] >= 1.0,
+                        )
+                        for i, d in enumerate(lang_datasets)
+                    ]
+                    dataset = ConcatDataset(
+                        resampled_lang_datasets,
+                        )
             else:
+                self.train_sample_probs = dataset_lengths / dataset_lengths.sum()
                 dataset = ConcatDataset(
                     lang_datasets,
                 )
@@ -302,12 +511,21 @@ class XDAEMultilingualDenoisingTask(DenoisingTask):
                     split, ','.join(lang_splits)
                 )
 
-        with data_utils.numpy_seed(self.args.seed + epoch):
-            shuffle = np.random.permutation(len(dataset))
-        self.datasets[split] = SortDataset(
-            dataset,
-            sort_order=[
-                shuffle,
-                dataset.sizes,
-            ],
+        if split == self.args.train_subset and self.args.streaming_sampler:
+            # batches are sampled from the languages in get_batch_iterator
+            self.datasets[split] = dataset
+        else:
+            with data_utils.numpy_seed(self.args.seed + epoch):
+                shuffle = np.random.permutation(len(dataset))
+            self.datasets[split] = SortDataset(
+                dataset,
+                sort_order=[
+                    shuffle,
+                    dataset.sizes,
+                ],
+            )
+        logger.info(
+            '| loaded {} for epoch {} in {:.2f}s ({} of {} language datasets reused or prefetched)'.format(
+                split, epoch, time.time() - load_start, num_reused, len(languages),
+            )
         )
@@ -17,6 +17,7 @@ from . import register_task
 
 from fairseq.data import (
     AppendTokenDataset,
+    iterators,
     ConcatDataset,
     SortDataset,
     data_utils,
@@ -179,6 +180,12 @@ class MultilingualGenerationFromBARTTask(TranslationTask):
                             help='number of placeholder in dictionaries')
         parser.add_argument('--gt-langs', type=str,
                             help="languages used in generation finetuning, separated wiht -, for example, 'en-fr-de'")
+        parser.add_argument('--streaming-sampler', default=False, action='store_true',
+                            help='sample train batches from the languages while iterating '
+                                 'instead of resampling and sorting all pairs every epoch')
+        parser.add_argument('--streaming-chunk-size', type=int, default=4096, metavar='N',
+                            help='number of pairs drawn from a language at a time, '
+                                 'batches are made by size within them')
 
         # fmt: on
 
@@ -242,6 +249,41 @@ class MultilingualGenerationFromBARTTask(TranslationTask):
         smoothed_prob = smoothed_prob / smoothed_prob.sum()
         return smoothed_prob
 
+    def get_batch_iterator(
+        self, dataset, max_tokens=None, max_sentences=None, max_positions=None,
+        ignore_invalid_inputs=False, required_batch_size_multiple=1,
+        seed=1, num_shards=1, shard_id=0, num_workers=0, epoch=1,
+    ):
+        if (
+            not getattr(self.args, 'streaming_sampler', False)
+            or dataset is not self.datasets.get(getattr(self.args, 'train_subset', 'train'))
+        ):
+            return super().get_batch_iterator(
+                dataset, max_tokens, max_sentences, max_positions,
+                ignore_invalid_inputs, required_batch_size_multiple,
+                seed, num_shards, shard_id, num_workers, epoch,
+            )
+        if dataset in self.dataset_to_epoch_iter:
+            return self.dataset_to_epoch_iter[dataset]
+
+        epoch_iter = iterators.TemperatureSampledEpochBatchIterator(
+            datasets=dataset.datasets,
+            sample_probs=self.train_sample_probs,
+            max_tokens=max_tokens,
+            max_sentences=max_sentences,
+            max_positions=max_positions,
+            ignore_invalid_inputs=ignore_invalid_inputs,
+            required_batch_size_multiple=required_batch_size_multiple,
+            seed=seed,
+            num_shards=num_shards,
+            shard_id=shard_id,
+            num_workers=num_workers,
+            epoch=epoch,
+            chunk_size=self.args.streaming_chunk_size,
+        )
+        self.dataset_to_epoch_iter[dataset] = epoch_iter
+        return epoch_iter
+
     def load_dataset(self, split, epoch=1, combine=False, **kwargs):
         """Load a given dataset split.
 
@@ -289,7 +331,11 @@ class MultilingualGenerationFromBARTTask(TranslationTask):
                 for id, lang in enumerate(self.gt_langs)
             }
         )
-        if split == getattr(self.args, "train_subset", "train"):
+        streaming = getattr(self.args, 'streaming_sampler', False)
+        if split == getattr(self.args, "train_subset", "train") and streaming:
+            self.train_sample_probs = sample_probs
+            dataset = ConcatDataset(lg_datasets)
+        elif split == getattr(self.args, "train_subset", "train"):
             resampled_lang_datasets = [
                 ResamplingDataset(
                     lg_datasets[i],
@@ -317,6 +363,11 @@ class MultilingualGenerationFromBARTTask(TranslationTask):
                         split, ','.join(lang_splits)
                     )
 
+        if split == getattr(self.args, "train_subset", "train") and streaming:
+            # batches are sampled from the languages in get_batch_iterator
+            self.datasets[split] = dataset
+            return
+
         with data_utils.numpy_seed(self.args.seed + epoch):
             shuffle = np.random.permutation(len(dataset))
         self.datasets[split] = SortDataset(
@@ -355,6 +406,8 @@ class MultilingualGenerationFromBARTTask(TranslationTask):
                 temperature=getattr(args, 'temperature', 1.),
                 match_source_len=getattr(args, 'match_source_len', False),
                 no_repeat_ngram_size=getattr(args, 'no_repeat_ngram_size', 0),
+                vocab_shortlist=self.build_vocab_shortlist(args),
+                shortlist_source_tokens=getattr(args, 'shortlist_source_tokens', False),
                 eos=self.tgt_dict.index('[{}]'.format(tgt_lang))
             )
 
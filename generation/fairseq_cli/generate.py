@@ -14,7 +14,7 @@ import sys
 
 import torch
 
-from fairseq import bleu, checkpoint_utils, options, tasks, utils
+from fairseq import bleu, checkpoint_utils, options, quantization_utils, tasks, utils
 from fairseq.logging import progress_bar
 from fairseq.logging.meters import StopwatchMeter, TimeMeter
 from fairseq.data import encoders
@@ -51,26 +51,36 @@ def _main(args, output_file):
         args.max_tokens = 12000
     logger.info(args)
 
-    use_cuda = torch.cuda.is_available() and not args.cpu
-
     # Load dataset splits
     task = tasks.setup_task(args)
     task.load_dataset(args.gen_subset)
 
-    # Set dictionaries
-    try:
-        src_dict = getattr(task, 'source_dictionary', None)
-    except NotImplementedError:
-        src_dict = None
-    tgt_dict = task.target_dictionary
-
     # Load ensemble
     logger.info('loading model(s) from {}'.format(args.path))
-    models, _model_args = checkpoint_utils.load_model_ensemble(
-        utils.split_paths(args.path),
-        arg_overrides=eval(args.model_overrides),
-        task=task,
-    )
+    models = load_models(args, task)
+
+    return generate(args, task, models, output_file)
+
+
+def load_models(args, task):
+    """Load the ensemble of *args.path* for *task* and optimize it for
+    generation."""
+    use_cuda = torch.cuda.is_available() and not args.cpu
+    if getattr(args, 'quantize_int8', False):
+        assert not use_cuda and not args.fp16, '--quantize-int8 requires --cpu and no --fp16'
+        models, _model_args = quantization_utils.load_quantized_model_ensemble(
+            utils.split_paths(args.path),
+            arg_overrides=eval(args.model_overrides),
+            task=task,
+            fuse_layers=args.quantize_fuse_layers,
+            cache_dir=args.quantized_cache_dir,
+        )
+    else:
+        models, _model_args = checkpoint_utils.load_model_ensemble(
+            utils.split_paths(args.path),
+            arg_overrides=eval(args.model_overrides),
+            task=task,
+        )
 
     # Optimize ensemble for generation
     for model in models:
@@ -82,6 +92,22 @@ def _main(args, output_file):
             model.half()
         if use_cuda:
             model.cuda()
+    return models
+
+
+def generate(args, task, models, output_file):
+    """Decode the loaded split *args.gen_subset* of *task* with *models*,
+    which can be reused across calls, and print the hypotheses to
+    *output_file*."""
+    logger = logging.getLogger('fairseq_cli.generate')
+    use_cuda = torch.cuda.is_available() and not args.cpu
+
+    # Set dictionaries
+    try:
+        src_dict = getattr(task, 'source_dictionary', None)
+    except NotImplementedError:
+        src_dict = None
+    tgt_dict = task.target_dictionary
 
     # Load alignment dictionary for unknown word replacement
     # (None if no unknown word replacement, empty if no path to align dictionary)
@@ -12,12 +12,12 @@ import fileinput
 import logging
 import math
 import sys
-import os
 
 import torch
 
-from fairseq import checkpoint_utils, options, tasks, utils
+from fairseq import options, tasks, utils
 from fairseq.data import encoders
+from fairseq_cli.generate import load_models
 
 
 logging.basicConfig(
@@ -90,27 +90,12 @@ def main(args):
 
     # Load ensemble
     logger.info('loading model(s) from {}'.format(args.path))
-    models, _model_args = checkpoint_utils.load_model_ensemble(
-        args.path.split(os.pathsep),
-        arg_overrides=eval(args.model_overrides),
-        task=task,
-    )
+    models = load_models(args, task)
 
     # Set dictionaries
     src_dict = task.source_dictionary
     tgt_dict = task.target_dictionary
 
-    # Optimize ensemble for generation
-    for model in models:
-        model.make_generation_fast_(
-            beamable_mm_beam_size=None if args.no_beamable_mm else args.beam,
-            need_attn=args.print_alignment,
-        )
-        if args.fp16:
-            model.half()
-        if use_cuda:
-            model.cuda()
-
     # Initialize generator
     generator = task.build_generator(models, args)
 
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+"""
+Serve a trained model over HTTP, batching the concurrent requests on-the-fly.
+
+For example, for an NTG model fine-tuned from Unicoder:
+
+    fairseq-serve $DATA_PATH/en --path $MODEL --task generation_from_pretrained_bart \\
+        -s en -t en --placeholder 200 --common_eos EOS --langs $langs \\
+        --bpe sentencepiece --sentencepiece-vocab $SPE --beam 5 \\
+        --max-sentences 32 --max-latency-ms 10 --port 8080
+
+    curl -s localhost:8080/generate -d '{"source": "..."}'
+    curl -s localhost:8080/metrics
+"""
+
+import asyncio
+import logging
+import sys
+
+import torch
+
+from fairseq import options, tasks, utils
+from fairseq.hub_utils import GeneratorHubInterface
+from fairseq.serving import GenerationBackend, GenerationServer
+from fairseq_cli.generate import load_models
+
+
+logging.basicConfig(
+    format='%(asctime)s | %(levelname)s | %(name)s | %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S',
+    level=logging.INFO,
+    stream=sys.stdout,
+)
+logger = logging.getLogger('fairseq_cli.serve')
+
+
+def main(args):
+    utils.import_user_module(args)
+
+    if args.max_tokens is None and args.max_sentences is None:
+        args.max_sentences = 32
+
+    assert not args.sampling or args.nbest == args.beam, \
+        '--sampling requires --nbest to be equal to --beam'
+
+    logger.info(args)
+
+    use_cuda = torch.cuda.is_available() and not args.cpu
+
+    # Setup task, e.g., translation
+    task = tasks.setup_task(args)
+
+    # Load ensemble
+    logger.info('loading model(s) from {}'.format(args.path))
+    models = load_models(args, task)
+
+    hub = GeneratorHubInterface(args, task, models)
+    hub.eval()
+    if args.fp16:
+        hub.half()
+    if use_cuda:
+        hub.cuda()
+
+    server = GenerationServer(
+        GenerationBackend(hub, beam=args.beam, nbest=args.nbest),
+        max_sentences=args.max_sentences,
+        max_tokens=args.max_tokens,
+        max_latency=args.max_latency_ms / 1000.,
+        max_request_size=args.max_request_size,
+    )
+    try:
+        asyncio.get_event_loop().run_until_complete(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+def cli_main():
+    parser = options.get_serving_parser()
+    args = options.parse_args_and_arch(parser)
+    main(args)
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+"""
+Load generator for ``fairseq-serve``.
+
+Sends the lines of ``--input`` (or synthetic sentences) as single-source
+``/generate`` requests from ``--concurrency`` keep-alive connections, each
+waiting for its answer before sending the next request, then reports the
+throughput and latencies seen by the clients and the ``/metrics`` of the
+server.
+
+With ``--fake-backend``, the server runs in the same process on top of a
+backend that sleeps instead of running a model, which measures the
+batching and HTTP layers alone:
+
+    python scripts/benchmark_generation_server.py --fake-backend --concurrency 64
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+import torch
+
+from fairseq.serving import GenerationServer
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='benchmark a generation server')
+    # fmt: off
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--input', metavar='FP', default=None,
+                        help='file of source sentences, one per line; '
+                             'synthetic sentences are sent if not set')
+    parser.add_argument('--num-requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=32,
+                        help='number of clients sending requests at the same time')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--min-words', type=int, default=5,
+                        help='minimum length of the synthetic sentences')
+    parser.add_argument('--max-words', type=int, default=100,
+                        help='maximum length of the synthetic sentences')
+    parser.add_argument('--fake-backend', action='store_true',
+                        help='serve from this process with a backend that does not run a model')
+    parser.add_argument('--fake-batch-ms', type=float, default=20.,
+                        help='fixed time of a batch of the fake backend')
+    parser.add_argument('--fake-token-ms', type=float, default=0.01,
+                        help='time of each padded source token of the fake backend')
+    parser.add_argument('--max-sentences', type=int, default=32,
+                        help='batch size of the fake backend server')
+    parser.add_argument('--max-tokens', type=int, default=None,
+                        help='padded tokens per batch of the fake backend server')
+    parser.add_argument('--max-latency-ms', type=float, default=10.,
+                        help='batching window of the fake backend server')
+    # fmt: on
+    return parser
+
+
+class FakeBackend(object):
+    """Backend of :class:`GenerationServer` which splits the sources into
+    words and sleeps for the time a model would take on the padded batch."""
+
+    def __init__(self, batch_ms, token_ms):
+        self.batch_ms = batch_ms
+        self.token_ms = token_ms
+
+    def encode(self, sentence):
+        return torch.arange(len(sentence.split()) + 1)
+
+    def __call__(self, batch_tokens):
+        padded = len(batch_tokens) * max(t.numel() for t in batch_tokens)
+        time.sleep((self.batch_ms + self.token_ms * padded) / 1000.)
+        return [[{'text': 'x' * t.numel(), 'score': 0.}] for t in batch_tokens]
+
+
+def load_sources(args):
+    if args.input is not None:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            sources = [line.strip() for line in f if line.strip()]
+    else:
+        rng = np.random.RandomState(args.seed)
+        lengths = rng.randint(args.min_words, args.max_words + 1, size=args.num_requests)
+        sources = [' '.join(['word'] * n) for n in lengths]
+    return [sources[i % len(sources)] for i in range(args.num_requests)]
+
+
+async def request(reader, writer, host, method, path, payload=None):
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+    writer.write(
+        '{} {} HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\n'
+        'Content-Length: {}\r\n\r\n'.format(method, path, host, len(body)).encode('latin-1') + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, json.loads((await reader.readexactly(length)).decode('utf-8'))
+
+
+async def client(args, sources, next_index, latencies, errors):
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    try:
+        while next_index[0] < len(sources):
+            source = sources[next_index[0]]
+            next_index[0] += 1
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, args.host, 'POST', '/generate', {'source': source})
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run(args):
+    server = None
+    if args.fake_backend:
+        server = GenerationServer(
+            FakeBackend(args.fake_batch_ms, args.fake_token_ms),
+            max_sentences=args.max_sentences, max_tokens=args.max_tokens,
+            max_latency=args.max_latency_ms / 1000.,
+        )
+        serve_task = asyncio.get_event_loop().create_task(server.serve(args.host, args.port))
+        await asyncio.sleep(0.5)
+
+    sources = load_sources(args)
+    next_index, latencies, errors = [0], [], []
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        client(args, sources, next_index, latencies, errors) for _ in range(args.concurrency)
+    ])
+    elapsed = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    _, metrics = await request(reader, writer, args.host, 'GET', '/metrics')
+    writer.close()
+
+    if server is not None:
+        serve_task.cancel()
+        try:
+            await serve_task
+        except asyncio.CancelledError:
+            pass
+
+    print('{} requests in {:.2f}s from {} clients: {:.1f} requests/s, {} errors'.format(
+        len(latencies), elapsed, args.concurrency, len(latencies) / elapsed, len(errors)))
+    if len(latencies) > 0:
+        p50, p90, p99 = np.percentile(np.array(latencies) * 1000., [50, 90, 99])
+        print('client latency ms: p50 {:.1f}, p90 {:.1f}, p99 {:.1f}, max {:.1f}'.format(
+            p50, p90, p99, max(latencies) * 1000.))
+    print('server metrics: {}'.format(json.dumps(metrics, indent=2)))
+
+
+def main():
+    args = get_parser().parse_args()
+    asyncio.get_event_loop().run_until_complete(run(args))
+
+
+if __name__ == '__main__':
+    main()
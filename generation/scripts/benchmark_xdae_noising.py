@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Micro-benchmark of the xDAE noise pipeline on synthetic token blocks.
+
+Compares the per-stage reference implementation
+(``XDAEDenoisingDataset.add_noise_by_stage``) with the fused
+``XDAENoising`` engine used by ``XDAEDenoisingDataset.__getitem__``, checks
+that both produce identical samples and reports samples/s for each, as well
+as for the ``XDAEBatchNoising`` engine used with ``--batched-noise``.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from fairseq.data import data_utils, Dictionary, ListDataset, XDAEDenoisingDataset
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='benchmark xDAE noising')
+    # fmt: off
+    parser.add_argument('--num-samples', type=int, default=2000)
+    parser.add_argument('--tokens-per-sample', type=int, default=512)
+    parser.add_argument('--batch-size', type=int, default=32,
+                        help='number of samples noised together in batched mode')
+    parser.add_argument('--vocab-size', type=int, default=250000)
+    parser.add_argument('--word-start-ratio', type=float, default=0.6,
+                        help='fraction of the vocabulary starting a word')
+    parser.add_argument('--sentence-length', type=int, default=30,
+                        help='average sentence length inside a block')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--mask', type=float, default=0.3)
+    parser.add_argument('--mask-random', type=float, default=0.1)
+    parser.add_argument('--mask-length', default='span-poisson',
+                        choices=['subword', 'word', 'span-poisson'])
+    parser.add_argument('--poisson-lambda', type=float, default=3.5)
+    parser.add_argument('--replace-length', type=int, default=1)
+    parser.add_argument('--insert', type=float, default=0.1)
+    parser.add_argument('--rotate', type=float, default=0.5)
+    parser.add_argument('--permute-sentences', type=float, default=1.0)
+    parser.add_argument('--word-shuffle', type=float, default=3.0)
+    parser.add_argument('--word-dropout', type=float, default=0.1)
+    parser.add_argument('--word-blank', type=float, default=0.1)
+    # fmt: on
+    return parser
+
+
+def build_dataset(args, batched_noise=False):
+    vocab = Dictionary()
+    for i in range(args.vocab_size - len(vocab)):
+        vocab.add_symbol(str(i))
+    mask_idx = vocab.add_symbol('<mask>')
+
+    rng = np.random.RandomState(args.seed)
+    blocks = []
+    for _ in range(args.num_samples):
+        length = args.tokens_per_sample
+        block = rng.randint(vocab.nspecial, args.vocab_size, size=length)
+        block[rng.rand(length) < 1.0 / args.sentence_length] = vocab.eos()
+        block[0] = vocab.bos()
+        block[-1] = vocab.eos()
+        blocks.append(torch.from_numpy(block))
+    word_starts = rng.rand(len(vocab)) < args.word_start_ratio
+    word_starts[:vocab.nspecial] = True
+
+    args.bpe = None
+    dataset = ListDataset(blocks, np.array([len(b) for b in blocks]))
+    return XDAEDenoisingDataset(
+        dataset, dataset.sizes, vocab, mask_idx,
+        torch.from_numpy(word_starts.astype(np.uint8)),
+        shuffle=False, seed=args.seed, args=args, batched_noise=batched_noise,
+    )
+
+
+def run(dataset, noise_fn, seed):
+    """Noise every block from the same random state; only the noise
+    function itself is timed."""
+    outputs = []
+    elapsed = 0.0
+    for index in range(len(dataset)):
+        tokens = dataset.dataset[index]
+        with data_utils.numpy_seed(seed, 0, index):
+            torch.default_generator.manual_seed(seed + index)
+            start = time.perf_counter()
+            outputs.append(noise_fn(tokens))
+            elapsed += time.perf_counter() - start
+    return outputs, elapsed
+
+
+def run_batched(dataset, batch_size, seed):
+    elapsed = 0.0
+    for first in range(0, len(dataset), batch_size):
+        indices = range(first, min(first + batch_size, len(dataset)))
+        blocks = [dataset.dataset[index] for index in indices]
+        with data_utils.numpy_seed(seed, 0, *indices):
+            start = time.perf_counter()
+            dataset.batch_noising(blocks)
+            elapsed += time.perf_counter() - start
+    return elapsed
+
+
+def main():
+    args = get_parser().parse_args()
+    torch.set_num_threads(1)
+    dataset = build_dataset(args)
+
+    # warm up both paths
+    run(dataset, lambda t: dataset.add_noise_by_stage(t.clone()), args.seed)
+    run(dataset, dataset.noising, args.seed)
+
+    reference, ref_time = run(dataset, lambda t: dataset.add_noise_by_stage(t.clone()), args.seed)
+    fused, fused_time = run(dataset, dataset.noising, args.seed)
+
+    mismatches = sum(not torch.equal(a, b) for a, b in zip(reference, fused))
+    print('| samples: {}, tokens per sample: {}'.format(len(dataset), args.tokens_per_sample))
+    print('| per-stage: {:.1f} samples/s'.format(len(dataset) / ref_time))
+    print('| fused:     {:.1f} samples/s'.format(len(dataset) / fused_time))
+    print('| speedup: {:.2f}x, mismatched samples: {}'.format(ref_time / fused_time, mismatches))
+
+    if args.permute_sentences == 0.0:
+        dataset = build_dataset(args, batched_noise=True)
+        run_batched(dataset, args.batch_size, args.seed)
+        batched_time = run_batched(dataset, args.batch_size, args.seed)
+        print('| batched (bsz {}): {:.1f} samples/s, {:.2f}x over per-stage'.format(
+            args.batch_size, len(dataset) / batched_time, ref_time / batched_time,
+        ))
+    else:
+        print('| batched mode skipped: sentence permutation is applied per sample')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+"""
+Build the vocabulary shortlist of a language from binarized data, for
+generation with ``--vocab-shortlist``.
+
+For example, the shortlist of the German NTG titles, from the target side of
+the training data if there is one, or else from the German source articles:
+
+    python scripts/build_vocab_shortlist.py --dict $DATA_BIN/de/dict.tgt.txt \\
+        --input $DATA_BIN/de/valid.src-tgt.src --output $DATA_BIN/de/shortlist.txt
+"""
+
+import argparse
+import logging
+
+from fairseq.data import data_utils, Dictionary, indexed_dataset
+from fairseq.data.vocab_shortlist import count_tokens, save_shortlist, select_shortlist
+
+
+logger = logging.getLogger("fairseq_cli.build_vocab_shortlist")
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='builds a vocabulary shortlist from binarized files')
+    # fmt: off
+    parser.add_argument('--dataset-impl', help='dataset implementation',
+                        choices=indexed_dataset.get_available_dataset_impl())
+    parser.add_argument('--dict', metavar='FP', required=True,
+                        help='dictionary the files were binarized with')
+    parser.add_argument('--input', metavar='FP', required=True, nargs='+',
+                        help='binarized files to count the tokens of')
+    parser.add_argument('--output', metavar='FP', required=True,
+                        help='shortlist file to write')
+    parser.add_argument('--coverage', type=float, default=0.9999,
+                        help='fraction of the token occurrences covered by the shortlist')
+    parser.add_argument('--max-size', type=int, default=None,
+                        help='maximum number of tokens in the shortlist')
+    parser.add_argument('--min-count', type=int, default=1,
+                        help='tokens seen fewer times are left out')
+    # fmt: on
+
+    return parser
+
+
+def main():
+    logging.basicConfig(format='%(asctime)s | %(levelname)s | %(name)s | %(message)s',
+                        level=logging.INFO)
+    parser = get_parser()
+    args = parser.parse_args()
+
+    dictionary = Dictionary.load(args.dict)
+    counts = None
+    for path in args.input:
+        dataset = data_utils.load_indexed_dataset(
+            path, dictionary, dataset_impl=args.dataset_impl, default='mmap',
+        )
+        if dataset is None:
+            raise FileNotFoundError('Dataset not found: {}'.format(path))
+        dataset_counts = count_tokens(dataset, len(dictionary))
+        counts = dataset_counts if counts is None else counts + dataset_counts
+
+    ids = select_shortlist(
+        counts, coverage=args.coverage, max_size=args.max_size, min_count=args.min_count,
+    )
+    save_shortlist(args.output, ids, counts, dictionary)
+    logger.info('{} of {} types, covering {:.4%} of {} tokens'.format(
+        len(ids), len(dictionary), counts[ids].sum() / max(counts.sum(), 1), counts.sum()))
+
+
+if __name__ == '__main__':
+    main()
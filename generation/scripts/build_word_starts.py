@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Precompute the word start sidecar (``.wst``) of binarized mmap datasets, used
+by the ``xdae_multilingual_denoising`` task for whole word masking instead of
+looking up every token of every sample on every epoch.
+
+Example::
+
+    python scripts/build_word_starts.py --dict data-bin/dict.txt \\
+        --bpe sentencepiece --sentencepiece-vocab spm.model \\
+        data-bin/train.0.en data-bin/train.1.en
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+from fairseq.data import Dictionary
+from fairseq.data.encoders import BPE_REGISTRY
+from fairseq.data.encoders.utils import get_whole_word_mask
+from fairseq.data.indexed_dataset import data_file_path
+from fairseq.data.word_starts_dataset import (
+    make_word_starts,
+    word_starts_file_path,
+    WordStartsDataset,
+)
+
+
+logging.basicConfig(
+    format='%(asctime)s | %(levelname)s | %(name)s | %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S',
+    level=logging.INFO,
+    stream=sys.stdout,
+)
+logger = logging.getLogger('build_word_starts')
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='build word start sidecars')
+    # fmt: off
+    parser.add_argument('prefixes', nargs='+', metavar='PREFIX',
+                        help='dataset prefixes (path without .bin/.idx)')
+    parser.add_argument('--dict', required=True, metavar='FP',
+                        help='dictionary of the binarized data')
+    parser.add_argument('--bpe', required=True, choices=BPE_REGISTRY.keys())
+    parser.add_argument('--force', action='store_true',
+                        help='rebuild sidecars that are up to date')
+    # fmt: on
+    return parser
+
+
+def main():
+    parser = get_parser()
+    args, _ = parser.parse_known_args()
+    BPE_REGISTRY[args.bpe].add_args(parser)
+    args = parser.parse_args()
+
+    dictionary = Dictionary.load(args.dict)
+    mask_whole_words = get_whole_word_mask(args, dictionary)
+    assert mask_whole_words is not None
+
+    for prefix in args.prefixes:
+        if not args.force and WordStartsDataset.exists(prefix) and \
+                os.path.getmtime(word_starts_file_path(prefix)) >= os.path.getmtime(data_file_path(prefix)) and \
+                WordStartsDataset(prefix).matches(mask_whole_words):
+            logger.info('| {} is up to date'.format(word_starts_file_path(prefix)))
+            continue
+        make_word_starts(prefix, mask_whole_words)
+        logger.info('| wrote {}'.format(word_starts_file_path(prefix)))
+
+
+if __name__ == '__main__':
+    main()
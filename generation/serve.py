@@ -0,0 +1,9 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+from fairseq_cli.serve import cli_main
+
+
+if __name__ == '__main__':
+    cli_main()
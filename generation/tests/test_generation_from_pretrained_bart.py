@@ -0,0 +1,30 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import argparse
+import unittest
+
+import torch
+from fairseq.data import Dictionary
+from fairseq.tasks.generation_from_pretrained_bart import GenerationFromPretrainedBARTTask
+
+
+class TestGenerationFromPretrainedBARTTask(unittest.TestCase):
+    def test_build_dataset_for_inference(self):
+        dictionary = Dictionary()
+        for symbol in ["a", "b", "c"]:
+            dictionary.add_symbol(symbol)
+        args = argparse.Namespace(langs="en,de", common_eos=None, placeholder=0, source_lang="en")
+        task = GenerationFromPretrainedBARTTask(args, dictionary, dictionary)
+        src_tokens = [torch.LongTensor([4, 5, 2]), torch.LongTensor([6, 2])]
+        dataset = task.build_dataset_for_inference(src_tokens, [t.numel() for t in src_tokens])
+
+        # the sources end with the language symbol, as in training
+        en = dictionary.index("[en]")
+        self.assertEqual(dataset[0]["source"].tolist(), [4, 5, 2, en])
+        self.assertEqual(dataset[1]["source"].tolist(), [6, 2, en])
+        self.assertEqual(dataset.src_sizes.tolist(), [4, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
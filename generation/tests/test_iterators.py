@@ -3,9 +3,23 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import collections
 import unittest
 
-from fairseq.data import iterators
+import numpy as np
+
+from fairseq.data import iterators, ListDataset
+
+
+def sampled_datasets(lengths, seed=0):
+    rng = np.random.RandomState(seed)
+    datasets = []
+    for lang, length in enumerate(lengths):
+        sizes = rng.randint(3, 50, size=length)
+        datasets.append(ListDataset(
+            [(lang, i) for i in range(length)], sizes,
+        ))
+    return datasets
 
 
 class TestIterators(unittest.TestCase):
@@ -22,6 +36,89 @@ class TestIterators(unittest.TestCase):
         self.assertEqual(next(itr), 9)
         self.assertFalse(itr.has_next())
 
+    def _temperature_sampled_iterator(self, datasets, chunk_size=64, **kwargs):
+        return iterators.TemperatureSampledEpochBatchIterator(
+            datasets, [0.5, 0.3, 0.2], max_tokens=400, max_positions=40,
+            ignore_invalid_inputs=True, seed=3, chunk_size=chunk_size, **kwargs
+        )
+
+    def test_temperature_sampled_iterator(self):
+        datasets = sampled_datasets([20000, 2000, 50])
+        itr = self._temperature_sampled_iterator(datasets)
+        batches = list(itr.next_epoch_itr())
+        self.assertEqual(len(batches), len(itr))
+        self.assertTrue(itr.end_of_epoch())
+        self.assertEqual(itr.next_epoch_idx, 2)
+
+        samples = [sample for batch in batches for sample in batch]
+        self.assertLessEqual(len(samples), sum(len(d) for d in datasets))
+        counts = collections.Counter(lang for lang, _ in samples)
+        for lang, prob in enumerate([0.5, 0.3, 0.2]):
+            self.assertAlmostEqual(counts[lang] / len(samples), prob, delta=0.05)
+        for batch in batches:
+            self.assertEqual(len({lang for lang, _ in batch}), 1)
+            self.assertEqual(len(set(batch)), len(batch))
+            sizes = [datasets[lang].sizes[i] for lang, i in batch]
+            self.assertLessEqual(max(sizes), 40)
+            self.assertLessEqual(max(sizes) * len(batch), 400)
+        # the largest dataset is downsampled without repeating examples
+        self.assertEqual(len({s for s in samples if s[0] == 0}), counts[0])
+
+        # same batches for the same epoch, different ones for the next epoch
+        again = self._temperature_sampled_iterator(datasets)
+        self.assertEqual(list(again.next_epoch_itr()), batches)
+        self.assertNotEqual(list(again.next_epoch_itr()), batches)
+
+    def test_temperature_sampled_iterator_mixing(self):
+        # a chunk of the largest dataset holds hundreds of batches, which are
+        # still interleaved with the batches of the other datasets
+        datasets = sampled_datasets([20000, 2000, 50])
+        batches = list(self._temperature_sampled_iterator(datasets, chunk_size=4096).next_epoch_itr())
+        langs = [batch[0][0] for batch in batches]
+        window = 32
+        for i in range(0, len(langs) - window + 1, window):
+            self.assertGreater(len(set(langs[i:i + window])), 1)
+
+    def test_temperature_sampled_iterator_empty_dataset(self):
+        datasets = sampled_datasets([2000, 0, 50])
+        itr = self._temperature_sampled_iterator(datasets)
+        self.assertEqual(itr.chunk_probs[1], 0.)
+        self.assertAlmostEqual(itr.chunk_probs.sum(), 1.)
+        batches = list(itr.next_epoch_itr())
+        self.assertEqual(len(batches), len(itr))
+        langs = {lang for batch in batches for lang, _ in batch}
+        self.assertEqual(langs, {0, 2})
+
+    def test_temperature_sampled_iterator_resume(self):
+        datasets = sampled_datasets([5000, 500, 50])
+        batches = list(self._temperature_sampled_iterator(datasets).next_epoch_itr())
+        itr = self._temperature_sampled_iterator(datasets)
+        epoch_itr = itr.next_epoch_itr()
+        for _ in range(10):
+            next(epoch_itr)
+        state = itr.state_dict()
+        self.assertEqual(state['iterations_in_epoch'], 10)
+
+        resumed = self._temperature_sampled_iterator(datasets)
+        resumed.load_state_dict(state)
+        epoch_itr = resumed.next_epoch_itr()
+        self.assertEqual(epoch_itr.count, 10)
+        self.assertEqual(list(epoch_itr), batches[10:])
+        self.assertEqual(resumed.next_epoch_idx, 2)
+
+    def test_temperature_sampled_iterator_shards(self):
+        datasets = sampled_datasets([5000, 500, 50])
+        batches = list(self._temperature_sampled_iterator(datasets).next_epoch_itr())
+        shards = [
+            list(self._temperature_sampled_iterator(
+                datasets, num_shards=3, shard_id=shard_id,
+            ).next_epoch_itr())
+            for shard_id in range(3)
+        ]
+        self.assertTrue(all(len(shard) == len(shards[0]) for shard in shards))
+        for i, batch in enumerate(batches):
+            self.assertEqual(shards[i % 3][i // 3], batch)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -55,6 +55,66 @@ class TestMultiheadAttention(unittest.TestCase):
             else:
                 self.assertIsNone(c[2])
 
+    def test_incremental_kv_cache(self):
+        torch.manual_seed(0)
+        embed_dim, num_heads, bsz = 16, 4, 6
+        attn = MultiheadAttention(embed_dim, num_heads, self_attention=True).eval()
+        reference = MultiheadAttention(embed_dim, num_heads).eval()
+        reference.load_state_dict(attn.state_dict())
+
+        incremental_state = {}
+        history = torch.zeros(0, bsz, embed_dim)
+        padding = torch.zeros(bsz, 0).bool()
+        # more steps than the initial capacity, so that the cache grows
+        for step in range(40):
+            x = torch.randn(1, history.size(1), embed_dim)
+            step_padding = torch.rand(history.size(1), 1) < 0.5
+            key_padding_mask = step_padding if step == 25 else None
+            history = torch.cat([history, x])
+            padding = torch.cat([padding, step_padding & (step == 25)], dim=1)
+
+            out, _ = attn(
+                x, x, x,
+                key_padding_mask=key_padding_mask,
+                incremental_state=incremental_state,
+            )
+            # attention of the last step over the whole history, without cache
+            expected, _ = reference(
+                x, history, history,
+                key_padding_mask=padding if padding.any() else None,
+            )
+            self.assertTrue(torch.allclose(out, expected, atol=1e-5))
+
+            # reorder the hypotheses as a beam search does, finalizing some of them
+            new_bsz = history.size(1) - 1 if step in [10, 30] else history.size(1)
+            new_order = torch.randint(history.size(1), (new_bsz,))
+            attn.reorder_incremental_state(incremental_state, new_order)
+            history = history[:, new_order]
+            padding = padding[new_order]
+
+    def test_fuse_qkv_projections(self):
+        torch.manual_seed(0)
+        embed_dim, num_heads, bsz = 16, 4, 3
+        attn = MultiheadAttention(embed_dim, num_heads, self_attention=True).eval()
+        fused = MultiheadAttention(embed_dim, num_heads, self_attention=True).eval()
+        fused.load_state_dict(attn.state_dict())
+        fused.fuse_qkv_projections_()
+        self.assertIsNone(fused.q_proj)
+
+        x = torch.randn(5, bsz, embed_dim)
+        key_padding_mask = torch.zeros(bsz, 5).bool()
+        key_padding_mask[0, -2:] = True
+        expected, _ = attn(x, x, x, key_padding_mask=key_padding_mask)
+        out, _ = fused(x, x, x, key_padding_mask=key_padding_mask)
+        self.assertTrue(torch.allclose(out, expected, atol=1e-5))
+
+        state, fused_state = {}, {}
+        for step in range(x.size(0)):
+            x_t = x[step:step + 1]
+            expected, _ = attn(x_t, x_t, x_t, incremental_state=state)
+            out, _ = fused(x_t, x_t, x_t, incremental_state=fused_state)
+            self.assertTrue(torch.allclose(out, expected, atol=1e-5))
+
 
 if __name__ == '__main__':
     unittest.main()
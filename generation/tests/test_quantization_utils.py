@@ -0,0 +1,85 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import copy
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import torch
+from fairseq import quantization_utils
+from fairseq.models.transformer import TransformerModel
+
+from tests.test_export import get_dummy_task_and_parser
+
+
+def build_model():
+    task, parser = get_dummy_task_and_parser()
+    TransformerModel.add_args(parser)
+    args = parser.parse_args([])
+    args.encoder_embed_dim = args.decoder_embed_dim = 32
+    args.encoder_ffn_embed_dim = args.decoder_ffn_embed_dim = 64
+    args.encoder_layers = args.decoder_layers = 2
+    args.encoder_attention_heads = args.decoder_attention_heads = 4
+    return TransformerModel.build_model(args, task).eval(), args
+
+
+def forward(model):
+    torch.manual_seed(1)
+    src_tokens = torch.randint(4, 100, (3, 7))
+    src_lengths = torch.full((3,), 7, dtype=torch.long)
+    prev_output_tokens = torch.randint(4, 100, (3, 5))
+    with torch.no_grad():
+        return model(src_tokens, src_lengths, prev_output_tokens)[0]
+
+
+class TestQuantizationUtils(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model, self.args = build_model()
+
+    def test_quantize_model(self):
+        expected = forward(self.model)
+        model = quantization_utils.quantize_model_(copy.deepcopy(self.model), fuse_layers=True)
+        self.assertIsNotNone(model.decoder.output_projection)
+        self.assertNotIsInstance(model.decoder.output_projection, torch.nn.Linear)
+        self.assertIsNotNone(model.encoder.layers[0].self_attn.qkv_proj)
+        out = forward(model)
+        self.assertEqual(out.size(), expected.size())
+        self.assertLess((torch.norm(out - expected) / torch.norm(expected)).item(), 0.1)
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            checkpoint = os.path.join(tmp, "checkpoint1.pt")
+            with open(checkpoint, "wb") as f:
+                f.write(b"checkpoint")
+            cache_dir = os.path.join(tmp, "cache")
+
+            def load_model_ensemble(filenames, arg_overrides=None, task=None):
+                return [copy.deepcopy(self.model)], self.args
+
+            with mock.patch.object(
+                quantization_utils.checkpoint_utils, "load_model_ensemble",
+                side_effect=load_model_ensemble,
+            ) as loader:
+                models, _ = quantization_utils.load_quantized_model_ensemble(
+                    [checkpoint], cache_dir=cache_dir,
+                )
+                cached_models, _ = quantization_utils.load_quantized_model_ensemble(
+                    [checkpoint], cache_dir=cache_dir,
+                )
+                self.assertEqual(loader.call_count, 1)
+                self.assertTrue(torch.equal(forward(cached_models[0]), forward(models[0])))
+
+                # other conversion options are cached separately
+                quantization_utils.load_quantized_model_ensemble(
+                    [checkpoint], fuse_layers=True, cache_dir=cache_dir,
+                )
+                self.assertEqual(loader.call_count, 2)
+                self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
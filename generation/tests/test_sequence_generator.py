@@ -4,6 +4,7 @@
 # LICENSE file in the root directory of this source tree.
 
 import argparse
+import math
 import tempfile
 import unittest
 
@@ -585,5 +586,106 @@ class TestTopPSamplingSearch(TestSequenceGeneratorBase):
         return t1.size() == t2.size() and t1.ne(t2).long().sum() == 0
 
 
+class TestVocabShortlist(TestJitSequenceGeneratorBase):
+    def generate(self, **kwargs):
+        generator = SequenceGenerator(
+            [self.transformer_model], self.task.tgt_dict, beam_size=2, max_len_b=10, **kwargs
+        )
+        return generator.generate([self.transformer_model], self.sample)
+
+    def test_full_shortlist(self):
+        hypos = self.generate()
+        shortlist_hypos = self.generate(
+            vocab_shortlist=torch.arange(len(self.task.tgt_dict))
+        )
+        for sent_hypos, sent_shortlist_hypos in zip(hypos, shortlist_hypos):
+            for hypo, shortlist_hypo in zip(sent_hypos, sent_shortlist_hypos):
+                self.assertTensorEqual(hypo["tokens"], shortlist_hypo["tokens"])
+                self.assertAlmostEqual(
+                    hypo["positional_scores"], shortlist_hypo["positional_scores"]
+                )
+
+    def test_shortlist(self):
+        shortlist = torch.arange(10, 20)
+        allowed = set(shortlist.tolist()) | {self.task.tgt_dict.eos(), self.task.tgt_dict.unk()}
+        for hypos in self.generate(vocab_shortlist=shortlist):
+            for hypo in hypos:
+                self.assertTrue(set(hypo["tokens"].tolist()) <= allowed)
+
+        src_tokens = self.sample["net_input"]["src_tokens"]
+        allowed |= set(src_tokens.view(-1).tolist())
+        hypos = self.generate(vocab_shortlist=shortlist, shortlist_source_tokens=True)
+        for sent_hypos in hypos:
+            for hypo in sent_hypos:
+                self.assertTrue(set(hypo["tokens"].tolist()) <= allowed)
+
+
+class TestNoRepeatNgram(unittest.TestCase):
+    def setUp(self):
+        self.tgt_dict, _, _, _, _, self.model = test_utils.sequence_generator_setup()
+
+    def reference_banned_tokens(self, tokens, step, n):
+        """Tokens banned by the per-hypothesis tables of string keys built on the host."""
+        banned = []
+        for row in tokens.tolist():
+            ngrams = {}
+            for i in range(len(row) - n + 1):
+                ngrams.setdefault(tuple(row[i : i + n - 1]), []).append(row[i + n - 1])
+            if step + 2 - n >= 0:
+                banned.append(set(ngrams.get(tuple(row[step + 2 - n : step + 1]), [])))
+            else:
+                banned.append(set())
+        return banned
+
+    def _test_no_repeat_ngram(self, n, chunk_len=None):
+        generator = SequenceGenerator(
+            [self.model], self.tgt_dict, beam_size=2, no_repeat_ngram_size=n
+        )
+        if chunk_len is not None:
+            generator.ngram_key_chunk_len = chunk_len
+            generator.ngram_key_chunks = max(1, math.ceil((n - 1) / chunk_len))
+        torch.manual_seed(n)
+        bsz, beam_size, max_len = 3, 2, 12
+        vocab_size, pad = len(self.tgt_dict), self.tgt_dict.pad()
+        tokens = torch.full((bsz * beam_size, max_len + 2), pad, dtype=torch.long)
+        tokens[:, 0] = self.tgt_dict.eos()
+        ngram_keys = torch.zeros(
+            bsz * beam_size, max_len + 2, generator.ngram_key_chunks
+        ).long()
+        for step in range(max_len):
+            lprobs = torch.randn(bsz * beam_size, vocab_size)
+            lprobs[:, pad] = -math.inf
+            expected = self.reference_banned_tokens(tokens, step, n)
+            lprobs = generator._no_repeat_ngram(tokens, lprobs, ngram_keys, step)
+            for row, banned in zip(lprobs.tolist(), expected):
+                self.assertEqual(
+                    {i for i, p in enumerate(row) if p == -math.inf}, banned | {pad}
+                )
+
+            # finalize a sentence and reorder the beams as the generator does
+            if step == 5:
+                batch_idxs = torch.LongTensor([0, 2])
+                tokens = tokens.view(bsz, -1)[batch_idxs].view(2 * beam_size, -1)
+                ngram_keys = ngram_keys.view(bsz, -1)[batch_idxs].view(
+                    2 * beam_size, ngram_keys.size(1), -1
+                )
+                bsz = 2
+            offsets = (torch.arange(bsz) * beam_size).unsqueeze(1)
+            order = (torch.randint(beam_size, (bsz, beam_size)) + offsets).view(-1)
+            tokens[:, : step + 1] = tokens[order, : step + 1]
+            ngram_keys[:, : step + 1] = ngram_keys[order, : step + 1]
+            tokens[:, step + 1] = torch.randint(
+                self.tgt_dict.eos(), vocab_size, (bsz * beam_size,)
+            )
+
+    def test_no_repeat_ngram(self):
+        for n in [1, 2, 3, 4]:
+            self._test_no_repeat_ngram(n)
+
+    def test_no_repeat_ngram_chunked_keys(self):
+        for n in [3, 4, 6]:
+            self._test_no_repeat_ngram(n, chunk_len=2)
+
+
 if __name__ == "__main__":
     unittest.main()
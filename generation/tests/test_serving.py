@@ -0,0 +1,91 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import asyncio
+import unittest
+
+from fairseq.serving import DynamicBatcher, ServingMetrics
+
+
+class TestDynamicBatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.batches = []
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def run_batch(self, items):
+        self.batches.append(list(items))
+        return [item.upper() for item in items]
+
+    def submit_all(self, batcher, items, delay=0.):
+
+        async def run():
+            batcher.start()
+            try:
+                futures = []
+                for item in items:
+                    futures.append(asyncio.ensure_future(batcher.submit(item)))
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                return await asyncio.gather(*futures, return_exceptions=True)
+            finally:
+                await batcher.close()
+
+        return self.loop.run_until_complete(run())
+
+    def test_results_match_requests(self):
+        items = ['a' * n for n in range(1, 20)]
+        batcher = DynamicBatcher(self.run_batch, max_sentences=4, max_latency=0.05)
+        results = self.submit_all(batcher, items)
+        self.assertEqual(results, [item.upper() for item in items])
+        self.assertTrue(all(len(batch) <= 4 for batch in self.batches))
+        self.assertEqual(sorted(sum(self.batches, [])), sorted(items))
+
+    def test_batches_by_length(self):
+        items = ['a', 'b' * 50, 'cc', 'd' * 51]
+        batcher = DynamicBatcher(self.run_batch, max_sentences=2, max_latency=0.05)
+        self.submit_all(batcher, items)
+        self.assertEqual(sorted(map(sorted, self.batches)), [['a', 'cc'], ['b' * 50, 'd' * 51]])
+
+    def test_max_tokens(self):
+        items = ['a' * 10] * 5
+        batcher = DynamicBatcher(self.run_batch, max_sentences=None, max_tokens=20, max_latency=0.05)
+        self.submit_all(batcher, items)
+        self.assertEqual([len(batch) for batch in self.batches], [2, 2, 1])
+
+    def test_max_latency(self):
+        # requests arriving after the window of the first one go in the next batch
+        batcher = DynamicBatcher(self.run_batch, max_sentences=8, max_latency=0.02)
+        self.submit_all(batcher, ['a', 'b', 'c'], delay=0.1)
+        self.assertEqual(self.batches, [['a'], ['b'], ['c']])
+
+    def test_failed_batch(self):
+
+        def run_batch(items):
+            raise ValueError('failed')
+
+        batcher = DynamicBatcher(run_batch, max_sentences=2, max_latency=0.01)
+        results = self.submit_all(batcher, ['a', 'b'])
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(batcher.metrics.num_errors, 2)
+
+    def test_metrics(self):
+        metrics = ServingMetrics()
+        batcher = DynamicBatcher(self.run_batch, max_sentences=4, max_latency=0.05, metrics=metrics)
+        self.submit_all(batcher, ['a'] * 8)
+        summary = metrics.summary()
+        self.assertEqual(summary['requests'], 8)
+        self.assertEqual(summary['batches'], 2)
+        self.assertEqual(summary['batch_size']['p50'], 4.)
+        self.assertEqual(summary['max_queue_depth'], 8)
+        self.assertEqual(summary['queue_depth'], 0)
+        self.assertLessEqual(summary['latency_ms']['p50'], summary['latency_ms']['p99'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,7 +3,10 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import os
+import tempfile
 import unittest
+from unittest import mock
 
 import torch
 
@@ -73,6 +76,52 @@ class TestTokenBlockDataset(unittest.TestCase):
         self.assertEqual(ds[1].tolist(), [5, 1, 1])
         self.assertEqual(ds[2].tolist(), [6, 1])
 
+    def test_block_index_cache(self):
+        data = [
+            torch.tensor([4, 3, 2, 1], dtype=torch.long),
+            torch.tensor([5, 1], dtype=torch.long),
+            torch.tensor([1], dtype=torch.long),
+            torch.tensor([6, 1], dtype=torch.long),
+        ]
+        with tempfile.TemporaryDirectory() as dirname:
+            cache_path = os.path.join(dirname, 'blocks.npz')
+            ds = self._build_dataset(
+                data, block_size=3, pad=0, eos=1, break_mode='complete', cache_path=cache_path,
+            )
+            self.assertTrue(os.path.exists(cache_path))
+
+            with mock.patch(
+                'fairseq.data.token_block_utils_fast._get_slice_indices_fast',
+                side_effect=AssertionError('block indices should be cached'),
+            ):
+                cached = self._build_dataset(
+                    data, block_size=3, pad=0, eos=1, break_mode='complete', cache_path=cache_path,
+                )
+            self.assertEqual([x.tolist() for x in cached], [x.tolist() for x in ds])
+            self.assertEqual(cached.sizes.tolist(), ds.sizes.tolist())
+
+            # another block size or break mode doesn't hit the cache
+            ds = self._build_dataset(
+                data, block_size=5, pad=0, eos=1, break_mode='complete', cache_path=cache_path,
+            )
+            self.assertEqual(ds[0].tolist(), [4, 3, 2, 1])
+            self.assertEqual(ds[1].tolist(), [5, 1, 1, 6, 1])
+            ds = self._build_dataset(
+                data, block_size=3, pad=0, eos=1, break_mode='eos', cache_path=cache_path,
+            )
+            self.assertEqual(len(ds), 4)
+
+            # same number and total of tokens, other sizes
+            ds = self._build_dataset(
+                data[::-1], block_size=3, pad=0, eos=1, break_mode='complete', cache_path=cache_path,
+            )
+            self.assertEqual(ds[0].tolist(), [6, 1, 1])
+            self.assertEqual(ds[1].tolist(), [5, 1])
+            ds = self._build_dataset(
+                data, block_size=3, pad=0, eos=1, break_mode='complete', cache_path=cache_path,
+            )
+            self.assertEqual(ds[1].tolist(), [5, 1, 1])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,45 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+from fairseq.data import Dictionary
+from fairseq.data.vocab_shortlist import (
+    count_tokens,
+    load_shortlist,
+    save_shortlist,
+    select_shortlist,
+)
+
+
+class TestVocabShortlist(unittest.TestCase):
+    def test_select_shortlist(self):
+        counts = np.array([0, 5, 90, 3, 0, 2])
+        self.assertEqual(select_shortlist(counts).tolist(), [2, 1, 3, 5])
+        self.assertEqual(select_shortlist(counts, coverage=0.9).tolist(), [2])
+        self.assertEqual(select_shortlist(counts, coverage=0.95).tolist(), [2, 1])
+        self.assertEqual(select_shortlist(counts, max_size=3).tolist(), [2, 1, 3])
+        self.assertEqual(select_shortlist(counts, min_count=3).tolist(), [2, 1, 3])
+
+    def test_save_and_load(self):
+        dictionary = Dictionary()
+        for symbol in ["a", "b", "c", "d"]:
+            dictionary.add_symbol(symbol)
+        dataset = [torch.LongTensor([4, 5, 5, 2]), torch.LongTensor([5, 7, 2])]
+        counts = count_tokens(dataset, len(dictionary))
+        self.assertEqual(counts[[2, 4, 5, 6, 7]].tolist(), [2, 1, 3, 0, 1])
+
+        ids = select_shortlist(counts)
+        with tempfile.TemporaryDirectory() as dirname:
+            path = os.path.join(dirname, "shortlist.txt")
+            save_shortlist(path, ids, counts, dictionary)
+            # the special symbols are always part of the shortlist
+            self.assertEqual(load_shortlist(path, dictionary).tolist(), [0, 1, 2, 3, 4, 5, 7])
+
+
+if __name__ == "__main__":
+    unittest.main()
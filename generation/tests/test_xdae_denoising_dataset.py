@@ -0,0 +1,251 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import argparse
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+
+from fairseq.data import (
+    AppendTokenDataset,
+    ListDataset,
+    MMapIndexedDataset,
+    PrependTokenDataset,
+    TokenBlockDataset,
+    WordStartsDataset,
+    XDAEDenoisingDataset,
+)
+from fairseq.data.indexed_dataset import index_file_path, MMapIndexedDatasetBuilder
+from fairseq.data.word_starts_dataset import make_word_starts
+
+import tests.utils as test_utils
+
+
+def noise_args(**kwargs):
+    args = argparse.Namespace(
+        mask=0.0,
+        mask_random=0.0,
+        insert=0.0,
+        rotate=0.0,
+        word_shuffle=0,
+        word_dropout=0,
+        word_blank=0,
+        permute_sentences=0.0,
+        bpe=None,
+        replace_length=-1,
+        mask_length='subword',
+        poisson_lambda=3.0,
+    )
+    for k, v in kwargs.items():
+        setattr(args, k, v)
+    return args
+
+
+class TestXDAEDenoisingDataset(unittest.TestCase):
+
+    def setUp(self):
+        self.vocab = test_utils.dummy_dictionary(100)
+        self.mask_idx = self.vocab.add_symbol('<mask>')
+        rng = np.random.RandomState(0)
+        self.data = []
+        for _ in range(50):
+            length = rng.randint(20, 80)
+            tokens = rng.randint(self.vocab.nspecial, 100, size=length)
+            tokens[rng.rand(length) < 0.1] = self.vocab.eos()
+            tokens[0] = self.vocab.bos()
+            tokens[-1] = self.vocab.eos()
+            self.data.append(torch.from_numpy(tokens))
+        self.word_starts = torch.from_numpy(
+            (rng.rand(len(self.vocab)) < 0.6).astype(np.uint8)
+        )
+
+    def _build_dataset(self, mask_whole_words=None, batched_noise=False, word_start_dataset=None, **kwargs):
+        dataset = ListDataset(self.data, np.array([len(x) for x in self.data]))
+        return XDAEDenoisingDataset(
+            dataset, dataset.sizes, self.vocab, self.mask_idx, mask_whole_words,
+            shuffle=False, seed=1, args=noise_args(**kwargs), batched_noise=batched_noise,
+            word_start_dataset=word_start_dataset,
+        )
+
+    def _build_mmap_dataset(self, prefix):
+        builder = MMapIndexedDatasetBuilder(prefix + '.bin', dtype=np.uint16)
+        for tokens in self.data:
+            builder.add_item(tokens)
+        builder.finalize(index_file_path(prefix))
+        make_word_starts(prefix, self.word_starts)
+        return MMapIndexedDataset(prefix), WordStartsDataset(prefix)
+
+    def _noised_sources(self, ds, bsz=8):
+        sources = []
+        for first in range(0, len(ds), bsz):
+            samples = [ds[i] for i in range(first, min(first + bsz, len(ds)))]
+            batch = ds.collater(samples)
+            ids = batch['id'].tolist()
+            for i, row in zip(ids, batch['net_input']['src_tokens']):
+                sources.append((i, row[row.ne(self.vocab.pad())]))
+        return [source for _, source in sorted(sources, key=lambda x: x[0])]
+
+    def _assert_fused_matches_by_stage(self, **kwargs):
+        for mask_whole_words in [None, self.word_starts]:
+            ds = self._build_dataset(mask_whole_words, **kwargs)
+            for i, tokens in enumerate(self.data):
+                torch.manual_seed(i)
+                np.random.seed(i)
+                expected = ds.add_noise_by_stage(tokens.clone())
+                torch.manual_seed(i)
+                np.random.seed(i)
+                self.assertTrue(torch.equal(ds.noising(tokens), expected))
+
+    def test_fused_noise_span_poisson(self):
+        for replace_length in [-1, 0, 1]:
+            self._assert_fused_matches_by_stage(
+                mask=0.3, mask_random=0.2, mask_length='span-poisson',
+                replace_length=replace_length, poisson_lambda=2.0,
+            )
+
+    def test_fused_noise_subword_and_word(self):
+        self._assert_fused_matches_by_stage(
+            mask=0.3, mask_random=0.3, mask_length='subword', replace_length=1,
+        )
+        self._assert_fused_matches_by_stage(
+            mask=0.4, mask_random=0.3, mask_length='word', replace_length=-1,
+        )
+
+    def test_fused_noise_all_stages(self):
+        self._assert_fused_matches_by_stage(
+            mask=0.3, mask_random=0.1, mask_length='span-poisson', replace_length=1,
+            insert=0.1, rotate=0.5, word_shuffle=3, word_dropout=0.1,
+            word_blank=0.1, permute_sentences=1.0,
+        )
+
+    def test_fused_noise_leaves_input_unchanged(self):
+        ds = self._build_dataset(
+            self.word_starts, mask=0.5, mask_random=0.5, mask_length='word', word_blank=0.5,
+        )
+        tokens = self.data[0]
+        original = tokens.clone()
+        ds.noising(tokens)
+        self.assertTrue(torch.equal(tokens, original))
+
+    def test_getitem_is_deterministic(self):
+        ds = self._build_dataset(
+            self.word_starts, mask=0.3, mask_length='span-poisson', replace_length=1,
+            word_shuffle=3, word_dropout=0.1, rotate=0.5,
+        )
+        torch.manual_seed(0)
+        first = [ds[i]['source'] for i in range(len(ds))]
+        torch.manual_seed(0)
+        second = [ds[i]['source'] for i in range(len(ds))]
+        for a, b in zip(first, second):
+            self.assertTrue(torch.equal(a, b))
+        for i, tokens in enumerate(self.data):
+            self.assertTrue(torch.equal(ds[i]['target'], tokens))
+
+    def test_batched_noise_is_reproducible(self):
+        kwargs = dict(
+            mask=0.3, mask_random=0.1, mask_length='span-poisson', replace_length=1,
+            insert=0.1, rotate=0.5, word_shuffle=3, word_dropout=0.1, word_blank=0.1,
+        )
+        ds = self._build_dataset(self.word_starts, batched_noise=True, **kwargs)
+        first = self._noised_sources(ds)
+        second = self._noised_sources(ds)
+        for a, b in zip(first, second):
+            self.assertTrue(torch.equal(a, b))
+            # collate drops the leading <bos>
+            self.assertEqual(a[-1], self.vocab.eos())
+        self.assertTrue(torch.equal(ds[0]['source'], self.data[0]))
+
+    def test_batched_noise_keeps_tokens_when_reordering(self):
+        ds = self._build_dataset(batched_noise=True, word_shuffle=3, rotate=1.0, replace_length=1)
+        for source, tokens in zip(self._noised_sources(ds), self.data):
+            self.assertEqual(source[-1], tokens[-1])
+            self.assertEqual(sorted(source.tolist()), sorted(tokens[1:].tolist()))
+
+    def test_batched_noise_matches_per_sample_rates(self):
+        for mask_length, replace_length in [('span-poisson', 1), ('span-poisson', -1), ('word', 0)]:
+            kwargs = dict(
+                mask=0.3, mask_random=0.1, mask_length=mask_length,
+                replace_length=replace_length, insert=0.1, word_dropout=0.1,
+            )
+            stats = []
+            for batched_noise in [False, True]:
+                ds = self._build_dataset(self.word_starts, batched_noise=batched_noise, **kwargs)
+                sources = self._noised_sources(ds)
+                stats.append((
+                    np.mean([len(s) for s in sources]),
+                    np.mean([s.eq(self.mask_idx).sum().item() for s in sources]),
+                ))
+            (length, masks), (batched_length, batched_masks) = stats
+            self.assertLess(abs(length - batched_length), 0.1 * length)
+            self.assertLess(abs(masks - batched_masks), 0.15 * masks + 1)
+
+    def test_batched_noise_mixed_whole_word_masks(self):
+        ds = self._build_dataset(
+            self.word_starts, batched_noise=True, mask=0.5, mask_length='word', replace_length=1,
+        )
+        no_wwm = self._build_dataset(None, batched_noise=True, mask=0.5, mask_length='word', replace_length=1)
+        samples = [ds[0], no_wwm[1], ds[2], no_wwm[3]]
+        self.assertIs(samples[0]['mask_whole_word'], self.word_starts)
+        self.assertIsNone(samples[1]['mask_whole_word'])
+        batch = ds.collater(samples)
+        self.assertEqual(batch['id'].numel(), 4)
+        self.assertTrue(batch['net_input']['src_tokens'].eq(self.mask_idx).any())
+
+    def test_word_start_sidecar(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            prefix = os.path.join(dirname, 'train')
+            dataset, word_starts = self._build_mmap_dataset(prefix)
+            self.assertEqual(len(word_starts), len(dataset))
+            for tokens, starts in zip(dataset, word_starts):
+                self.assertTrue(torch.equal(starts, self.word_starts[tokens]))
+            self.assertTrue(word_starts.matches(self.word_starts))
+            self.assertTrue(word_starts.matches(torch.cat([self.word_starts, self.word_starts])))
+            self.assertFalse(word_starts.matches(1 - self.word_starts))
+
+            # the sidecar follows the blocks and special tokens of the tokens
+            blocks = TokenBlockDataset(
+                dataset, dataset.sizes, 64, pad=self.vocab.pad(), eos=self.vocab.eos(),
+                break_mode='complete',
+            )
+            block_starts = blocks.aligned(word_starts)
+            blocks = AppendTokenDataset(PrependTokenDataset(blocks, self.mask_idx), self.vocab.eos())
+            block_starts = AppendTokenDataset(
+                PrependTokenDataset(block_starts, int(self.word_starts[self.mask_idx])),
+                int(self.word_starts[self.vocab.eos()]),
+            )
+            for tokens, starts in zip(blocks, block_starts):
+                self.assertTrue(torch.equal(starts, self.word_starts[tokens]))
+            del dataset, word_starts
+
+    def test_word_start_sidecar_noise(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            _, word_starts = self._build_mmap_dataset(os.path.join(dirname, 'train'))
+            kwargs = dict(
+                mask=0.3, mask_random=0.1, mask_length='span-poisson', replace_length=1,
+                insert=0.1, word_shuffle=3, permute_sentences=1.0,
+            )
+            ds = self._build_dataset(self.word_starts, **kwargs)
+            sidecar_ds = self._build_dataset(self.word_starts, word_start_dataset=word_starts, **kwargs)
+            torch.manual_seed(0)
+            expected = [ds[i]['source'] for i in range(len(ds))]
+            torch.manual_seed(0)
+            for i, source in enumerate(expected):
+                self.assertTrue(torch.equal(sidecar_ds[i]['source'], source))
+
+            kwargs['permute_sentences'] = 0.0
+            ds = self._build_dataset(self.word_starts, batched_noise=True, **kwargs)
+            sidecar_ds = self._build_dataset(
+                self.word_starts, batched_noise=True, word_start_dataset=word_starts, **kwargs
+            )
+            for a, b in zip(self._noised_sources(ds), self._noised_sources(sidecar_ds)):
+                self.assertTrue(torch.equal(a, b))
+            del word_starts
+
+
+if __name__ == '__main__':
+    unittest.main()
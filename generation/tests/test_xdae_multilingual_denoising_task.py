@@ -0,0 +1,143 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+
+from fairseq import options, tasks
+from fairseq.data import Dictionary, iterators
+from fairseq.data.indexed_dataset import index_file_path, MMapIndexedDatasetBuilder
+
+
+LANGS = ['en', 'fr']
+
+
+def create_sampled_data(data_dir, num_shards=2, num_sentences=100):
+    vocab = Dictionary()
+    for i in range(50):
+        vocab.add_symbol('w{}'.format(i))
+    vocab.save(os.path.join(data_dir, 'dict.txt'))
+    rng = np.random.RandomState(0)
+    for lang in LANGS:
+        for shard in range(num_shards):
+            prefix = os.path.join(data_dir, 'train.{}.{}'.format(shard, lang))
+            builder = MMapIndexedDatasetBuilder(prefix + '.bin', dtype=np.uint16)
+            for _ in range(num_sentences):
+                tokens = rng.randint(vocab.nspecial, len(vocab), size=rng.randint(5, 30))
+                tokens[-1] = vocab.eos()
+                builder.add_item(torch.from_numpy(tokens))
+            builder.finalize(index_file_path(prefix))
+
+
+def setup_task(data_dir, extra_args=None):
+    parser = options.get_training_parser()
+    args = options.parse_args_and_arch(parser, [
+        data_dir,
+        '--task', 'xdae_multilingual_denoising',
+        '--arch', 'bart_base',
+        '--sampled-data',
+        '--tokens-per-sample', '64',
+        '--sample-break-mode', 'complete',
+        '--mask', '0.3',
+        '--replace-length', '1',
+        '--max-tokens', '1000',
+    ] + (extra_args or []))
+    return tasks.setup_task(args)
+
+
+class TestXDAEMultilingualDenoisingTask(unittest.TestCase):
+
+    def test_languages_from_shards(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            create_sampled_data(data_dir)
+            task = setup_task(data_dir, ['--no-shard-prefetch'])
+            task.load_dataset('train', epoch=1)
+            self.assertEqual(sorted(task.get_languages(data_dir)), LANGS)
+
+    def test_reload_reuses_datasets_and_block_cache(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            create_sampled_data(data_dir)
+            task = setup_task(data_dir, ['--langs', ','.join(LANGS), '--no-shard-prefetch'])
+            task.load_dataset('train', epoch=1)
+            previous = dict(task.lang_dataset_cache['train'])
+            for path, _ in previous:
+                self.assertTrue(os.path.exists(path + '.blocks.64.complete.npz'))
+
+            for epoch in range(2, 6):
+                task.load_dataset('train', epoch=epoch)
+                paths = task.get_dataset_path('train', data_dir, epoch, LANGS)
+                cached = task.lang_dataset_cache['train']
+                self.assertEqual(sorted(cached), sorted((paths[lang], lang) for lang in LANGS))
+                for key, dataset in cached.items():
+                    if key in previous:
+                        self.assertIs(dataset, previous[key])
+                previous = dict(cached)
+                self.assertEqual(
+                    len(task.dataset('train')), sum(len(d) for d in cached.values())
+                )
+                task.dataset('train')[0]
+
+    def test_next_epoch_shards_are_prefetched(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            create_sampled_data(data_dir, num_shards=3)
+            task = setup_task(data_dir, ['--langs', ','.join(LANGS)])
+            for epoch in range(1, 5):
+                task.load_dataset('train', epoch=epoch)
+                current = task.lang_dataset_cache['train']
+                _, thread, prefetched = task.shard_prefetch['train']
+                thread.join()
+                paths = task.get_dataset_path('train', data_dir, epoch + 1, LANGS)
+                expected = {(paths[lang], lang) for lang in LANGS} - set(current)
+                self.assertEqual(set(prefetched), expected)
+
+                prefetched = dict(prefetched)
+                task.load_dataset('train', epoch=epoch + 1)
+                for key, dataset in prefetched.items():
+                    self.assertIs(task.lang_dataset_cache['train'][key], dataset)
+            task.shard_prefetch['train'][1].join()
+
+            task = setup_task(data_dir, ['--langs', ','.join(LANGS), '--no-shard-prefetch'])
+            task.load_dataset('train', epoch=1)
+            self.assertEqual(task.shard_prefetch, {})
+
+    def test_streaming_sampler(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            create_sampled_data(data_dir)
+            task = setup_task(data_dir, [
+                '--langs', ','.join(LANGS), '--no-shard-prefetch',
+                '--streaming-sampler', '--streaming-chunk-size', '16',
+            ])
+            task.load_dataset('train', epoch=1)
+            dataset = task.dataset('train')
+            epoch_itr = task.get_batch_iterator(
+                dataset, max_tokens=1000, max_positions=(64, 64), ignore_invalid_inputs=True,
+            )
+            self.assertIsInstance(epoch_itr, iterators.TemperatureSampledEpochBatchIterator)
+            self.assertIs(task.get_batch_iterator(dataset, max_tokens=1000), epoch_itr)
+            num_samples = 0
+            for batch in epoch_itr.next_epoch_itr():
+                self.assertLessEqual(batch['net_input']['src_tokens'].numel(), 1000)
+                num_samples += batch['id'].numel()
+            self.assertEqual(num_samples, len(dataset))
+
+    def test_block_cache_dir(self):
+        with tempfile.TemporaryDirectory() as data_dir, \
+                tempfile.TemporaryDirectory() as cache_dir:
+            create_sampled_data(data_dir)
+            task = setup_task(data_dir, [
+                '--langs', ','.join(LANGS), '--block-cache-dir', cache_dir, '--no-shard-prefetch',
+            ])
+            task.load_dataset('train', epoch=1)
+            self.assertFalse(any(name.endswith('.npz') for name in os.listdir(data_dir)))
+            cached = [name for _, _, names in os.walk(cache_dir) for name in names]
+            self.assertEqual(len(cached), len(LANGS))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# coding=utf-8
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+""" Benchmarking the collection of evaluation predictions: np.append against PredictionBuffer """
+
+import argparse
+import timeit
+
+import numpy as np
+import torch
+
+from transformers import PredictionBuffer
+
+
+def collect_with_append(batches):
+    preds = None
+    out_label_ids = None
+    for logits, labels in batches:
+        if preds is None:
+            preds = logits.detach().cpu().numpy()
+            out_label_ids = labels.detach().cpu().numpy()
+        else:
+            preds = np.append(preds, logits.detach().cpu().numpy(), axis=0)
+            out_label_ids = np.append(out_label_ids, labels.detach().cpu().numpy(), axis=0)
+    return np.argmax(preds, axis=-1), out_label_ids
+
+
+def collect_with_buffer(batches, num_examples):
+    buffer = PredictionBuffer(num_examples, reduce="argmax")
+    for logits, labels in batches:
+        buffer.add(logits, labels)
+    return buffer.preds, buffer.labels
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes", default="1000,5000,10000,20000,50000", type=str, help="Evaluation set sizes, separated by ,"
+    )
+    parser.add_argument("--batch_size", default=32, type=int, help="Evaluation batch size")
+    parser.add_argument(
+        "--label_shape", default="2", type=str, help="Shape of the logits of an example, e.g. 128,9 for NER"
+    )
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu", type=str)
+    parser.add_argument("--repeat", default=3, type=int, help="Best time out of this many runs")
+    args = parser.parse_args()
+
+    label_shape = tuple(int(d) for d in args.label_shape.split(","))
+    print("{:>10} {:>14} {:>14} {:>18} {:>18}".format("examples", "append (s)", "buffer (s)", "append (us/ex)", "buffer (us/ex)"))
+    for size in [int(s) for s in args.sizes.split(",")]:
+        batches = []
+        for start in range(0, size, args.batch_size):
+            batch_size = min(args.batch_size, size - start)
+            logits = torch.randn((batch_size,) + label_shape, device=args.device)
+            labels = torch.randint(label_shape[-1], (batch_size,) + label_shape[:-1], device=args.device)
+            batches.append((logits, labels))
+
+        append_preds, append_labels = collect_with_append(batches)
+        buffer_preds, buffer_labels = collect_with_buffer(batches, size)
+        assert np.array_equal(append_preds, buffer_preds) and np.array_equal(append_labels, buffer_labels)
+
+        append_time = min(timeit.repeat(lambda: collect_with_append(batches), number=1, repeat=args.repeat))
+        buffer_time = min(timeit.repeat(lambda: collect_with_buffer(batches, size), number=1, repeat=args.repeat))
+        print(
+            "{:>10} {:>14.4f} {:>14.4f} {:>18.2f} {:>18.2f}".format(
+                size, append_time, buffer_time, append_time / size * 1e6, buffer_time / size * 1e6
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -45,13 +45,17 @@ from transformers import (
     DistilBertConfig,
     DistilBertForTokenClassification,
     DistilBertTokenizer,
+    PredictionBuffer,
     RobertaConfig,
     RobertaForTokenClassification,
     RobertaTokenizer,
+    SharedCache,
     XLMRobertaConfig,
     XLMRobertaForTokenClassification,
     XLMRobertaTokenizer,
+    file_signature,
     get_linear_schedule_with_warmup,
+    tokenizer_signature,
 )
 from utils_ner import convert_examples_to_features, get_labels, read_examples_from_file
 
@@ -342,8 +346,7 @@ def evaluate(args, model, tokenizer, labels, pad_token_label_id, prefix=""):
         logger.info("  Batch size = %d", args.eval_batch_size)
         eval_loss = 0.0
         nb_eval_steps = 0
-        preds = None
-        out_label_ids = None
+        buffer = PredictionBuffer(len(eval_sampler), reduce="argmax")
         model.eval()
         for batch in tqdm(eval_dataloader, desc="Evaluating"):
             batch = tuple(t.to(args.device) for t in batch)
@@ -362,15 +365,11 @@ def evaluate(args, model, tokenizer, labels, pad_token_label_id, prefix=""):
 
                 eval_loss += tmp_eval_loss.item()
             nb_eval_steps += 1
-            if preds is None:
-                preds = logits.detach().cpu().numpy()
-                out_label_ids = inputs["labels"].detach().cpu().numpy()
-            else:
-                preds = np.append(preds, logits.detach().cpu().numpy(), axis=0)
-                out_label_ids = np.append(out_label_ids, inputs["labels"].detach().cpu().numpy(), axis=0)
+            buffer.add(logits, inputs["labels"])
 
         eval_loss = eval_loss / nb_eval_steps
-        preds = np.argmax(preds, axis=2)
+        preds = buffer.preds
+        out_label_ids = buffer.labels
 
         label_map = {i: label for i, label in enumerate(labels)}
 
@@ -419,7 +418,26 @@ def load_and_cache_examples(args, tokenizer, labels, pad_token_label_id, mode="t
             mode, list(filter(None, args.model_name_or_path.split("/"))).pop(), str(args.max_seq_length), lang
         ),
     )
-    if os.path.exists(cached_features_file) and not args.overwrite_cache:
+    shared_cache = None
+    if args.shared_cache_dir is not None:
+        shared_cache = SharedCache(args.shared_cache_dir, max_size=int(args.shared_cache_size * 1e9), suffix=".ner")
+        cache_key = shared_cache.key(
+            mode=mode,
+            lang=lang,
+            max_seq_length=args.max_seq_length,
+            model_type=args.model_type,
+            labels=labels,
+            pad_token_label_id=pad_token_label_id,
+            tokenizer=tokenizer_signature(tokenizer),
+            data=file_signature(os.path.join(args.data_dir, "{}.{}".format(lang, mode))),
+        )
+        cached_features_file = shared_cache.path(cache_key)
+
+    if (
+        os.path.exists(cached_features_file)
+        and not args.overwrite_cache
+        and (shared_cache is None or shared_cache.lookup(cache_key) is not None)
+    ):
         logger.info("Loading features from cached file %s", cached_features_file)
         features = torch.load(cached_features_file)
     else:
@@ -446,7 +464,10 @@ def load_and_cache_examples(args, tokenizer, labels, pad_token_label_id, mode="t
         )
         if args.local_rank in [-1, 0]:
             logger.info("Saving features into cached file %s", cached_features_file)
-            torch.save(features, cached_features_file)
+            if shared_cache is not None:
+                shared_cache.store(cache_key, lambda path: torch.save(features, path))
+            else:
+                torch.save(features, cached_features_file)
 
     if args.local_rank == 0 and not evaluate:
         torch.distributed.barrier()  # Make sure only the first process in distributed training process the dataset, and the others will use the cache
@@ -607,6 +628,16 @@ def main():
     parser.add_argument(
         "--overwrite_cache", action="store_true", help="Overwrite the cached training and evaluation sets"
     )
+    parser.add_argument(
+        "--shared_cache_dir",
+        default=None,
+        type=str,
+        help="Directory of a features cache shared by tasks and runs, keyed by the data files, the tokenizer and the "
+        "conversion parameters. Replaces the cache files of the data directory.",
+    )
+    parser.add_argument(
+        "--shared_cache_size", default=50.0, type=float, help="Maximum size of the shared features cache, in GB."
+    )
     parser.add_argument("--seed", type=int, default=42, help="random seed for initialization")
 
     parser.add_argument(
@@ -27,7 +27,7 @@ import copy
 
 import numpy as np
 import torch
-from torch.utils.data import DataLoader, RandomSampler, SequentialSampler, TensorDataset, ConcatDataset
+from torch.utils.data import DataLoader, RandomSampler, SequentialSampler, ConcatDataset
 from torch.utils.data.distributed import DistributedSampler
 from tqdm import tqdm, trange
 
@@ -52,6 +52,10 @@ from transformers import xglue_convert_examples_to_features as convert_examples_
 from transformers import xglue_compute_metrics as compute_metrics
 from transformers import xglue_output_modes as output_modes
 from transformers import xglue_processors as processors
+from transformers import load_features_cache, save_features_cache
+from transformers import SharedCache, directory_signature, tokenizer_signature
+from transformers import ConcatFeaturesDataset, DevicePrefetcher, FeaturesDataset, LengthGroupedSampler, PadCollator, SortedSampler, get_lengths
+from transformers import PredictionBuffer, write_predictions
 
 
 try:
@@ -89,8 +93,14 @@ def train(args, train_dataset, model, tokenizer):
         log_writer = open(os.path.join(args.output_dir, "evaluate_logs.txt"), 'w')
 
     args.train_batch_size = args.per_gpu_train_batch_size * max(1, args.n_gpu)
-    train_sampler = RandomSampler(train_dataset) if args.local_rank == -1 else DistributedSampler(train_dataset)
-    train_dataloader = DataLoader(train_dataset, sampler=train_sampler, batch_size=args.train_batch_size)
+    if args.pad_to_max_length:
+        train_sampler = RandomSampler(train_dataset) if args.local_rank == -1 else DistributedSampler(train_dataset)
+        train_dataloader = DataLoader(
+            train_dataset, sampler=train_sampler, batch_size=args.train_batch_size, collate_fn=get_collator(tokenizer)
+        )
+    else:
+        train_sampler = LengthGroupedSampler(get_lengths(train_dataset), args.train_batch_size)
+        train_dataloader = DataLoader(train_dataset, batch_sampler=train_sampler, collate_fn=get_collator(tokenizer))
 
     if args.max_steps > 0:
         t_total = args.max_steps
@@ -186,7 +196,9 @@ def train(args, train_dataset, model, tokenizer):
         tb_writer.add_scalar("loss", (tr_loss - logging_loss) / args.logging_steps, global_step)
         return results
 
-    for _ in train_iterator:
+    for epoch in train_iterator:
+        if hasattr(train_sampler, "set_epoch"):
+            train_sampler.set_epoch(epoch)
         epoch_iterator = tqdm(train_dataloader, desc="Iteration", disable=args.local_rank not in [-1, 0])
         for step, batch in enumerate(epoch_iterator):
             # Skip past any already trained steps if resuming training
@@ -274,6 +286,61 @@ def train(args, train_dataset, model, tokenizer):
 
     return global_step, tr_loss / (global_step + 1)
 
+def predict_datasets(args, model, tokenizer, eval_task, eval_datasets, prefix=""):
+    """
+    Predicts the labels of all the (split, lang) datasets of ``eval_datasets`` in a single pass: their features are
+    concatenated and sorted by length together, so that small languages do not each pay for a separate loop.
+    Returns the predictions, labels and guids of each dataset, in the order of ``eval_datasets``.
+    """
+    datasets, all_guids = [], []
+    for split, lang in eval_datasets:
+        dataset, guids = load_and_cache_examples(args, eval_task, tokenizer, lang, split=split)
+        datasets.append(dataset)
+        all_guids.append(np.array(guids))
+    eval_dataset = ConcatFeaturesDataset(datasets)
+
+    args.eval_batch_size = args.per_gpu_eval_batch_size * max(1, args.n_gpu)
+    # Note that DistributedSampler samples randomly
+    if args.pad_to_max_length:
+        eval_sampler = SequentialSampler(eval_dataset)
+    else:
+        eval_sampler = SortedSampler(get_lengths(eval_dataset))
+    eval_dataloader = DataLoader(
+        eval_dataset,
+        sampler=eval_sampler,
+        batch_size=args.eval_batch_size,
+        collate_fn=get_collator(tokenizer),
+        pin_memory=args.device.type == "cuda",
+    )
+
+    # Eval!
+    logger.info("***** Running evaluation {} *****".format(prefix))
+    logger.info("  Languages = %s", ",".join("{0}-{1}".format(split, lang) for split, lang in eval_datasets))
+    logger.info("  Num examples = %d", len(eval_dataset))
+    logger.info("  Batch size = %d", args.eval_batch_size)
+    if args.output_mode != "classification":
+        raise ValueError("No other `output_mode` for XGLUE.")
+    # The batches are sampled out of order, their indices in the concatenation put them back in place
+    buffer = PredictionBuffer(len(eval_dataset), reduce="argmax")
+    model.eval()
+    for batch in tqdm(DevicePrefetcher(eval_dataloader, args.device), desc="Evaluating"):
+        with torch.no_grad():
+            inputs = {"input_ids": batch[0], "attention_mask": batch[1]}
+            if args.model_type != "distilbert":
+                inputs["token_type_ids"] = (
+                    batch[2] if args.model_type in ["bert"] else None
+                )  # XLM and DistilBERT don't use segment_ids
+            outputs = model(**inputs)
+            logits = outputs[0]
+        buffer.add(logits, batch[3], indices=batch[4])
+
+    offsets = eval_dataset.offsets
+    return [
+        (buffer.preds[offsets[i] : offsets[i + 1]], buffer.labels[offsets[i] : offsets[i + 1]], all_guids[i])
+        for i in range(len(eval_datasets))
+    ]
+
+
 def predict(args, model, tokenizer, label_list, prefix="", single_gpu=False, verbose=True):
     if single_gpu:
         args = copy.deepcopy(args)
@@ -292,65 +359,22 @@ def predict(args, model, tokenizer, label_list, prefix="", single_gpu=False, ver
     # leave interface for multi-task evaluation
     eval_task = eval_task_names[0]
     eval_output_dir = eval_outputs_dirs[0]
+    if not os.path.exists(eval_output_dir) and args.local_rank in [-1, 0]:
+        os.makedirs(eval_output_dir)
 
     # multi-gpu eval
     if args.n_gpu > 1:
         model = torch.nn.DataParallel(model)
 
-    for split, lang in eval_datasets:
-        task_name = "{0}-{1}".format(split, lang)
-        eval_dataset, guids = load_and_cache_examples(args, eval_task, tokenizer, lang, split=split)
-        if not os.path.exists(eval_output_dir) and args.local_rank in [-1, 0]:
-            os.makedirs(eval_output_dir)
-
-        args.eval_batch_size = args.per_gpu_eval_batch_size * max(1, args.n_gpu)
-        # Note that DistributedSampler samples randomly
-        eval_sampler = SequentialSampler(eval_dataset)
-        eval_dataloader = DataLoader(eval_dataset, sampler=eval_sampler, batch_size=args.eval_batch_size)
-
-        # Eval!
-        logger.info("***** Running evaluation {} *****".format(prefix))
-        logger.info("  Num examples = %d", len(eval_dataset))
-        logger.info("  Batch size = %d", args.eval_batch_size)
-        eval_loss = 0.0
-        nb_eval_steps = 0
-        preds = None
-        out_label_ids = None
-        guids = np.array(guids)
-        for batch in tqdm(eval_dataloader, desc="Evaluating"):
-            model.eval()
-            batch = tuple(t.to(args.device) for t in batch)
-            with torch.no_grad():
-                inputs = {"input_ids": batch[0], "attention_mask": batch[1]}
-                if args.model_type != "distilbert":
-                    inputs["token_type_ids"] = (
-                        batch[2] if args.model_type in ["bert"] else None
-                    )  # XLM and DistilBERT don't use segment_ids
-                outputs = model(**inputs)
-                logits = outputs[0]
-
-            nb_eval_steps += 1
-            if preds is None:
-                preds = logits.detach().cpu().numpy()
-            else:
-                preds = np.append(preds, logits.detach().cpu().numpy(), axis=0)
-
-        if args.output_mode == "classification":
-            preds = np.argmax(preds, axis=1)
-        else:
-            raise ValueError("No other `output_mode` for XGLUE.")
+    predictions = predict_datasets(args, model, tokenizer, eval_task, eval_datasets, prefix=prefix)
+    for (split, lang), (preds, _, _) in zip(eval_datasets, predictions):
         results[lang] = preds
 
     for lang in results.keys():
         output_eval_file = os.path.join(eval_output_dir, prefix, "{}.prediction".format(lang))
-        with open(output_eval_file, "w") as writer:
-            logger.info("***** Eval results {} *****".format(prefix))
-            print("results:", results)
-            for item in results[lang]:
-                writer.write(str(label_list[item]) + "\n")
-
-
-
+        logger.info("***** Eval results {} *****".format(prefix))
+        print("results:", results)
+        write_predictions(output_eval_file, results[lang], lambda item: str(label_list[item]))
 
 
 def evaluate(args, model, tokenizer, prefix="", single_gpu=False, verbose=True):
@@ -371,59 +395,17 @@ def evaluate(args, model, tokenizer, prefix="", single_gpu=False, verbose=True):
     # leave interface for multi-task evaluation
     eval_task = eval_task_names[0]
     eval_output_dir = eval_outputs_dirs[0]
+    if not os.path.exists(eval_output_dir) and args.local_rank in [-1, 0]:
+        os.makedirs(eval_output_dir)
 
     # multi-gpu eval
     if args.n_gpu > 1:
         model = torch.nn.DataParallel(model)
 
-    for split, lang in eval_datasets:
+    predictions = predict_datasets(args, model, tokenizer, eval_task, eval_datasets, prefix=prefix)
+    for (split, lang), (preds, labels, guids) in zip(eval_datasets, predictions):
         task_name = "{0}-{1}".format(split, lang)
-        eval_dataset, guids = load_and_cache_examples(args, eval_task, tokenizer, lang, split=split)
-        if not os.path.exists(eval_output_dir) and args.local_rank in [-1, 0]:
-            os.makedirs(eval_output_dir)
-
-        args.eval_batch_size = args.per_gpu_eval_batch_size * max(1, args.n_gpu)
-        # Note that DistributedSampler samples randomly
-        eval_sampler = SequentialSampler(eval_dataset)
-        eval_dataloader = DataLoader(eval_dataset, sampler=eval_sampler, batch_size=args.eval_batch_size)
-
-        # Eval!
-        logger.info("***** Running evaluation {} *****".format(prefix))
-        logger.info("  Num examples = %d", len(eval_dataset))
-        logger.info("  Batch size = %d", args.eval_batch_size)
-        eval_loss = 0.0
-        nb_eval_steps = 0
-        preds = None
-        out_label_ids = None
-        guids = np.array(guids)
-        for batch in tqdm(eval_dataloader, desc="Evaluating"):
-            model.eval()
-            batch = tuple(t.to(args.device) for t in batch)
-            with torch.no_grad():
-                inputs = {"input_ids": batch[0], "attention_mask": batch[1], "labels": batch[3]}
-                if args.model_type != "distilbert":
-                    inputs["token_type_ids"] = (
-                        batch[2] if args.model_type in ["bert"] else None
-                    )  # XLM and DistilBERT don't use segment_ids
-                outputs = model(**inputs)
-                tmp_eval_loss, logits = outputs[:2]
-
-                eval_loss += tmp_eval_loss.mean().item()
-            nb_eval_steps += 1
-            if preds is None:
-                preds = logits.detach().cpu().numpy()
-                out_label_ids = inputs["labels"].detach().cpu().numpy()
-            else:
-                preds = np.append(preds, logits.detach().cpu().numpy(), axis=0)
-                out_label_ids = np.append(out_label_ids, inputs["labels"].detach().cpu().numpy(), axis=0)
-
-        eval_loss = eval_loss / nb_eval_steps
-        if args.output_mode == "classification":
-            preds = np.argmax(preds, axis=1)
-        else:
-            raise ValueError("No other `output_mode` for XGLUE.")
-        result = compute_metrics(eval_task, preds, out_label_ids, guids)
-        results[task_name] = result
+        results[task_name] = compute_metrics(eval_task, preds, labels, guids)
 
     results["valid_avg"] = average_dic([value for key, value in results.items() if key.startswith("valid")])
 
@@ -455,9 +437,13 @@ def average_dic(dic_list):
     return dic_sum
 
 
+def get_collator(tokenizer):
+    return PadCollator(pad_token=tokenizer.convert_tokens_to_ids([tokenizer.pad_token])[0], pad_token_segment_id=0)
+
+
 def load_and_cache_examples(args, task, tokenizer, language, split="train"):
     assert split in ["train", "valid", "test"]
-    if args.local_rank not in [-1, 0] and evaluate == "train":
+    if args.local_rank not in [-1, 0] and split == "train":
         torch.distributed.barrier()  # Make sure only the first process in distributed training process the dataset, and the others will use the cache
 
     processor = processors[task](language=language, train_language=language)
@@ -476,9 +462,30 @@ def load_and_cache_examples(args, task, tokenizer, language, split="train"):
             str(language),
         ),
     )
-    if os.path.exists(cached_features_file) and not args.overwrite_cache:
+    fingerprint = {
+        "split": split,
+        "task": task,
+        "language": language,
+        "max_seq_length": args.max_seq_length,
+        "tokenizer": type(tokenizer).__name__,
+        "vocab_size": len(tokenizer),
+        "pad_to_max_length": args.pad_to_max_length,
+    }
+    shared_cache = None
+    if args.shared_cache_dir is not None:
+        shared_cache = SharedCache(args.shared_cache_dir, max_size=int(args.shared_cache_size * 1e9))
+        cache_key = shared_cache.key(
+            features=fingerprint,
+            tokenizer=tokenizer_signature(tokenizer),
+            data=directory_signature(args.data_dir),
+            pad_token=tokenizer.convert_tokens_to_ids([tokenizer.pad_token])[0],
+        )
+        cached_features_file = shared_cache.path(cache_key)
+    cache = None
+    if not args.overwrite_cache and (shared_cache is None or shared_cache.lookup(cache_key) is not None):
+        cache = load_features_cache(cached_features_file, fingerprint)
+    if cache is not None:
         logger.info("Loading features from cached file %s", cached_features_file)
-        features = torch.load(cached_features_file)
     else:
         logger.info("Creating features from dataset file at %s", args.data_dir)
         label_list = processor.get_labels()
@@ -498,25 +505,29 @@ def load_and_cache_examples(args, task, tokenizer, language, split="train"):
             pad_on_left=False,
             pad_token=tokenizer.convert_tokens_to_ids([tokenizer.pad_token])[0],
             pad_token_segment_id=0,
+            pad_to_max_length=args.pad_to_max_length,
+            threads=args.threads,
+            return_arrays=True,
         )
         if args.local_rank in [-1, 0]:
             logger.info("Saving features into cached file %s", cached_features_file)
-            torch.save(features, cached_features_file)
+            if shared_cache is not None:
+                shared_cache.store(cache_key, lambda path: save_features_cache(features, path, fingerprint))
+            else:
+                save_features_cache(features, cached_features_file, fingerprint)
+            cache = load_features_cache(cached_features_file, fingerprint)
+        else:
+            cache = features
 
-    if args.local_rank == 0 and not evaluate:
+    if args.local_rank == 0 and split == "train":
         torch.distributed.barrier()  # Make sure only the first process in distributed training process the dataset, and the others will use the cache
 
-    # Convert to Tensors and build dataset
-    all_input_ids = torch.tensor([f.input_ids for f in features], dtype=torch.long)
-    all_attention_mask = torch.tensor([f.attention_mask for f in features], dtype=torch.long)
-    all_token_type_ids = torch.tensor([f.token_type_ids for f in features], dtype=torch.long)
-    all_guids = [f.guid for f in features]
+    # Build the dataset over the memory-mapped arrays, without copying them
+    all_guids = [guid.decode("utf-8") for guid in cache["guids"]]
     if output_mode == "classification" and (not split == "test") :
-        all_labels = torch.tensor([f.label for f in features], dtype=torch.long)
+        dataset = FeaturesDataset(cache)
     else:
-        all_labels = torch.tensor([0 for f in features], dtype=torch.long)
-
-    dataset = TensorDataset(all_input_ids, all_attention_mask, all_token_type_ids, all_labels)
+        dataset = FeaturesDataset(cache, labels=torch.zeros(len(all_guids), dtype=torch.long))
     return dataset, all_guids
 
 
@@ -606,6 +617,13 @@ def main():
         help="The maximum total input sequence length after tokenization. Sequences longer "
         "than this will be truncated, sequences shorter will be padded.",
     )
+    parser.add_argument("--threads", type=int, default=1, help="multiple threads for converting example to features")
+    parser.add_argument(
+        "--pad_to_max_length",
+        action="store_true",
+        help="Pad all sequences to max_seq_length instead of padding each batch to its longest sequence "
+        "and batching sequences of similar lengths together.",
+    )
     parser.add_argument("--do_train", action="store_true", help="Whether to run training.")
     parser.add_argument("--do_eval", action="store_true", help="Whether to run eval on the test set.")
     parser.add_argument("--do_predict", action="store_true", help="Whether to run prediction on the test set.")
@@ -658,6 +676,16 @@ def main():
     parser.add_argument(
         "--overwrite_cache", action="store_true", help="Overwrite the cached training and evaluation sets"
     )
+    parser.add_argument(
+        "--shared_cache_dir",
+        default=None,
+        type=str,
+        help="Directory of a features cache shared by tasks and runs, keyed by the data files, the tokenizer and the "
+        "conversion parameters. Replaces the cache files of the data directory.",
+    )
+    parser.add_argument(
+        "--shared_cache_size", default=50.0, type=float, help="Maximum size of the shared features cache, in GB."
+    )
     parser.add_argument("--seed", type=int, default=42, help="random seed for initialization")
 
     parser.add_argument(
@@ -41,6 +41,7 @@ from transformers import (
     DistilBertConfig,
     DistilBertForSequenceClassification,
     DistilBertTokenizer,
+    PredictionBuffer,
     XLMConfig,
     XLMForSequenceClassification,
     XLMTokenizer,
@@ -49,6 +50,7 @@ from transformers import (
     XLMRobertaForMultiTaskSequenceClassification,
 
     XLMRobertaTokenizer,
+    MultiTaskLoader,
     get_linear_schedule_with_warmup,
 )
 from transformers import xglue_convert_examples_to_features as convert_examples_to_features
@@ -93,28 +95,6 @@ def set_seed(args):
     if args.n_gpu > 0:
         torch.cuda.manual_seed_all(args.seed)
 
-def merge_dataset(dataset_list, dataset_size, task_ratio):
-    iterators = [iter(d) for d in dataset_list]
-    i = 0
-    n = len(dataset_list)
-    probs = [float(item)/sum(dataset_size) for item in dataset_size]
-    probs = [item**task_ratio for item in probs]
-    probs = [float(item)/sum(probs) for item in probs]
-    while True:
-        try:
-            r = random.random()
-            i = 0
-            while(r >= 0 and i < len(probs)):
-                r -= probs[i]
-                i += 1
-            i -= 1
-            item = next(iterators[i])
-        except StopIteration:
-            iterators[i] = iter(dataset_list[i])
-            item = next(iterators[i])
-        yield i, item
-
-
 def train(args, train_dataset_list, model, tokenizer):
     """ Train the model """
     if args.local_rank in [-1, 0]:
@@ -122,14 +102,20 @@ def train(args, train_dataset_list, model, tokenizer):
         log_writer = open(os.path.join(args.output_dir, "evaluate_logs.txt"), 'w')
 
     args.train_batch_size = args.per_gpu_train_batch_size * max(1, args.n_gpu)
-    train_dataloader_size = []
-    train_dataloader_list = []
-    for train_dataset in train_dataset_list:
-        train_sampler = RandomSampler(train_dataset) if args.local_rank == -1 else DistributedSampler(train_dataset)
-        train_dataloader = DataLoader(train_dataset, sampler=train_sampler, batch_size=args.train_batch_size)
-        train_dataloader_list.append(train_dataloader)
-        train_dataloader_size.append(len(train_dataset))
-        print("train size:", len(train_dataset))
+    # Whole batches are drawn from the task loaders, which prefetch them in their own workers
+    train_loader = MultiTaskLoader(
+        train_dataset_list,
+        batch_size=args.train_batch_size,
+        task_ratio=args.task_ratio,
+        seed=args.seed,
+        num_replicas=1 if args.local_rank == -1 else None,
+        num_workers=args.loader_workers,
+        pin_memory=args.device.type == "cuda",
+    )
+    for train_dataset, prob in zip(train_dataset_list, train_loader.probs):
+        print("train size:", len(train_dataset), "sampling probability:", prob)
+    # The step and epoch arithmetic below deliberately keeps counting in batches of the last task, as before
+    train_dataloader = train_loader.loaders[-1]
     if args.max_steps > 0:
         t_total = args.max_steps
         args.num_train_epochs = args.max_steps // (len(train_dataloader) // args.gradient_accumulation_steps) + 1
@@ -157,6 +143,10 @@ def train(args, train_dataset_list, model, tokenizer):
         # Load in optimizer and scheduler states
         optimizer.load_state_dict(torch.load(os.path.join(args.model_name_or_path, "optimizer.pt")))
         scheduler.load_state_dict(torch.load(os.path.join(args.model_name_or_path, "scheduler.pt")))
+    sampler_restored = os.path.isfile(os.path.join(args.model_name_or_path, "sampler.pt"))
+    if sampler_restored:
+        # Resume the task draws and the position in each task
+        train_loader.load_state_dict(torch.load(os.path.join(args.model_name_or_path, "sampler.pt")))
 
     if args.fp16:
         try:
@@ -204,6 +194,9 @@ def train(args, train_dataset_list, model, tokenizer):
         logger.info("  Continuing training from epoch %d", epochs_trained)
         logger.info("  Continuing training from global step %d", global_step)
         logger.info("  Will skip the first %d steps in the first epoch", steps_trained_in_current_epoch)
+    if sampler_restored:
+        # The restored loader already starts after the trained batches, skipping them again would drop data
+        steps_trained_in_current_epoch = 0
 
     tr_loss, logging_loss = 0.0, 0.0
     model.zero_grad()
@@ -228,11 +221,8 @@ def train(args, train_dataset_list, model, tokenizer):
 
     for _ in range(1):
         step = 0
-        for _, batch in enumerate(merge_dataset(train_dataloader_list, train_dataloader_size, args.task_ratio)):
+        for task_idx, batch in train_loader:
             # Skip past any already trained steps if resuming training
-            task_idx = batch[0]
-            batch = batch[1]
-
             if steps_trained_in_current_epoch > 0:
                 steps_trained_in_current_epoch -= 1
                 continue
@@ -241,7 +231,7 @@ def train(args, train_dataset_list, model, tokenizer):
  
 
 
-            batch = tuple(t.to(args.device) for t in batch)
+            batch = tuple(t.to(args.device, non_blocking=True) for t in batch)
             inputs = {"input_ids": batch[0], "attention_mask": batch[1], "labels": batch[3], "task_idx":task_idx}
             if args.model_type != "distilbert":
                 inputs["token_type_ids"] = (
@@ -302,6 +292,7 @@ def train(args, train_dataset_list, model, tokenizer):
 
         torch.save(optimizer.state_dict(), os.path.join(output_dir, "optimizer.pt"))
         torch.save(scheduler.state_dict(), os.path.join(output_dir, "scheduler.pt"))
+        torch.save(train_loader.state_dict(), os.path.join(output_dir, "sampler.pt"))
         logger.info("Saving optimizer and scheduler states to %s", output_dir)
 
         if args.local_rank in [-1, 0] and args.logging_each_epoch:
@@ -358,8 +349,9 @@ def evaluate(args, task_name, task_idx, model, tokenizer, prefix="", single_gpu=
         logger.info("  Batch size = %d", args.eval_batch_size)
         eval_loss = 0.0
         nb_eval_steps = 0
-        preds = None
-        out_label_ids = None
+        if args.output_mode != "classification":
+            raise ValueError("No other `output_mode` for XGLUE.")
+        buffer = PredictionBuffer(len(eval_dataset), reduce="argmax")
         guids = np.array(guids)
         for batch in tqdm(eval_dataloader, desc="Evaluating"):
             model.eval()
@@ -375,19 +367,10 @@ def evaluate(args, task_name, task_idx, model, tokenizer, prefix="", single_gpu=
 
                 eval_loss += tmp_eval_loss.mean().item()
             nb_eval_steps += 1
-            if preds is None:
-                preds = logits.detach().cpu().numpy()
-                out_label_ids = inputs["labels"].detach().cpu().numpy()
-            else:
-                preds = np.append(preds, logits.detach().cpu().numpy(), axis=0)
-                out_label_ids = np.append(out_label_ids, inputs["labels"].detach().cpu().numpy(), axis=0)
+            buffer.add(logits, inputs["labels"])
 
         eval_loss = eval_loss / nb_eval_steps
-        if args.output_mode == "classification":
-            preds = np.argmax(preds, axis=1)
-        else:
-            raise ValueError("No other `output_mode` for XGLUE.")
-        result = compute_metrics(eval_task, preds, out_label_ids, guids)
+        result = compute_metrics(eval_task, buffer.preds, buffer.labels, guids)
         results[task_name] = result
 
     results["test_avg"] = average_dic([value for key, value in results.items() if key.startswith("test")])
@@ -584,6 +567,9 @@ def main():
         type=float,
         help="ratio of tasks between 0-1",
     )
+    parser.add_argument(
+        "--loader_workers", default=1, type=int, help="Number of workers loading the batches of each task."
+    )
     parser.add_argument(
         "--max_seq_length",
         default=128,
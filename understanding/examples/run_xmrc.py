@@ -58,12 +58,20 @@ from transformers import (
     XLNetConfig,
     XLNetForQuestionAnswering,
     XLNetTokenizer,
+    SharedCache,
+    file_signature,
     get_linear_schedule_with_warmup,
+    load_squad_metadata,
+    load_squad_tensors,
+    save_squad_cache,
+    save_squad_metadata,
+    save_squad_tensors,
     squad_convert_examples_to_features,
+    tokenizer_signature,
 )
 from transformers.data.metrics.squad_metrics import (
     compute_predictions_log_probs,
-    compute_predictions_logits,
+    compute_predictions_logits_batched,
     squad_evaluate,
 )
 from transformers.data.metrics.mlqa_evaluation_v1 import evaluate_with_path
@@ -433,7 +441,7 @@ def evaluate(args, model, tokenizer, prefix=""):
                 args.verbose_logging,
             )
         else:
-            predictions = compute_predictions_logits(
+            predictions = compute_predictions_logits_batched(
                 examples,
                 features,
                 all_results,
@@ -447,7 +455,8 @@ def evaluate(args, model, tokenizer, prefix=""):
                 args.version_2_with_negative,
                 args.null_score_diff_threshold,
                 tokenizer,
-                map_to_origin=not (args.model_type == "xlmr" and lang == 'zh')
+                map_to_origin=not (args.model_type == "xlmr" and lang == 'zh'),
+                num_workers=args.threads,
             )
 
         # Compute the F1 and exact scores.
@@ -493,15 +502,42 @@ def load_and_cache_examples(args, tokenizer, language, split="train", output_exa
         ),
     )
 
+    # The tensors and the metadata used to post-process the predictions are cached in two files (one entry of the
+    # shared cache, so that they are evicted together), and the metadata is only mapped when the examples are requested
+    cached_metadata_file = cached_features_file + "_metadata"
+    fingerprint = {
+        "split": split,
+        "language": language,
+        "max_seq_length": args.max_seq_length,
+        "doc_stride": args.doc_stride,
+        "max_query_length": args.max_query_length,
+        "tokenizer": type(tokenizer).__name__,
+        "vocab_size": len(tokenizer),
+    }
+    shared_cache = None
+    if args.shared_cache_dir is not None:
+        shared_cache = SharedCache(args.shared_cache_dir, max_size=int(args.shared_cache_size * 1e9), suffix=".mlqa")
+        cache_key = shared_cache.key(
+            features=fingerprint,
+            tokenizer=tokenizer_signature(tokenizer),
+            data=file_signature(MLQAProcessor().get_dataset_path(input_dir, split, language)),
+            contents="tensors_and_metadata",
+        )
+        cached_features_file = shared_cache.path(cache_key)
+        cached_metadata_file = cached_features_file
+
     # Init features and dataset from cache if it exists
-    if os.path.exists(cached_features_file) and not args.overwrite_cache:
+    dataset, examples, features = None, None, None
+    if not args.overwrite_cache and (shared_cache is None or shared_cache.lookup(cache_key) is not None):
+        dataset = load_squad_tensors(cached_features_file, fingerprint)
+        if dataset is not None and output_examples:
+            metadata = load_squad_metadata(cached_metadata_file, fingerprint)
+            if metadata is None:
+                dataset = None
+            else:
+                examples, features = metadata
+    if dataset is not None:
         logger.info("Loading features from cached file %s", cached_features_file)
-        features_and_dataset = torch.load(cached_features_file)
-        features, dataset, examples = (
-            features_and_dataset["features"],
-            features_and_dataset["dataset"],
-            features_and_dataset["examples"],
-        )
     else:
         logger.info("Creating features from dataset file at %s", input_dir)
 
@@ -540,7 +576,14 @@ def load_and_cache_examples(args, tokenizer, language, split="train", output_exa
 
         if args.local_rank in [-1, 0]:
             logger.info("Saving features into cached file %s", cached_features_file)
-            torch.save({"features": features, "dataset": dataset, "examples": examples}, cached_features_file)
+            if shared_cache is not None:
+                shared_cache.store(
+                    cache_key,
+                    lambda path: save_squad_cache(examples, features, dataset, path, args.max_seq_length, fingerprint),
+                )
+            else:
+                save_squad_metadata(examples, features, cached_metadata_file, args.max_seq_length, fingerprint)
+                save_squad_tensors(dataset, cached_features_file, fingerprint)
 
     if args.local_rank == 0 and split=="train":
         # Make sure only the first process in distributed training process the dataset, and the others will use the cache
@@ -721,6 +764,16 @@ def main():
     parser.add_argument(
         "--overwrite_cache", action="store_true", help="Overwrite the cached training and evaluation sets"
     )
+    parser.add_argument(
+        "--shared_cache_dir",
+        default=None,
+        type=str,
+        help="Directory of a features cache shared by tasks and runs, keyed by the data files, the tokenizer and the "
+        "conversion parameters. Replaces the cache files of the data directory.",
+    )
+    parser.add_argument(
+        "--shared_cache_size", default=50.0, type=float, help="Maximum size of the shared features cache, in GB."
+    )
     parser.add_argument("--seed", type=int, default=42, help="random seed for initialization")
 
     parser.add_argument("--local_rank", type=int, default=-1, help="local_rank for distributed training on gpus")
@@ -739,7 +792,7 @@ def main():
     parser.add_argument("--server_ip", type=str, default="", help="Can be used for distant debugging.")
     parser.add_argument("--server_port", type=str, default="", help="Can be used for distant debugging.")
 
-    parser.add_argument("--threads", type=int, default=1, help="multiple threads for converting example to features")
+    parser.add_argument("--threads", type=int, default=1, help="multiple threads for converting example to features and decoding the predictions")
 
     # cross-lingual part
     parser.add_argument(
@@ -16,13 +16,19 @@
 
 import argparse
 import logging
+import os
 import sys
+import tempfile
 import unittest
 from unittest.mock import patch
 
+import torch
+from torch.utils.data import TensorDataset
+
 import run_generation
 import run_glue
 import run_squad
+import run_xglue_ft
 
 
 logging.basicConfig(level=logging.DEBUG)
@@ -37,6 +43,22 @@ def get_setup_file():
     return args.f
 
 
+class RecordingModel(torch.nn.Module):
+    """ Stand-in multi-task model remembering the batches it was trained on. """
+
+    def __init__(self):
+        super().__init__()
+        self.weight = torch.nn.Parameter(torch.zeros(1))
+        self.batches = []
+
+    def forward(self, input_ids, attention_mask, labels, task_idx, token_type_ids=None):
+        self.batches.append((task_idx, input_ids.tolist()))
+        return ((self.weight * input_ids.float()).sum(),)
+
+    def save_pretrained(self, save_directory):
+        pass
+
+
 class ExamplesTests(unittest.TestCase):
     def test_run_glue(self):
         stream_handler = logging.StreamHandler(sys.stdout)
@@ -98,3 +120,49 @@ class ExamplesTests(unittest.TestCase):
         with patch.object(sys, "argv", testargs + [model_type, model_name]):
             result = run_generation.main()
             self.assertGreaterEqual(len(result[0]), 10)
+
+    def test_run_xglue_ft_resume(self):
+        datasets = [
+            TensorDataset(*(torch.arange(start, start + 10).unsqueeze(1) for _ in range(4))) for start in (0, 100)
+        ]
+
+        def train(output_dir, max_steps, model_name_or_path=""):
+            os.makedirs(output_dir)
+            args = argparse.Namespace(
+                output_dir=output_dir,
+                model_name_or_path=model_name_or_path,
+                model_type="xlmr",
+                per_gpu_train_batch_size=2,
+                n_gpu=0,
+                device=torch.device("cpu"),
+                local_rank=-1,
+                seed=42,
+                task_ratio=1.0,
+                loader_workers=0,
+                max_steps=max_steps,
+                break_steps=0,
+                num_train_epochs=1,
+                gradient_accumulation_steps=1,
+                learning_rate=1e-4,
+                weight_decay=0.0,
+                adam_epsilon=1e-8,
+                warmup_steps=0,
+                max_grad_norm=1.0,
+                fp16=False,
+                logging_steps=0,
+                logging_each_epoch=False,
+                evaluate_during_training=False,
+            )
+            model = RecordingModel()
+            tokenizer = argparse.Namespace(save_pretrained=lambda save_directory: None)
+            with patch.object(run_xglue_ft, "SummaryWriter"):
+                run_xglue_ft.train(args, datasets, model, tokenizer)
+            return model.batches
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            expected = train(os.path.join(output_dir, "full"), max_steps=7)
+            interrupted = train(os.path.join(output_dir, "interrupted"), max_steps=3)
+            checkpoint = os.path.join(output_dir, "interrupted", "checkpoint-4")
+            resumed = train(os.path.join(output_dir, "resumed"), max_steps=3, model_name_or_path=checkpoint)
+        self.assertEqual(len(expected), 8)
+        self.assertListEqual(interrupted + resumed, expected)
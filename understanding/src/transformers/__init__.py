@@ -58,8 +58,17 @@ from .data import (
     glue_output_modes,
     glue_processors,
     glue_tasks_num_labels,
+    SharedCache,
+    directory_signature,
+    features_to_arrays,
+    file_signature,
     is_sklearn_available,
+    load_features_cache,
+    load_squad_metadata,
+    save_features_cache,
+    save_squad_metadata,
     squad_convert_examples_to_features,
+    tokenizer_signature,
     xnli_output_modes,
     xnli_processors,
     xnli_tasks_num_labels,
@@ -298,6 +307,22 @@ if is_torch_available():
         get_linear_schedule_with_warmup,
     )
 
+    # Batching
+    from .data import (
+        ConcatFeaturesDataset,
+        DevicePrefetcher,
+        FeaturesDataset,
+        LengthGroupedSampler,
+        PadCollator,
+        SortedSampler,
+        get_lengths,
+    )
+    from .data import AliasTable, MultiTaskLoader, TaskBatchSampler, task_probabilities
+    from .data import load_squad_tensors, save_squad_cache, save_squad_tensors
+
+    # Evaluation
+    from .data import PredictionBuffer, write_predictions
+
 
 # TensorFlow
 if is_tf_available():
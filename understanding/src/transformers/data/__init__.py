@@ -2,6 +2,10 @@
 # There's no way to ignore "F401 '...' imported but unused" warnings in this
 # module, but to preserve other warnings. So, don't check this module at all.
 
+from ..file_utils import is_torch_available
+from .feature_cache import features_to_arrays, load_features_cache, save_features_cache
+from .shared_cache import SharedCache, directory_signature, file_signature, tokenizer_signature
+from .squad_cache import load_squad_metadata, save_squad_metadata
 from .metrics import is_sklearn_available
 from .processors import (
     DataProcessor,
@@ -31,3 +35,18 @@ from .processors import (
 
 if is_sklearn_available():
     from .metrics import glue_compute_metrics, xnli_compute_metrics, xglue_compute_metrics
+
+
+if is_torch_available():
+    from .dynamic_batching import (
+        ConcatFeaturesDataset,
+        DevicePrefetcher,
+        FeaturesDataset,
+        LengthGroupedSampler,
+        PadCollator,
+        SortedSampler,
+        get_lengths,
+    )
+    from .multitask import AliasTable, MultiTaskLoader, TaskBatchSampler, task_probabilities
+    from .squad_cache import load_squad_tensors, save_squad_cache, save_squad_tensors
+    from .prediction_buffer import PredictionBuffer, write_predictions
@@ -0,0 +1,221 @@
+# coding=utf-8
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+""" Datasets, samplers and collate function to batch unpadded features with similar lengths together """
+
+import math
+
+import numpy as np
+import torch
+from torch.utils.data import ConcatDataset, Dataset, Sampler
+
+
+class FeaturesDataset(Dataset):
+    """
+    Dataset over the arrays of a features cache (see :func:`~transformers.load_features_cache`).
+
+    Items are ``(input_ids, attention_mask, token_type_ids, label, index)`` tuples of tensors, where the sequences
+    keep their own length and are views of the cache arrays. :class:`PadCollator` pads them into batches.
+
+    Args:
+        arrays: Arrays of a features cache.
+        labels: If given, the labels of the features instead of the ``labels`` array.
+    """
+
+    def __init__(self, arrays, labels=None):
+        self.input_ids = torch.from_numpy(arrays["input_ids"])
+        self.attention_mask = torch.from_numpy(arrays["attention_mask"])
+        self.token_type_ids = torch.from_numpy(arrays["token_type_ids"])
+        self.labels = torch.from_numpy(arrays["labels"]) if labels is None else labels
+        self.offsets = arrays["offsets"]
+        self.lengths = np.diff(self.offsets)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, index):
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return (
+            self.input_ids[start:end],
+            self.attention_mask[start:end],
+            self.token_type_ids[start:end],
+            self.labels[index],
+            torch.tensor(index),
+        )
+
+
+class ConcatFeaturesDataset(ConcatDataset):
+    """
+    Concatenation of :class:`FeaturesDataset` whose items hold their index in the concatenation, so that the
+    predictions of a single pass over several datasets can be scattered back to each of them.
+    """
+
+    def __getitem__(self, index):
+        return super().__getitem__(index)[:4] + (torch.tensor(index),)
+
+    @property
+    def offsets(self):
+        """Start of each dataset in the concatenation, followed by its total size."""
+        return [0] + list(self.cumulative_sizes)
+
+
+class PadCollator(object):
+    """
+    Collate function padding the sequences of a batch of :class:`FeaturesDataset` items to the length of the
+    longest one. The last tensor of the batch holds the dataset indices of its items, to restore the order of the
+    dataset when it was sampled out of order.
+
+    Args:
+        pad_token: Padding token of ``input_ids``.
+        pad_token_segment_id: Padding value of ``token_type_ids``.
+        pad_on_left: If set to ``True``, the sequences are padded on the left.
+        mask_padding_with_zero: Padding value of ``attention_mask`` is ``0`` if set to ``True``, ``1`` otherwise.
+    """
+
+    def __init__(self, pad_token=0, pad_token_segment_id=0, pad_on_left=False, mask_padding_with_zero=True):
+        self.pad_values = (pad_token, 0 if mask_padding_with_zero else 1, pad_token_segment_id)
+        self.pad_on_left = pad_on_left
+
+    def __call__(self, batch):
+        max_length = max(len(item[0]) for item in batch)
+        padded = []
+        for i, pad_value in enumerate(self.pad_values):
+            tensor = batch[0][i].new_full((len(batch), max_length), pad_value)
+            for j, item in enumerate(batch):
+                length = len(item[i])
+                if self.pad_on_left:
+                    tensor[j, max_length - length :] = item[i]
+                else:
+                    tensor[j, :length] = item[i]
+            padded.append(tensor)
+        labels = torch.stack([item[3] for item in batch])
+        indices = torch.stack([item[4] for item in batch])
+        return tuple(padded) + (labels, indices)
+
+
+def get_lengths(dataset):
+    """Lengths of the sequences of a :class:`FeaturesDataset` or of a ``ConcatDataset`` of them."""
+    if hasattr(dataset, "datasets"):
+        return np.concatenate([get_lengths(d) for d in dataset.datasets])
+    return dataset.lengths
+
+
+class LengthGroupedSampler(Sampler):
+    """
+    Batch sampler (the ``batch_sampler`` of a ``DataLoader``) that samples the dataset in random order, but in batches
+    of sequences of similar lengths: random chunks of ``mega_batch_mult`` batches are sorted by length and cut into
+    batches, which are then shuffled. Only the last batch of the epoch may be smaller than ``batch_size``.
+
+    When ``num_replicas`` is more than 1, it replaces ``DistributedSampler``: every replica gets a slice of the same
+    batches, and the data is repeated so that they all get the same number of full batches. Call
+    :meth:`set_epoch` at each epoch to reshuffle.
+
+    Args:
+        lengths: Lengths of the sequences of the dataset (see :func:`get_lengths`).
+        batch_size: Batch size of each replica.
+        mega_batch_mult: Number of batches sorted together.
+        num_replicas: Number of distributed processes, defaults to the world size if distributed training is
+            initialized.
+        rank: Rank of the current process.
+        seed: Seed of the distributed shuffling.
+    """
+
+    def __init__(self, lengths, batch_size, mega_batch_mult=50, num_replicas=None, rank=None, seed=0):
+        if num_replicas is None:
+            num_replicas = torch.distributed.get_world_size() if torch.distributed.is_initialized() else 1
+        if rank is None:
+            rank = torch.distributed.get_rank() if num_replicas > 1 else 0
+        self.lengths = lengths
+        self.batch_size = batch_size
+        self.mega_batch_mult = mega_batch_mult
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self.epoch = 0
+        if num_replicas > 1:
+            global_batch_size = batch_size * num_replicas
+            self.total_size = int(math.ceil(len(lengths) / global_batch_size)) * global_batch_size
+        else:
+            self.total_size = len(lengths)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return int(math.ceil(self.total_size / (self.batch_size * self.num_replicas)))
+
+    def __iter__(self):
+        generator = None
+        if self.num_replicas > 1:
+            generator = torch.Generator()
+            generator.manual_seed(self.seed + self.epoch)
+        indices = torch.randperm(len(self.lengths), generator=generator).numpy()
+        if self.total_size > len(indices):
+            indices = np.resize(indices, self.total_size)
+
+        global_batch_size = self.batch_size * self.num_replicas
+        mega_batch_size = global_batch_size * self.mega_batch_mult
+        batches = []
+        for start in range(0, len(indices), mega_batch_size):
+            mega_batch = indices[start : start + mega_batch_size]
+            mega_batch = mega_batch[np.argsort(-self.lengths[mega_batch], kind="stable")]
+            batches.extend(mega_batch[i : i + global_batch_size] for i in range(0, len(mega_batch), global_batch_size))
+
+        # a partial batch stays last, the other ones are shuffled
+        last = [] if len(batches[-1]) == global_batch_size else [len(batches) - 1]
+        order = torch.randperm(len(batches) - len(last), generator=generator).tolist() + last
+        for i in order:
+            yield batches[i][self.rank :: self.num_replicas].tolist()
+
+
+class SortedSampler(Sampler):
+    """Samples the dataset from the longest to the shortest sequence, to pad evaluation batches as little as possible."""
+
+    def __init__(self, lengths):
+        self.lengths = lengths
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __iter__(self):
+        return iter(np.argsort(-self.lengths, kind="stable").tolist())
+
+
+class DevicePrefetcher(object):
+    """
+    Iterates over the batches of ``loader`` moved to ``device``. On a GPU, the copy of the next batch runs on a side
+    stream while the current one is used, which overlaps when the loader pins its memory (``pin_memory=True``).
+    """
+
+    def __init__(self, loader, device):
+        self.loader = loader
+        self.device = torch.device(device)
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        if self.device.type != "cuda":
+            for batch in self.loader:
+                yield tuple(t.to(self.device) for t in batch)
+            return
+
+        stream = torch.cuda.Stream(self.device)
+
+        def prefetch(batch):
+            if batch is None:
+                return None
+            with torch.cuda.stream(stream):
+                return tuple(t.to(self.device, non_blocking=True) for t in batch)
+
+        loader_iter = iter(self.loader)
+        next_batch = prefetch(next(loader_iter, None))
+        while next_batch is not None:
+            current_stream = torch.cuda.current_stream(self.device)
+            current_stream.wait_stream(stream)
+            batch = next_batch
+            for t in batch:
+                # the memory of the copies belongs to the side stream, keep it until the compute stream is done
+                t.record_stream(current_stream)
+            next_batch = prefetch(next(loader_iter, None))
+            yield batch
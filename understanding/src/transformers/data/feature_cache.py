@@ -0,0 +1,146 @@
+# coding=utf-8
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+""" Memory-mapped cache of ``InputFeatures`` """
+
+import json
+import logging
+import os
+import struct
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+FEATURES_CACHE_MAGIC = b"XFEATS\x00\x00"
+# Bump when the layout of the cache changes, existing caches are then rebuilt.
+FEATURES_CACHE_VERSION = 2
+_ALIGNMENT = 64
+
+
+def features_to_arrays(features):
+    """
+    Concatenates the sequences of a list of ``InputFeatures``, padded or not, into the arrays of a features
+    cache: the tokens of feature ``i`` are ``input_ids[offsets[i]:offsets[i + 1]]``.
+    """
+    lengths = np.array([len(f.input_ids) for f in features], dtype=np.int64)
+    offsets = np.zeros(len(features) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    def concatenate(name):
+        array = np.empty(offsets[-1], dtype=np.int64)
+        for i, f in enumerate(features):
+            array[offsets[i] : offsets[i + 1]] = getattr(f, name)
+        return array
+
+    label_dtype = np.float32 if any(isinstance(f.label, float) for f in features) else np.int64
+    guids = [(f.guid if f.guid is not None else "").encode("utf-8") for f in features]
+    arrays = {
+        "input_ids": concatenate("input_ids"),
+        "attention_mask": concatenate("attention_mask"),
+        "token_type_ids": concatenate("token_type_ids"),
+        "offsets": offsets,
+        "labels": np.array([f.label if f.label is not None else 0 for f in features], dtype=label_dtype),
+        "guids": np.array(guids, dtype="S%d" % max([1] + [len(g) for g in guids])),
+    }
+    return arrays
+
+
+def save_features_cache(features, path, fingerprint=None, num_features=None):
+    """
+    Saves a list of ``InputFeatures`` to ``path``, as the contiguous arrays of :func:`features_to_arrays` that
+    :func:`load_features_cache` maps in memory.
+
+    Args:
+        features: List of ``InputFeatures``, or their arrays as returned by :func:`features_to_arrays`.
+        path: Path of the cache file. It is written to a temporary file first and then renamed, so readers
+            never see a partial cache.
+        fingerprint: JSON-serializable dictionary describing how the features were built (tokenizer, maximum
+            length, ...). :func:`load_features_cache` rejects the cache if it is given another fingerprint.
+        num_features: Number of features, required for arrays without ``offsets``, whose lengths do not tell it.
+    """
+    arrays = features if isinstance(features, dict) else features_to_arrays(features)
+    if num_features is None:
+        if "offsets" not in arrays:
+            raise ValueError("num_features is required to save arrays without offsets")
+        num_features = len(arrays["offsets"]) - 1
+
+    header = {
+        "version": FEATURES_CACHE_VERSION,
+        "fingerprint": fingerprint or {},
+        "num_features": int(num_features),
+        "arrays": {},
+    }
+    # offsets are relative to the end of the header, whose length is not known yet
+    offset = 0
+    for name, array in arrays.items():
+        offset = (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = len(FEATURES_CACHE_MAGIC) + 8 + len(header_bytes)
+    data_start = (data_start + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+    header_bytes = header_bytes.ljust(data_start - len(FEATURES_CACHE_MAGIC) - 8)
+
+    tmp_path = "%s.tmp%d" % (path, os.getpid())
+    with open(tmp_path, "wb") as writer:
+        writer.write(FEATURES_CACHE_MAGIC)
+        writer.write(struct.pack("<Q", len(header_bytes)))
+        writer.write(header_bytes)
+        for name, array in arrays.items():
+            writer.seek(data_start + header["arrays"][name]["offset"])
+            writer.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_features_cache_header(path):
+    """Returns the header of the cache at ``path`` and the offset of its data, or ``None`` if it is not a cache."""
+    with open(path, "rb") as reader:
+        if reader.read(len(FEATURES_CACHE_MAGIC)) != FEATURES_CACHE_MAGIC:
+            return None
+        (header_length,) = struct.unpack("<Q", reader.read(8))
+        header = json.loads(reader.read(header_length).decode("utf-8"))
+    return header, len(FEATURES_CACHE_MAGIC) + 8 + header_length
+
+
+def load_features_cache(path, fingerprint=None):
+    """
+    Maps the cache saved by :func:`save_features_cache` at ``path`` in memory.
+
+    The arrays are copy-on-write memory maps of the file, so they are not read until used and their pages are
+    shared by every process loading the same cache.
+
+    Args:
+        path: Path of the cache file.
+        fingerprint: If given, the fingerprint the cache must have been saved with.
+
+    Returns:
+        A dictionary with the ``input_ids``, ``attention_mask``, ``token_type_ids``, ``offsets``, ``labels`` and
+        ``guids`` (as UTF-8 bytes) arrays, or ``None`` if ``path`` does not exist or holds a cache of another version or
+        fingerprint.
+    """
+    if not os.path.exists(path):
+        return None
+    header = read_features_cache_header(path)
+    if header is None:
+        logger.info("%s is not a features cache", path)
+        return None
+    header, data_start = header
+    if header["version"] != FEATURES_CACHE_VERSION:
+        logger.info("Features cache %s has version %s, expected %s", path, header["version"], FEATURES_CACHE_VERSION)
+        return None
+    if fingerprint is not None and header["fingerprint"] != json.loads(json.dumps(fingerprint)):
+        logger.info("Features cache %s was built with %s, expected %s", path, header["fingerprint"], fingerprint)
+        return None
+
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        shape = tuple(spec["shape"])
+        if np.prod(shape) == 0:
+            arrays[name] = np.zeros(shape, dtype=spec["dtype"])
+        else:
+            arrays[name] = np.memmap(
+                path, dtype=np.dtype(spec["dtype"]), mode="c", offset=data_start + spec["offset"], shape=shape
+            )
+    return arrays
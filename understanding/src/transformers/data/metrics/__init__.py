@@ -18,6 +18,7 @@ try:
     from scipy.stats import pearsonr, spearmanr
     from sklearn.metrics import matthews_corrcoef, f1_score, average_precision_score, ndcg_score, roc_auc_score
     import numpy as np
+    from .ranking import _mean, factorize_queries, grouped_ndcg
     _has_sklearn = True
 except (AttributeError, ImportError):
     _has_sklearn = False
@@ -33,21 +34,7 @@ if _has_sklearn:
         return (preds == labels).mean()
 
     def simple_ndcg(preds, labels, guids):
-        ndcgs = []
-        query2content = {}
-        for guid, pred, label in zip(guids, preds, labels):
-            query = guid.split("_")[0]
-            if not query in query2content:
-                query2content[query] = [[int(pred)], [int(label)]]
-            else:
-                query2content[query][0].append(int(pred))     
-                query2content[query][1].append(int(label))     
- 
-        for key in query2content.keys():
-            if len(query2content[key][1]) < 2 or len(query2content[key][0]) < 2:
-                continue 
-            ndcgs.append(ndcg_score(np.asarray([query2content[key][1]]), np.asarray([query2content[key][0]])))
-        return {"ndcg" : np.array(ndcgs).mean()}
+        return {"ndcg": _mean(grouped_ndcg(preds, labels, factorize_queries(guids)))}
 
     def acc_and_f1(preds, labels):
         acc = simple_accuracy(preds, labels)
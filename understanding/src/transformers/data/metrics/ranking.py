@@ -0,0 +1,150 @@
+# coding=utf-8
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+""" Ranking metrics computed for all the queries of an evaluation set at once """
+
+import numpy as np
+
+
+def factorize_queries(guids, separator="_"):
+    """Returns the query index of each guid, the query being the part of the guid before ``separator``."""
+    if len(guids) == 0:
+        return np.zeros(0, dtype=np.int64)
+    queries = np.char.partition(np.asarray(guids, dtype=str), separator)[:, 0]
+    _, groups = np.unique(queries, return_inverse=True)
+    return groups
+
+
+def _sort_by_group(groups, scores, min_size):
+    """
+    Keeps the documents of the groups with at least ``min_size`` documents and sorts them by group, then by
+    decreasing score. Returns the sorting order, the renumbered groups in that order and the start of each group.
+    """
+    sizes = np.bincount(groups)
+    keep = np.flatnonzero(sizes[groups] >= min_size)
+    if len(keep) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    _, groups = np.unique(groups[keep], return_inverse=True)
+    order = keep[np.lexsort((-scores[keep], groups))]
+    sorted_groups = np.sort(groups)
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    return order, sorted_groups, starts
+
+
+def _discounts(sorted_groups, starts, k):
+    ranks = np.arange(len(sorted_groups)) - starts[sorted_groups]
+    discounts = 1.0 / np.log2(ranks + 2.0)
+    if k is not None:
+        discounts[ranks >= k] = 0.0
+    return discounts
+
+
+def _tie_blocks(sorted_groups, sorted_scores):
+    """Start of each run of documents of the same group with the same score."""
+    if len(sorted_groups) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(
+        np.r_[True, (sorted_groups[1:] != sorted_groups[:-1]) | (sorted_scores[1:] != sorted_scores[:-1])]
+    )
+
+
+def grouped_ndcg(scores, labels, groups, k=None, min_size=2):
+    """
+    NDCG (at ``k`` if given) of every group of documents, the same as ``sklearn.metrics.ndcg_score`` called on each
+    group: the gain is the label, and documents with tied scores share the average of their gains.
+
+    Args:
+        scores: Predicted score of each document.
+        labels: Relevance of each document.
+        groups: Query index of each document, e.g. from :func:`factorize_queries`.
+        k: Only the first ``k`` documents of each ranking count.
+        min_size: Groups with fewer documents are skipped.
+
+    Returns:
+        The NDCG of each group with at least ``min_size`` documents, in the order of their index. Groups without
+        relevant documents get 0.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    labels = np.asarray(labels, dtype=np.float64)
+    groups = np.asarray(groups)
+    order, sorted_groups, starts = _sort_by_group(groups, scores, min_size)
+    num_groups = len(starts)
+    discounts = _discounts(sorted_groups, starts, k)
+
+    # DCG, averaging the gains of tied documents over their positions
+    sorted_scores = scores[order]
+    blocks = _tie_blocks(sorted_groups, sorted_scores)
+    if len(blocks) > 0:
+        block_gains = np.add.reduceat(labels[order], blocks)
+        block_discounts = np.add.reduceat(discounts, blocks)
+        block_sizes = np.diff(np.r_[blocks, len(order)])
+        dcg = np.bincount(
+            sorted_groups[blocks], weights=block_gains * block_discounts / block_sizes, minlength=num_groups
+        )
+    else:
+        dcg = np.zeros(num_groups)
+
+    # ideal DCG, ranking the documents by their labels
+    ideal_order, _, _ = _sort_by_group(groups, labels, min_size)
+    idcg = np.bincount(sorted_groups, weights=labels[ideal_order] * discounts, minlength=num_groups)
+
+    ndcg = np.zeros(num_groups)
+    relevant = idcg != 0
+    ndcg[relevant] = dcg[relevant] / idcg[relevant]
+    return ndcg
+
+
+def grouped_average_precision(scores, labels, groups, relevance_threshold=1, min_size=2):
+    """
+    Average precision of every group of documents, the same as ``sklearn.metrics.average_precision_score`` called
+    on each group: documents with tied scores are counted at the same threshold.
+
+    Args:
+        scores: Predicted score of each document.
+        labels: Relevance of each document.
+        groups: Query index of each document, e.g. from :func:`factorize_queries`.
+        relevance_threshold: Documents whose label is at least this value are relevant.
+        min_size: Groups with fewer documents are skipped.
+
+    Returns:
+        The average precision of each group with at least ``min_size`` documents and one relevant document, in the
+        order of their index.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    relevant = (np.asarray(labels) >= relevance_threshold).astype(np.float64)
+    groups = np.asarray(groups)
+    order, sorted_groups, starts = _sort_by_group(groups, scores, min_size)
+    num_groups = len(starts)
+    if num_groups == 0:
+        return np.zeros(0)
+
+    blocks = _tie_blocks(sorted_groups, scores[order])
+    block_groups = sorted_groups[blocks]
+    block_relevant = np.add.reduceat(relevant[order], blocks)
+    # relevant and retrieved documents up to the end of each block, within its group
+    cum_relevant = np.cumsum(block_relevant)
+    cum_relevant -= (cum_relevant - block_relevant)[np.searchsorted(block_groups, block_groups)]
+    cum_retrieved = np.r_[blocks[1:], len(order)] - starts[block_groups]
+
+    num_relevant = np.bincount(block_groups, weights=block_relevant, minlength=num_groups)
+    average_precision = np.bincount(
+        block_groups, weights=block_relevant * cum_relevant / cum_retrieved, minlength=num_groups
+    )
+    has_relevant = num_relevant > 0
+    return average_precision[has_relevant] / num_relevant[has_relevant]
+
+
+def _mean(values):
+    return float(values.mean()) if len(values) > 0 else 0.0
+
+
+def grouped_ranking_metrics(scores, labels, guids, k=None, relevance_threshold=1):
+    """
+    Mean NDCG (at ``k``) and MAP over the queries of ``guids`` with at least two documents, 0 when there are no such
+    queries (or, for MAP, none of them has a relevant document).
+    """
+    groups = factorize_queries(guids)
+    metrics = {"ndcg": _mean(grouped_ndcg(scores, labels, groups, k=k))}
+    metrics["map"] = _mean(grouped_average_precision(scores, labels, groups, relevance_threshold=relevance_threshold))
+    return metrics
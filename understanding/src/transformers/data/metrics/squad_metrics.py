@@ -14,7 +14,11 @@ import logging
 import math
 import re
 import string
+from multiprocessing import Pool
 
+import numpy as np
+
+from transformers.data.squad_cache import PositionMap
 from transformers.tokenization_bert import BasicTokenizer
 
 
@@ -570,6 +574,288 @@ def compute_predictions_logits(
     return all_predictions
 
 
+def _position_arrays(features, seq_len):
+    """``token_to_orig_map`` and ``token_is_max_context`` of ``features`` as arrays, ``-1`` where missing."""
+    token_to_orig = np.full((len(features), seq_len), -1, dtype=np.int64)
+    max_context = np.full((len(features), seq_len), -1, dtype=np.int8)
+    for i, feature in enumerate(features):
+        for array, mapping in ((token_to_orig, feature.token_to_orig_map), (max_context, feature.token_is_max_context)):
+            if isinstance(mapping, PositionMap):
+                array[i, : len(mapping.values)] = mapping.values[:seq_len]
+            elif mapping:
+                positions = np.fromiter(mapping.keys(), dtype=np.int64)
+                values = np.fromiter(mapping.values(), dtype=np.int64)
+                inside = positions < seq_len
+                array[i, positions[inside]] = values[inside]
+    return token_to_orig, max_context
+
+
+def get_span_candidates(
+    start_logits, end_logits, num_tokens, token_to_orig, max_context, n_best_size, max_answer_length
+):
+    """
+    Valid answer spans of a batch of features, among the pairs of their ``n_best_size`` best start and end
+    positions: both ends must map to the document, the start must have its maximum context in the feature, and the
+    span must hold at most ``max_answer_length`` tokens.
+
+    Args:
+        start_logits, end_logits: ``[num_features, seq_len]`` arrays of logits.
+        num_tokens: Number of tokens of each feature.
+        token_to_orig: ``[num_features, seq_len]`` array of the document word of each token, ``-1`` if none.
+        max_context: ``[num_features, seq_len]`` array, ``1`` where the token has its maximum context.
+
+    Returns:
+        The feature, start, end, start logit and end logit of each span, ordered by feature, then by rank of the
+        start and rank of the end, as the loops of :func:`compute_predictions_logits` produce them.
+    """
+    num_features, seq_len = start_logits.shape
+    num_best = min(n_best_size, seq_len)
+    # stable sorts rank tied logits by position, as ``_get_best_indexes`` does
+    starts = np.argsort(-start_logits, axis=1, kind="stable")[:, :num_best]
+    ends = np.argsort(-end_logits, axis=1, kind="stable")[:, :num_best]
+    rows = np.arange(num_features)[:, None]
+    valid_starts = (
+        (starts < num_tokens[:, None]) & (token_to_orig[rows, starts] >= 0) & (max_context[rows, starts] == 1)
+    )
+    valid_ends = (ends < num_tokens[:, None]) & (token_to_orig[rows, ends] >= 0)
+    lengths = ends[:, None, :] - starts[:, :, None] + 1
+    valid = valid_starts[:, :, None] & valid_ends[:, None, :] & (lengths >= 1) & (lengths <= max_answer_length)
+
+    feature_index, start_rank, end_rank = np.nonzero(valid)
+    start_index = starts[feature_index, start_rank]
+    end_index = ends[feature_index, end_rank]
+    return (
+        feature_index,
+        start_index,
+        end_index,
+        start_logits[feature_index, start_index],
+        end_logits[feature_index, end_index],
+    )
+
+
+_nbest_decoder_state = {}
+
+
+def _init_nbest_decoder(tokenizer, n_best_size, do_lower_case, verbose_logging, version_2_with_negative, map_to_origin):
+    _nbest_decoder_state.update(
+        tokenizer=tokenizer,
+        n_best_size=n_best_size,
+        do_lower_case=do_lower_case,
+        verbose_logging=verbose_logging,
+        version_2_with_negative=version_2_with_negative,
+        map_to_origin=map_to_origin,
+    )
+
+
+def _decode_nbest(payload):
+    """
+    Recovers the text of the best spans of an example, in decreasing order of score, until ``n_best_size`` distinct
+    answers are found. Returns the n-best list of ``(text, start_logit, end_logit)``.
+    """
+    candidates, tokens, doc_tokens, null_logits = payload
+    state = _nbest_decoder_state
+    seen_predictions = {}
+    # spans cut at different sub-tokens of the same words often have the same texts
+    final_texts = {}
+    nbest = []
+    for feature_index, start_index, end_index, orig_doc_start, orig_doc_end, start_logit, end_logit in candidates:
+        if len(nbest) >= state["n_best_size"]:
+            break
+        if start_index > 0:  # this is a non-null prediction
+            tok_tokens = tokens[feature_index][start_index : (end_index + 1)]
+            orig_tokens = doc_tokens[orig_doc_start : (orig_doc_end + 1)]
+            tok_text = state["tokenizer"].convert_tokens_to_string(tok_tokens)
+
+            # Clean whitespace
+            tok_text = tok_text.strip()
+            tok_text = " ".join(tok_text.split())
+            orig_text = " ".join(orig_tokens)
+
+            if not state["map_to_origin"]:
+                final_text = tok_text
+            elif (tok_text, orig_text) in final_texts:
+                final_text = final_texts[tok_text, orig_text]
+            else:
+                final_text = get_final_text(tok_text, orig_text, state["do_lower_case"], state["verbose_logging"])
+                final_texts[tok_text, orig_text] = final_text
+            if final_text in seen_predictions:
+                continue
+            seen_predictions[final_text] = True
+        else:
+            final_text = ""
+            seen_predictions[final_text] = True
+        nbest.append((final_text, start_logit, end_logit))
+
+    if state["version_2_with_negative"]:
+        if "" not in seen_predictions:
+            nbest.append(("", null_logits[0], null_logits[1]))
+        # In very rare edge cases we could only have single null prediction.
+        if len(nbest) == 1:
+            nbest.insert(0, ("empty", 0.0, 0.0))
+    # In very rare edge cases we could have no valid predictions.
+    if not nbest:
+        nbest.append(("empty", 0.0, 0.0))
+    return nbest
+
+
+def compute_predictions_logits_batched(
+    all_examples,
+    all_features,
+    all_results,
+    n_best_size,
+    max_answer_length,
+    do_lower_case,
+    output_prediction_file,
+    output_nbest_file,
+    output_null_log_odds_file,
+    verbose_logging,
+    version_2_with_negative,
+    null_score_diff_threshold,
+    tokenizer,
+    map_to_origin=True,
+    num_workers=1,
+):
+    """
+    Same predictions as :func:`compute_predictions_logits`, but the valid spans of all the features are scored and
+    ranked with array operations (see :func:`get_span_candidates`), and only the text of the best spans of each
+    example is recovered, in a pool of ``num_workers`` processes.
+    """
+    logger.info("Writing predictions to: %s" % (output_prediction_file))
+    logger.info("Writing nbest to: %s" % (output_nbest_file))
+
+    # features grouped by example, in their original order
+    example_of_feature = np.array([feature.example_index for feature in all_features], dtype=np.int64)
+    order = np.argsort(example_of_feature, kind="stable")
+    features = [all_features[i] for i in order]
+    example_of_feature = example_of_feature[order]
+    feature_starts = np.searchsorted(example_of_feature, np.arange(len(all_examples) + 1))
+
+    unique_id_to_result = {}
+    for result in all_results:
+        unique_id_to_result[result.unique_id] = result
+    results = [unique_id_to_result[feature.unique_id] for feature in features]
+    start_logits = np.array([result.start_logits for result in results], dtype=np.float64)
+    end_logits = np.array([result.end_logits for result in results], dtype=np.float64)
+    start_logits = start_logits.reshape(len(features), -1)
+    end_logits = end_logits.reshape(len(features), -1)
+    seq_len = start_logits.shape[1]
+    num_tokens = np.array([len(feature.tokens) for feature in features], dtype=np.int64)
+    token_to_orig, max_context = _position_arrays(features, seq_len)
+
+    feature_index, start_index, end_index, span_start_logits, span_end_logits = get_span_candidates(
+        start_logits, end_logits, num_tokens, token_to_orig, max_context, n_best_size, max_answer_length
+    )
+    scores = span_start_logits + span_end_logits
+    # by example, then by decreasing score; the sort is stable, so ties keep the order of the loops
+    ranking = np.lexsort((-scores, example_of_feature[feature_index]))
+    candidate_starts = np.searchsorted(example_of_feature[feature_index][ranking], np.arange(len(all_examples) + 1))
+    candidates = np.stack(
+        [
+            feature_index[ranking],
+            start_index[ranking],
+            end_index[ranking],
+            token_to_orig[feature_index, start_index][ranking],
+            token_to_orig[feature_index, end_index][ranking],
+        ],
+        axis=1,
+    ).tolist()
+    span_start_logits = span_start_logits[ranking].tolist()
+    span_end_logits = span_end_logits[ranking].tolist()
+    scores = scores[ranking]
+    null_scores = start_logits[:, 0] + end_logits[:, 0]
+
+    def payloads():
+        for example_index, example in enumerate(all_examples):
+            first_feature, last_feature = feature_starts[example_index], feature_starts[example_index + 1]
+            first, last = candidate_starts[example_index], candidate_starts[example_index + 1]
+            example_candidates = [
+                candidates[i] + [span_start_logits[i], span_end_logits[i]] for i in range(first, last)
+            ]
+            for candidate in example_candidates:
+                candidate[0] -= first_feature
+            # the feature with the minimum null score, as long as it is below the initial ``score_null``
+            score_null, null_feature, null_logits = 1000000, 0, (0, 0)
+            if last_feature > first_feature:
+                best = first_feature + int(np.argmin(null_scores[first_feature:last_feature]))
+                if null_scores[best] < score_null:
+                    score_null, null_feature = null_scores[best], best - first_feature
+                    null_logits = (start_logits[best, 0].item(), end_logits[best, 0].item())
+            if version_2_with_negative:
+                # after the spans of equal score, as if it were appended before sorting
+                position = int(np.searchsorted(-scores[first:last], -(null_logits[0] + null_logits[1]), side="right"))
+                example_candidates.insert(position, [null_feature, 0, 0, 0, 0, null_logits[0], null_logits[1]])
+            tokens = [list(feature.tokens) for feature in features[first_feature:last_feature]]
+            yield (example_candidates, tokens, list(example.doc_tokens), null_logits), score_null
+
+    all_predictions = collections.OrderedDict()
+    all_nbest_json = collections.OrderedDict()
+    scores_diff_json = collections.OrderedDict()
+
+    settings = (tokenizer, n_best_size, do_lower_case, verbose_logging, version_2_with_negative, map_to_origin)
+    score_nulls = []
+
+    def tracked_payloads():
+        for payload, score_null in payloads():
+            score_nulls.append(score_null)
+            yield payload
+
+    if num_workers > 1:
+        pool = Pool(num_workers, initializer=_init_nbest_decoder, initargs=settings)
+        all_nbest = pool.imap(_decode_nbest, tracked_payloads(), chunksize=64)
+    else:
+        pool = None
+        _init_nbest_decoder(*settings)
+        all_nbest = map(_decode_nbest, tracked_payloads())
+
+    for example_index, (example, nbest) in enumerate(zip(all_examples, all_nbest)):
+        total_scores = []
+        best_non_null_entry = None
+        for entry in nbest:
+            total_scores.append(entry[1] + entry[2])
+            if not best_non_null_entry:
+                if entry[0]:
+                    best_non_null_entry = entry
+
+        probs = _compute_softmax(total_scores)
+
+        nbest_json = []
+        for (i, entry) in enumerate(nbest):
+            output = collections.OrderedDict()
+            output["text"] = entry[0]
+            output["probability"] = probs[i]
+            output["start_logit"] = entry[1]
+            output["end_logit"] = entry[2]
+            nbest_json.append(output)
+
+        if not version_2_with_negative:
+            all_predictions[example.qas_id] = nbest_json[0]["text"]
+        else:
+            # predict "" iff the null score - the score of best non-null > threshold
+            score_diff = score_nulls[example_index] - best_non_null_entry[1] - best_non_null_entry[2]
+            scores_diff_json[example.qas_id] = score_diff
+            if score_diff > null_score_diff_threshold:
+                all_predictions[example.qas_id] = ""
+            else:
+                all_predictions[example.qas_id] = best_non_null_entry[0]
+        all_nbest_json[example.qas_id] = nbest_json
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    with open(output_prediction_file, "w") as writer:
+        writer.write(json.dumps(all_predictions, indent=4) + "\n")
+
+    with open(output_nbest_file, "w") as writer:
+        writer.write(json.dumps(all_nbest_json, indent=4) + "\n")
+
+    if version_2_with_negative:
+        with open(output_null_log_odds_file, "w") as writer:
+            writer.write(json.dumps(scores_diff_json, indent=4) + "\n")
+
+    return all_predictions
+
+
 def compute_predictions_log_probs(
     all_examples,
     all_features,
@@ -0,0 +1,156 @@
+# coding=utf-8
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+""" Loader drawing whole batches from several task datasets, with resumable sampling state """
+
+import math
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Sampler
+
+
+def task_probabilities(sizes, task_ratio=1.0):
+    """
+    Probability of sampling each task: its share of the examples raised to ``task_ratio`` and renormalized. A ratio
+    of 1 samples in proportion to the sizes, 0 samples the tasks uniformly.
+    """
+    probs = np.asarray(sizes, dtype=np.float64) / np.sum(sizes)
+    probs = probs ** task_ratio
+    return probs / probs.sum()
+
+
+class AliasTable(object):
+    """Walker's alias method: draws from a discrete distribution in constant time with two random numbers."""
+
+    def __init__(self, probs):
+        probs = np.asarray(probs, dtype=np.float64)
+        num_outcomes = len(probs)
+        scaled = probs * num_outcomes / probs.sum()
+        self.prob = np.ones(num_outcomes)
+        self.alias = np.arange(num_outcomes)
+        small = [i for i in range(num_outcomes) if scaled[i] < 1.0]
+        large = [i for i in range(num_outcomes) if scaled[i] >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] += scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+
+    def sample(self, rng, size=None):
+        """Draws ``size`` outcomes (a single one if ``None``) with the ``np.random.RandomState`` ``rng``."""
+        outcome = rng.randint(len(self.prob), size=size)
+        keep = rng.random_sample(size) < self.prob[outcome]
+        return np.where(keep, outcome, self.alias[outcome])
+
+
+class TaskBatchSampler(Sampler):
+    """
+    Batch sampler over a random permutation of the dataset that changes with :meth:`set_epoch`, and that can
+    start in the middle of an epoch. As with ``DistributedSampler``, each of the ``num_replicas`` processes gets
+    a slice of the permutation, repeated so that they all get the same number of batches.
+
+    Args:
+        num_examples: Size of the dataset.
+        batch_size: Batch size of each replica.
+        seed: Seed of the permutations.
+        num_replicas: Number of distributed processes, defaults to the world size if distributed training is
+            initialized.
+        rank: Rank of the current process.
+    """
+
+    def __init__(self, num_examples, batch_size, seed=0, num_replicas=None, rank=None):
+        if num_replicas is None:
+            num_replicas = torch.distributed.get_world_size() if torch.distributed.is_initialized() else 1
+        if rank is None:
+            rank = torch.distributed.get_rank() if num_replicas > 1 else 0
+        self.num_examples = num_examples
+        self.batch_size = batch_size
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.num_samples = int(math.ceil(num_examples / num_replicas))
+        self.epoch = 0
+        self.start_batch = 0
+
+    def set_epoch(self, epoch, start_batch=0):
+        self.epoch = epoch
+        self.start_batch = start_batch
+
+    def __len__(self):
+        return (self.num_samples + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        indices = torch.randperm(self.num_examples, generator=generator).numpy()
+        indices = np.resize(indices, self.num_samples * self.num_replicas)[self.rank :: self.num_replicas]
+        for start in range(self.start_batch * self.batch_size, len(indices), self.batch_size):
+            yield indices[start : start + self.batch_size].tolist()
+
+
+class MultiTaskLoader(object):
+    """
+    Iterates forever over ``(task_index, batch)`` pairs: the task of each batch is drawn with
+    :func:`task_probabilities`, and the whole batch is taken from the ``DataLoader`` of that task, which keeps
+    its own workers prefetching batches. A task starts a new epoch when its loader is exhausted.
+
+    The task draws and the position of each task in its epoch are saved by :meth:`state_dict`, so that a resumed
+    training sees the same batches as an uninterrupted one. Processes of a distributed training must use the same
+    ``seed`` to draw the same tasks.
+
+    Args:
+        datasets: Dataset of each task.
+        batch_size: Batch size of each process.
+        task_ratio: Temperature of :func:`task_probabilities`.
+        seed: Seed of the task draws and of the permutations of the datasets.
+        num_replicas: Number of distributed processes (see :class:`TaskBatchSampler`).
+        rank: Rank of the current process.
+        loader_kwargs: Other arguments of the ``DataLoader`` of each task, e.g. ``num_workers`` or ``pin_memory``.
+    """
+
+    def __init__(self, datasets, batch_size, task_ratio=1.0, seed=0, num_replicas=None, rank=None, **loader_kwargs):
+        self.batch_samplers = [
+            TaskBatchSampler(len(dataset), batch_size, seed=seed + i, num_replicas=num_replicas, rank=rank)
+            for i, dataset in enumerate(datasets)
+        ]
+        self.loaders = [
+            DataLoader(dataset, batch_sampler=batch_sampler, **loader_kwargs)
+            for dataset, batch_sampler in zip(datasets, self.batch_samplers)
+        ]
+        self.probs = task_probabilities([len(dataset) for dataset in datasets], task_ratio)
+        self.alias_table = AliasTable(self.probs)
+        self.rng = np.random.RandomState(seed)
+        self.epochs = [0] * len(datasets)
+        self.positions = [0] * len(datasets)
+
+    def state_dict(self):
+        # plain python values only, so that the state also loads with torch.load(..., weights_only=True)
+        name, keys, pos, has_gauss, cached_gaussian = self.rng.get_state()
+        rng = (name, keys.tolist(), int(pos), int(has_gauss), float(cached_gaussian))
+        return {"rng": rng, "epochs": list(self.epochs), "positions": list(self.positions)}
+
+    def load_state_dict(self, state_dict):
+        name, keys, pos, has_gauss, cached_gaussian = state_dict["rng"]
+        self.rng.set_state((name, np.asarray(keys, dtype=np.uint32), pos, has_gauss, cached_gaussian))
+        self.epochs = list(state_dict["epochs"])
+        self.positions = list(state_dict["positions"])
+
+    def _start_epoch(self, task):
+        if self.positions[task] >= len(self.loaders[task]):
+            self.epochs[task] += 1
+            self.positions[task] = 0
+        self.batch_samplers[task].set_epoch(self.epochs[task], self.positions[task])
+        return iter(self.loaders[task])
+
+    def __iter__(self):
+        # every loader starts prefetching right away
+        iterators = [self._start_epoch(task) for task in range(len(self.loaders))]
+        while True:
+            task = int(self.alias_table.sample(self.rng))
+            if self.positions[task] >= len(self.loaders[task]):
+                iterators[task] = self._start_epoch(task)
+            batch = next(iterators[task])
+            self.positions[task] += 1
+            yield task, batch
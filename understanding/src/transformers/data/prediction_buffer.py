@@ -0,0 +1,79 @@
+# coding=utf-8
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+""" Preallocated buffer collecting the predictions of an evaluation loop """
+
+import numpy as np
+import torch
+
+
+class PredictionBuffer(object):
+    """
+    Collects the predictions and labels of an evaluation set batch by batch into arrays allocated once for the
+    whole set, instead of growing them with ``np.append``.
+
+    Args:
+        num_examples: Number of examples of the evaluation set, e.g. ``len(eval_sampler)``.
+        reduce: ``"argmax"`` or ``"softmax"`` to apply it to the last dimension of the logits on their device,
+            before they are copied to the host. ``None`` keeps the logits.
+    """
+
+    def __init__(self, num_examples, reduce=None):
+        if reduce not in [None, "argmax", "softmax"]:
+            raise ValueError("Unknown reduction: {}".format(reduce))
+        self.num_examples = num_examples
+        self.reduce = reduce
+        self.count = 0
+        self._preds = None
+        self._labels = None
+
+    @staticmethod
+    def _allocate(num_examples, tensor):
+        return np.empty((num_examples,) + tuple(tensor.shape[1:]), dtype=tensor.numpy().dtype)
+
+    def add(self, logits, labels=None, indices=None):
+        """
+        Stores a batch of ``logits`` and ``labels``, at the next rows or, if the batch was sampled out of order,
+        at the rows given by its dataset ``indices``.
+        """
+        logits = logits.detach()
+        if self.reduce == "argmax":
+            logits = logits.argmax(dim=-1)
+        elif self.reduce == "softmax":
+            logits = torch.softmax(logits, dim=-1)
+        logits = logits.cpu()
+        if labels is not None:
+            labels = labels.detach().cpu()
+
+        if self._preds is None:
+            self._preds = self._allocate(self.num_examples, logits)
+            if labels is not None:
+                self._labels = self._allocate(self.num_examples, labels)
+        if indices is None:
+            rows = slice(self.count, self.count + len(logits))
+        else:
+            rows = indices.cpu().numpy()
+        self._preds[rows] = logits.numpy()
+        if labels is not None:
+            self._labels[rows] = labels.numpy()
+        self.count += len(logits)
+
+    @property
+    def preds(self):
+        return self._preds[: self.count] if self._preds is not None else None
+
+    @property
+    def labels(self):
+        return self._labels[: self.count] if self._labels is not None else None
+
+    def write(self, path, format_fn=str, chunk_size=10000):
+        """Writes one line per prediction to ``path``, see :func:`write_predictions`."""
+        write_predictions(path, self.preds, format_fn, chunk_size)
+
+
+def write_predictions(path, preds, format_fn=str, chunk_size=10000):
+    """Writes one line per row of the array ``preds`` to ``path``, formatted with ``format_fn``, a chunk of rows at
+    a time."""
+    with open(path, "w") as writer:
+        for start in range(0, len(preds), chunk_size):
+            writer.write("".join(format_fn(pred) + "\n" for pred in preds[start : start + chunk_size].tolist()))
@@ -17,6 +17,11 @@
 
 import logging
 import os
+from functools import partial
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+from tqdm import tqdm
 
 from ...file_utils import is_tf_available
 from .utils import DataProcessor, InputExample, InputFeatures
@@ -39,6 +44,9 @@ def xglue_convert_examples_to_features(
     pad_token=0,
     pad_token_segment_id=0,
     mask_padding_with_zero=True,
+    pad_to_max_length=True,
+    threads=1,
+    return_arrays=False,
 ):
     """
     Loads a data file into a list of ``InputFeatures``
@@ -56,11 +64,17 @@ def xglue_convert_examples_to_features(
         mask_padding_with_zero: If set to ``True``, the attention mask will be filled by ``1`` for actual values
             and by ``0`` for padded values. If set to ``False``, inverts it (``1`` for padded values, ``0`` for
             actual values)
+        pad_to_max_length: If set to ``False``, the features keep the length of their example (truncated to
+            ``max_length``) and are padded by batch instead, e.g. with :class:`~transformers.PadCollator`
+        threads: Number of processes converting chunks of examples in parallel
+        return_arrays: If set to ``True``, returns the features as the arrays of a features cache (see
+            :func:`~transformers.features_to_arrays`) instead of ``InputFeatures``
 
     Returns:
         If the ``examples`` input is a ``tf.data.Dataset``, will return a ``tf.data.Dataset``
         containing the task-specific features. If the input is a list of ``InputExamples``, will return
-        a list of task-specific ``InputFeatures`` which can be fed to the model.
+        a list of task-specific ``InputFeatures`` which can be fed to the model, or their arrays if
+        ``return_arrays`` is set.
 
     """
     is_tf_dataset = False
@@ -78,6 +92,34 @@ def xglue_convert_examples_to_features(
 
     label_map = {label: i for i, label in enumerate(label_list)}
 
+    if not is_tf_dataset and (threads > 1 or return_arrays):
+        arrays = xglue_convert_examples_to_arrays(
+            examples,
+            tokenizer,
+            max_length=max_length,
+            label_map=label_map,
+            output_mode=output_mode,
+            pad_on_left=pad_on_left,
+            pad_token=pad_token,
+            pad_token_segment_id=pad_token_segment_id,
+            mask_padding_with_zero=mask_padding_with_zero,
+            pad_to_max_length=pad_to_max_length,
+            threads=threads,
+        )
+        if return_arrays:
+            return arrays
+        offsets = arrays["offsets"]
+        return [
+            InputFeatures(
+                input_ids=arrays["input_ids"][offsets[i] : offsets[i + 1]].tolist(),
+                attention_mask=arrays["attention_mask"][offsets[i] : offsets[i + 1]].tolist(),
+                token_type_ids=arrays["token_type_ids"][offsets[i] : offsets[i + 1]].tolist(),
+                label=arrays["labels"][i].item(),
+                guid=example.guid,
+            )
+            for i, example in enumerate(examples)
+        ]
+
     features = []
     for (ex_index, example) in enumerate(examples):
         len_examples = 0
@@ -98,23 +140,24 @@ def xglue_convert_examples_to_features(
         attention_mask = [1 if mask_padding_with_zero else 0] * len(input_ids)
 
         # Zero-pad up to the sequence length.
-        padding_length = max_length - len(input_ids)
-        if pad_on_left:
-            input_ids = ([pad_token] * padding_length) + input_ids
-            attention_mask = ([0 if mask_padding_with_zero else 1] * padding_length) + attention_mask
-            token_type_ids = ([pad_token_segment_id] * padding_length) + token_type_ids
-        else:
-            input_ids = input_ids + ([pad_token] * padding_length)
-            attention_mask = attention_mask + ([0 if mask_padding_with_zero else 1] * padding_length)
-            token_type_ids = token_type_ids + ([pad_token_segment_id] * padding_length)
+        if pad_to_max_length:
+            padding_length = max_length - len(input_ids)
+            if pad_on_left:
+                input_ids = ([pad_token] * padding_length) + input_ids
+                attention_mask = ([0 if mask_padding_with_zero else 1] * padding_length) + attention_mask
+                token_type_ids = ([pad_token_segment_id] * padding_length) + token_type_ids
+            else:
+                input_ids = input_ids + ([pad_token] * padding_length)
+                attention_mask = attention_mask + ([0 if mask_padding_with_zero else 1] * padding_length)
+                token_type_ids = token_type_ids + ([pad_token_segment_id] * padding_length)
 
-        assert len(input_ids) == max_length, "Error with input length {} vs {}".format(len(input_ids), max_length)
-        assert len(attention_mask) == max_length, "Error with input length {} vs {}".format(
-            len(attention_mask), max_length
-        )
-        assert len(token_type_ids) == max_length, "Error with input length {} vs {}".format(
-            len(token_type_ids), max_length
-        )
+            assert len(input_ids) == max_length, "Error with input length {} vs {}".format(len(input_ids), max_length)
+            assert len(attention_mask) == max_length, "Error with input length {} vs {}".format(
+                len(attention_mask), max_length
+            )
+            assert len(token_type_ids) == max_length, "Error with input length {} vs {}".format(
+                len(token_type_ids), max_length
+            )
 
         if output_mode == "classification":
             label = label_map[example.label]
@@ -168,6 +211,96 @@ def xglue_convert_examples_to_features(
     return features
 
 
+def xglue_convert_examples_to_arrays_init(tokenizer_for_convert):
+    global tokenizer
+    tokenizer = tokenizer_for_convert
+
+
+def xglue_convert_chunk_to_arrays(
+    chunk,
+    max_length,
+    label_map,
+    output_mode,
+    pad_on_left,
+    pad_token,
+    pad_token_segment_id,
+    mask_padding_with_zero,
+    pad_to_max_length,
+):
+    """Converts a list of ``(text_a, text_b, label)`` with the global ``tokenizer`` into concatenated sequences."""
+    encoded = [
+        tokenizer.encode_plus(text_a, text_b, add_special_tokens=True, max_length=max_length)
+        for text_a, text_b, _ in chunk
+    ]
+    if pad_to_max_length:
+        lengths = np.full(len(chunk), max_length, dtype=np.int64)
+    else:
+        lengths = np.array([len(inputs["input_ids"]) for inputs in encoded], dtype=np.int64)
+    offsets = np.zeros(len(chunk) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    input_ids = np.full(offsets[-1], pad_token, dtype=np.int64)
+    attention_mask = np.full(offsets[-1], 0 if mask_padding_with_zero else 1, dtype=np.int64)
+    token_type_ids = np.full(offsets[-1], pad_token_segment_id, dtype=np.int64)
+    for i, inputs in enumerate(encoded):
+        length = len(inputs["input_ids"])
+        start = offsets[i + 1] - length if pad_on_left else offsets[i]
+        input_ids[start : start + length] = inputs["input_ids"]
+        attention_mask[start : start + length] = 1 if mask_padding_with_zero else 0
+        token_type_ids[start : start + length] = inputs["token_type_ids"]
+
+    if output_mode == "classification":
+        labels = np.array([label_map[label] for _, _, label in chunk], dtype=np.int64)
+    elif output_mode == "regression":
+        labels = np.array([float(label) for _, _, label in chunk], dtype=np.float32)
+    else:
+        raise KeyError(output_mode)
+    return input_ids, attention_mask, token_type_ids, lengths, labels
+
+
+def xglue_convert_examples_to_arrays(examples, tokenizer, threads=1, chunk_size=1000, **kwargs):
+    """
+    Converts ``InputExamples`` into the arrays of a features cache, tokenizing chunks of ``chunk_size`` examples in
+    ``threads`` processes. ``kwargs`` are the conversion arguments of :func:`xglue_convert_examples_to_features`.
+    """
+    chunks = [
+        [(example.text_a, example.text_b, example.label) for example in examples[start : start + chunk_size]]
+        for start in range(0, len(examples), chunk_size)
+    ]
+    convert = partial(xglue_convert_chunk_to_arrays, **kwargs)
+    threads = min(threads, cpu_count(), max(1, len(chunks)))
+    if threads > 1:
+        with Pool(threads, initializer=xglue_convert_examples_to_arrays_init, initargs=(tokenizer,)) as p:
+            results = list(tqdm(p.imap(convert, chunks), total=len(chunks), desc="convert xglue examples to features"))
+    else:
+        xglue_convert_examples_to_arrays_init(tokenizer)
+        results = [convert(chunk) for chunk in tqdm(chunks, desc="convert xglue examples to features")]
+
+    lengths = np.concatenate([np.zeros(0, dtype=np.int64)] + [result[3] for result in results])
+    offsets = np.zeros(len(examples) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    arrays = {name: np.empty(offsets[-1], dtype=np.int64) for name in ["input_ids", "attention_mask", "token_type_ids"]}
+    start = 0
+    for result in results:
+        end = start + len(result[0])
+        arrays["input_ids"][start:end] = result[0]
+        arrays["attention_mask"][start:end] = result[1]
+        arrays["token_type_ids"][start:end] = result[2]
+        start = end
+    arrays["offsets"] = offsets
+    label_dtype = results[0][4].dtype if results else np.int64
+    arrays["labels"] = np.concatenate([np.zeros(0, dtype=label_dtype)] + [result[4] for result in results])
+    guids = [(example.guid if example.guid is not None else "").encode("utf-8") for example in examples]
+    arrays["guids"] = np.array(guids, dtype="S%d" % max([1] + [len(g) for g in guids]))
+
+    for i in range(min(5, len(examples))):
+        logger.info("*** Example ***")
+        logger.info("guid: %s" % (examples[i].guid))
+        logger.info("input_ids: %s" % " ".join([str(x) for x in arrays["input_ids"][offsets[i] : offsets[i + 1]]]))
+        logger.info("label: %s (id = %s)" % (examples[i].label, arrays["labels"][i]))
+    return arrays
+
+
 class MrpcProcessor(DataProcessor):
     """Processor for the MRPC data set (GLUE version)."""
 
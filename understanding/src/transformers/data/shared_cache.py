@@ -0,0 +1,166 @@
+# coding=utf-8
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+""" Content-addressed cache of features shared by the tasks, runs and processes using the same data """
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Temporary files older than this were left by killed writers.
+_STALE_TMP_SECONDS = 24 * 3600
+_file_hashes = {}
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """SHA-1 of the contents of ``path``, computed once per process for a given size and modification time."""
+    stat = os.stat(path)
+    memo_key = (os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _file_hashes:
+        sha = hashlib.sha1()
+        with open(path, "rb") as reader:
+            for chunk in iter(lambda: reader.read(chunk_size), b""):
+                sha.update(chunk)
+        _file_hashes[memo_key] = sha.hexdigest()
+    return _file_hashes[memo_key]
+
+
+def file_signature(path, hash_contents=False):
+    """
+    Identifies the contents of the file at ``path`` by its name, size and modification time, or by the hash of its
+    contents if ``hash_contents`` is set. Missing files get ``None``.
+    """
+    if not os.path.isfile(path):
+        return None
+    if hash_contents:
+        return {"name": os.path.basename(path), "sha1": hash_file(path)}
+    stat = os.stat(path)
+    return {"name": os.path.basename(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def directory_signature(path, exclude_prefixes=("cached_",)):
+    """:func:`file_signature` of every file under ``path``, except the ones whose name starts with ``exclude_prefixes``."""
+    signatures = {}
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if name.startswith(tuple(exclude_prefixes)):
+                continue
+            file_path = os.path.join(root, name)
+            signatures[os.path.relpath(file_path, path)] = file_signature(file_path)
+    return signatures
+
+
+def tokenizer_signature(tokenizer):
+    """Identifies a tokenizer by its class, the contents of its vocabulary files, its options and its added tokens."""
+    vocab_files = {}
+    options = {}
+    for name, value in tokenizer.init_kwargs.items():
+        if name in tokenizer.vocab_files_names:
+            vocab_files[name] = file_signature(value, hash_contents=True) if value is not None else None
+        else:
+            options[name] = value
+    return {
+        "class": type(tokenizer).__name__,
+        "vocab_files": vocab_files,
+        "options": options,
+        "added_tokens": sorted(tokenizer.added_tokens_encoder.items()),
+        "vocab_size": len(tokenizer),
+    }
+
+
+class SharedCache(object):
+    """
+    Directory of cache files named after the hash of everything they depend on (source files, tokenizer,
+    conversion parameters), so that tasks and runs pointing at the same directory reuse each other's features
+    whatever their model directory or output directory.
+
+    Entries are written to a temporary file and renamed, so that concurrent processes never read a partial
+    entry; when two of them build the same entry, the last rename wins and both are valid. Reading an entry
+    marks it as recently used, and the least recently used entries are removed when the directory grows over
+    ``max_size`` bytes.
+
+    Args:
+        cache_dir: Directory of the cache, created if needed.
+        max_size: Maximum total size of the entries, in bytes. ``None`` disables eviction.
+        suffix: Extension of the entry files.
+    """
+
+    def __init__(self, cache_dir, max_size=None, suffix=".features"):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.suffix = suffix
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(**parts):
+        """Hash of the JSON-serializable ``parts`` an entry depends on."""
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def lookup(self, key):
+        """Returns the path of the entry ``key`` and marks it as recently used, or ``None`` if it is not cached."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def store(self, key, write_fn):
+        """
+        Writes the entry ``key`` with ``write_fn(path)``, then evicts old entries if the cache is over its size.
+        Returns the path of the entry.
+        """
+        path = self.path(key)
+        tmp_path = "%s.tmp%d" % (path, os.getpid())
+        try:
+            write_fn(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """Removes the least recently used entries, but ``keep``, until the cache fits in ``max_size``."""
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if name.endswith(self.suffix):
+                entries.append((stat.st_mtime, stat.st_size, path))
+            elif ".tmp" in name and now - stat.st_mtime > _STALE_TMP_SECONDS:
+                self._remove(path)
+        if self.max_size is None:
+            return
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            if path == keep:
+                continue
+            # processes that already opened or mapped the entry keep reading it after the removal
+            logger.info("Evicting %s from the features cache", path)
+            self._remove(path)
+            total_size -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
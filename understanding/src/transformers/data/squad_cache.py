@@ -0,0 +1,223 @@
+# coding=utf-8
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+""" Cache of SQuAD-style features split into memory-mapped tensors and compact, lazily loaded metadata """
+
+import json
+
+import numpy as np
+
+from ..file_utils import is_torch_available
+from .feature_cache import load_features_cache, save_features_cache
+
+
+if is_torch_available():
+    import torch
+    from torch.utils.data import TensorDataset
+
+
+def pack_strings(strings):
+    """Encodes ``strings`` into one UTF-8 byte array and the offsets of each string in it."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+class PackedStrings(object):
+    """Read-only sequence of the strings packed by :func:`pack_strings`, decoded when accessed."""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return PackedStrings(self.data, self.offsets[start : max(start, stop) + 1]).tolist()
+        if index < 0:
+            index += len(self)
+        return self.data[self.offsets[index] : self.offsets[index + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def tolist(self):
+        start = self.offsets[0]
+        buffer = self.data[start : self.offsets[-1]].tobytes()
+        return [buffer[a - start : b - start].decode("utf-8") for a, b in zip(self.offsets[:-1], self.offsets[1:])]
+
+
+class PositionMap(object):
+    """
+    Read-only mapping over a row of an array, from the positions whose value is not ``missing`` to their value.
+    Replaces the ``token_to_orig_map`` and ``token_is_max_context`` dictionaries of the features.
+    """
+
+    def __init__(self, values, missing=-1, value_type=int):
+        self.values = values
+        self.missing = missing
+        self.value_type = value_type
+
+    def __contains__(self, position):
+        return 0 <= position < len(self.values) and self.values[position] != self.missing
+
+    def __getitem__(self, position):
+        if position not in self:
+            raise KeyError(position)
+        return self.value_type(self.values[position])
+
+    def get(self, position, default=None):
+        return self[position] if position in self else default
+
+
+class CompactSquadExample(object):
+    """The fields of a ``SquadExample`` used to post-process the predictions."""
+
+    def __init__(self, metadata, index):
+        self.qas_id = metadata["qas_ids"][index].decode("utf-8")
+        self.doc_tokens = PackedStrings(
+            metadata["doc_token_data"],
+            metadata["doc_token_offsets"][metadata["doc_offsets"][index] : metadata["doc_offsets"][index + 1] + 1],
+        )
+        self._answers = metadata["answers"][index]
+
+    @property
+    def answers(self):
+        return json.loads(self._answers)
+
+
+class CompactSquadFeatures(object):
+    """The fields of a ``SquadFeatures`` used to post-process the predictions, as views of the metadata arrays."""
+
+    def __init__(self, metadata, index):
+        self.example_index = int(metadata["example_index"][index])
+        self.unique_id = int(metadata["unique_id"][index])
+        self.paragraph_len = int(metadata["paragraph_len"][index])
+        self.tokens = PackedStrings(
+            metadata["token_data"],
+            metadata["token_offsets"][metadata["feature_offsets"][index] : metadata["feature_offsets"][index + 1] + 1],
+        )
+        self.token_to_orig_map = PositionMap(metadata["token_to_orig"][index])
+        self.token_is_max_context = PositionMap(metadata["token_is_max_context"][index], value_type=bool)
+
+
+class LazySequence(object):
+    """Sequence of ``length`` items built by ``factory(index)`` when accessed."""
+
+    def __init__(self, length, factory):
+        self.length = length
+        self.factory = factory
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        return self.factory(index)
+
+    def __iter__(self):
+        return (self.factory(i) for i in range(self.length))
+
+
+def squad_metadata_to_arrays(examples, features, max_seq_length):
+    """
+    Packs the fields of ``examples`` and ``features`` needed by the post-processing into arrays: strings are
+    concatenated, and the ``token_to_orig_map`` and ``token_is_max_context`` dictionaries become ``[num_features,
+    max_seq_length]`` arrays where ``-1`` marks the positions they do not contain.
+    """
+    token_to_orig = np.full((len(features), max_seq_length), -1, dtype=np.int32)
+    token_is_max_context = np.full((len(features), max_seq_length), -1, dtype=np.int8)
+    for i, feature in enumerate(features):
+        positions = np.fromiter(feature.token_to_orig_map.keys(), dtype=np.int64)
+        token_to_orig[i, positions] = np.fromiter(feature.token_to_orig_map.values(), dtype=np.int64)
+        positions = np.fromiter(feature.token_is_max_context.keys(), dtype=np.int64)
+        token_is_max_context[i, positions] = np.fromiter(feature.token_is_max_context.values(), dtype=np.int64)
+
+    token_data, token_offsets = pack_strings([token for feature in features for token in feature.tokens])
+    doc_token_data, doc_token_offsets = pack_strings([token for example in examples for token in example.doc_tokens])
+    qas_ids = [example.qas_id.encode("utf-8") for example in examples]
+    answers = [json.dumps(example.answers).encode("utf-8") for example in examples]
+
+    def cumulative_lengths(sequences):
+        offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+        np.cumsum([len(s) for s in sequences], out=offsets[1:])
+        return offsets
+
+    return {
+        "example_index": np.array([f.example_index for f in features], dtype=np.int64),
+        "unique_id": np.array([f.unique_id for f in features], dtype=np.int64),
+        "paragraph_len": np.array([f.paragraph_len for f in features], dtype=np.int64),
+        "token_to_orig": token_to_orig,
+        "token_is_max_context": token_is_max_context,
+        "feature_offsets": cumulative_lengths([f.tokens for f in features]),
+        "token_offsets": token_offsets,
+        "token_data": token_data,
+        "doc_offsets": cumulative_lengths([e.doc_tokens for e in examples]),
+        "doc_token_offsets": doc_token_offsets,
+        "doc_token_data": doc_token_data,
+        "qas_ids": np.array(qas_ids, dtype="S%d" % max([1] + [len(q) for q in qas_ids])),
+        "answers": np.array(answers, dtype="S%d" % max([1] + [len(a) for a in answers])),
+    }
+
+
+def save_squad_metadata(examples, features, path, max_seq_length, fingerprint=None):
+    """Saves the arrays of :func:`squad_metadata_to_arrays` to ``path``, see :func:`save_features_cache`."""
+    save_features_cache(
+        squad_metadata_to_arrays(examples, features, max_seq_length), path, fingerprint, num_features=len(features)
+    )
+
+
+def load_squad_metadata(path, fingerprint=None):
+    """
+    Maps the metadata saved by :func:`save_squad_metadata` or :func:`save_squad_cache` in memory.
+
+    Returns:
+        The examples and features, as sequences of :class:`CompactSquadExample` and :class:`CompactSquadFeatures`
+        built when accessed, or ``None`` if the cache is missing or stale.
+    """
+    metadata = load_features_cache(path, fingerprint)
+    if metadata is None:
+        return None
+    examples = LazySequence(len(metadata["qas_ids"]), lambda i: CompactSquadExample(metadata, i))
+    features = LazySequence(len(metadata["unique_id"]), lambda i: CompactSquadFeatures(metadata, i))
+    return examples, features
+
+
+def _tensor_arrays(dataset):
+    return {"tensor_{}".format(i): tensor.numpy() for i, tensor in enumerate(dataset.tensors)}
+
+
+def save_squad_tensors(dataset, path, fingerprint=None):
+    """Saves the tensors of a ``TensorDataset`` to ``path``, see :func:`save_features_cache`."""
+    save_features_cache(_tensor_arrays(dataset), path, fingerprint, num_features=len(dataset))
+
+
+def save_squad_cache(examples, features, dataset, path, max_seq_length, fingerprint=None):
+    """
+    Saves the tensors of ``dataset`` and the metadata of ``examples`` and ``features`` in one file, read by both
+    :func:`load_squad_tensors` and :func:`load_squad_metadata`, for caches that must not lose one without the other.
+    """
+    arrays = squad_metadata_to_arrays(examples, features, max_seq_length)
+    arrays.update(_tensor_arrays(dataset))
+    save_features_cache(arrays, path, fingerprint, num_features=len(features))
+
+
+def load_squad_tensors(path, fingerprint=None):
+    """
+    ``TensorDataset`` over the memory-mapped tensors saved by :func:`save_squad_tensors` or :func:`save_squad_cache`,
+    or ``None``.
+    """
+    arrays = load_features_cache(path, fingerprint)
+    if arrays is None:
+        return None
+    num_tensors = sum(name.startswith("tensor_") for name in arrays)
+    return TensorDataset(*[torch.from_numpy(arrays["tensor_{}".format(i)]) for i in range(num_tensors)])
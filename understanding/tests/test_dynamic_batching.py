@@ -0,0 +1,89 @@
+import unittest
+
+from transformers import InputFeatures, features_to_arrays, is_torch_available
+
+from .utils import require_torch
+
+
+if is_torch_available():
+    import torch
+    from transformers import (
+        ConcatFeaturesDataset,
+        DevicePrefetcher,
+        FeaturesDataset,
+        LengthGroupedSampler,
+        PadCollator,
+        SortedSampler,
+        get_lengths,
+    )
+
+
+@require_torch
+class DynamicBatchingTest(unittest.TestCase):
+    def get_dataset(self, lengths):
+        features = [
+            InputFeatures(input_ids=[i + 1] * length, attention_mask=[1] * length, token_type_ids=[0] * length, label=i)
+            for i, length in enumerate(lengths)
+        ]
+        return FeaturesDataset(features_to_arrays(features))
+
+    def test_pad_collator(self):
+        dataset = self.get_dataset([3, 1, 2])
+        input_ids, attention_mask, token_type_ids, labels, indices = PadCollator(pad_token=9)(
+            [dataset[1], dataset[0]]
+        )
+        self.assertListEqual(input_ids.tolist(), [[2, 9, 9], [1, 1, 1]])
+        self.assertListEqual(attention_mask.tolist(), [[1, 0, 0], [1, 1, 1]])
+        self.assertListEqual(token_type_ids.tolist(), [[0, 0, 0], [0, 0, 0]])
+        self.assertListEqual(labels.tolist(), [1, 0])
+        self.assertListEqual(indices.tolist(), [1, 0])
+
+        input_ids = PadCollator(pad_token=9, pad_on_left=True)([dataset[1], dataset[2]])[0]
+        self.assertListEqual(input_ids.tolist(), [[9, 2], [3, 3]])
+
+    def test_sorted_sampler(self):
+        dataset = self.get_dataset([3, 1, 4, 1])
+        self.assertListEqual(list(SortedSampler(dataset.lengths)), [2, 0, 1, 3])
+
+    def test_concat_features_dataset(self):
+        dataset = ConcatFeaturesDataset([self.get_dataset([3, 1]), self.get_dataset([2, 4, 1])])
+        self.assertListEqual(dataset.offsets, [0, 2, 5])
+        self.assertListEqual(get_lengths(dataset).tolist(), [3, 1, 2, 4, 1])
+        batch = PadCollator()([dataset[i] for i in SortedSampler(get_lengths(dataset))])
+        self.assertListEqual(batch[3].tolist(), [1, 0, 0, 1, 2])
+        self.assertListEqual(batch[4].tolist(), [3, 0, 2, 1, 4])
+
+    def test_device_prefetcher(self):
+        dataset = self.get_dataset([3, 1, 2])
+        loader = torch.utils.data.DataLoader(dataset, batch_size=2, collate_fn=PadCollator())
+        batches = list(DevicePrefetcher(loader, "cpu"))
+        self.assertEqual(len(batches), 2)
+        self.assertListEqual(batches[1][4].tolist(), [2])
+
+    def test_length_grouped_sampler(self):
+        torch.manual_seed(0)
+        lengths = torch.randint(1, 100, (102,)).tolist()
+        dataset = self.get_dataset(lengths)
+        sampler = LengthGroupedSampler(get_lengths(dataset), batch_size=4, mega_batch_mult=5)
+        loader = torch.utils.data.DataLoader(dataset, batch_sampler=sampler, collate_fn=PadCollator())
+        batches = [batch[4].tolist() for batch in loader]
+        self.assertEqual(len(batches), len(sampler))
+        self.assertListEqual([len(batch) for batch in batches], [4] * 25 + [2])
+        self.assertListEqual(sorted(sum(batches, [])), list(range(102)))
+        # batches are cut out of chunks sorted by length, the partial one included
+        for batch in batches:
+            batch_lengths = [lengths[i] for i in batch]
+            self.assertListEqual(batch_lengths, sorted(batch_lengths, reverse=True))
+
+    def test_distributed_length_grouped_sampler(self):
+        lengths = torch.randint(1, 100, (10,)).numpy()
+        samplers = [
+            LengthGroupedSampler(lengths, batch_size=2, mega_batch_mult=2, num_replicas=2, rank=rank)
+            for rank in range(2)
+        ]
+        replica_batches = [list(sampler) for sampler in samplers]
+        self.assertEqual(len(replica_batches[0]), len(samplers[0]))
+        self.assertEqual(len(replica_batches[0]), len(replica_batches[1]))
+        self.assertListEqual([len(batch) for batch in replica_batches[0]], [2, 2, 2])
+        replica_indices = [sum(batches, []) for batches in replica_batches]
+        self.assertSetEqual(set(replica_indices[0] + replica_indices[1]), set(range(10)))
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from transformers import InputFeatures, features_to_arrays, load_features_cache, save_features_cache
+from transformers.data.feature_cache import read_features_cache_header
+
+
+class FeatureCacheTest(unittest.TestCase):
+    def get_features(self):
+        return [
+            InputFeatures(input_ids=[0, 5, 6, 2], attention_mask=[1, 1, 1, 1], token_type_ids=[0, 0, 0, 0], label=1, guid="train-0"),
+            InputFeatures(input_ids=[0, 7, 2, 1], attention_mask=[1, 1, 1, 0], token_type_ids=[0, 0, 0, 0], label=0, guid="train-1"),
+        ]
+
+    def test_save_and_load(self):
+        features = self.get_features()
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            path = os.path.join(tmpdirname, "cached_train")
+            save_features_cache(features, path, {"max_seq_length": 4})
+            cache = load_features_cache(path, {"max_seq_length": 4})
+
+            self.assertIsInstance(cache["input_ids"], np.memmap)
+            self.assertListEqual(cache["input_ids"].tolist(), [0, 5, 6, 2, 0, 7, 2, 1])
+            self.assertListEqual(cache["attention_mask"].tolist(), [1, 1, 1, 1, 1, 1, 1, 0])
+            self.assertListEqual(cache["token_type_ids"].tolist(), [0] * 8)
+            self.assertListEqual(cache["offsets"].tolist(), [0, 4, 8])
+            self.assertListEqual(cache["labels"].tolist(), [1, 0])
+            self.assertListEqual([g.decode("utf-8") for g in cache["guids"]], ["train-0", "train-1"])
+            for name, array in features_to_arrays(features).items():
+                self.assertEqual(cache[name].dtype, array.dtype)
+
+    def test_stale_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            path = os.path.join(tmpdirname, "cached_train")
+            self.assertIsNone(load_features_cache(path))
+
+            save_features_cache(self.get_features(), path, {"max_seq_length": 4})
+            self.assertIsNone(load_features_cache(path, {"max_seq_length": 8}))
+
+            with open(path, "wb") as writer:
+                writer.write(b"not a features cache")
+            self.assertIsNone(load_features_cache(path))
+
+    def test_unpadded_features(self):
+        features = self.get_features()
+        features[1].input_ids = features[1].input_ids[:3]
+        features[1].attention_mask = features[1].attention_mask[:3]
+        features[1].token_type_ids = features[1].token_type_ids[:3]
+        arrays = features_to_arrays(features)
+        self.assertListEqual(arrays["input_ids"].tolist(), [0, 5, 6, 2, 0, 7, 2])
+        self.assertListEqual(arrays["offsets"].tolist(), [0, 4, 7])
+
+    def test_num_features(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            path = os.path.join(tmpdirname, "cached_train")
+            save_features_cache(self.get_features(), path)
+            self.assertEqual(read_features_cache_header(path)[0]["num_features"], 2)
+
+            # the length of concatenated arrays is not the number of features
+            arrays = {"token_data": np.zeros(10, dtype=np.uint8)}
+            with self.assertRaises(ValueError):
+                save_features_cache(arrays, path)
+            save_features_cache(arrays, path, num_features=3)
+            self.assertEqual(read_features_cache_header(path)[0]["num_features"], 3)
@@ -0,0 +1,79 @@
+import unittest
+import warnings
+
+import numpy as np
+
+from transformers import is_sklearn_available
+from transformers.data.metrics.ranking import (
+    factorize_queries,
+    grouped_average_precision,
+    grouped_ndcg,
+    grouped_ranking_metrics,
+)
+
+
+if is_sklearn_available():
+    from sklearn.metrics import average_precision_score, ndcg_score
+    from transformers.data.metrics import simple_ndcg
+
+
+class RankingMetricsTest(unittest.TestCase):
+    def get_inputs(self, seed=0, num_documents=500, num_queries=60):
+        rng = np.random.RandomState(seed)
+        guids = ["dev-q%d_%d" % (rng.randint(num_queries), i) for i in range(num_documents)]
+        # integer scores, as XGLUE predictions, to exercise ties
+        preds = rng.randint(0, 5, num_documents)
+        labels = rng.randint(0, 5, num_documents)
+        return preds, labels, guids
+
+    def test_factorize_queries(self):
+        groups = factorize_queries(["dev-b_0", "dev-a_1", "dev-b_2", "dev-a_b_3"])
+        self.assertListEqual(groups.tolist(), [1, 0, 1, 0])
+
+    def test_single_document_queries_are_skipped(self):
+        ndcg = grouped_ndcg([1, 0, 2], [1, 0, 2], [0, 0, 1])
+        self.assertListEqual(ndcg.tolist(), [1.0])
+
+    def test_no_complete_query(self):
+        self.assertEqual(len(grouped_ndcg([1, 0], [1, 0], [0, 1])), 0)
+        self.assertEqual(len(grouped_average_precision([1, 0], [1, 0], [0, 1])), 0)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            metrics = grouped_ranking_metrics([1, 0], [1, 0], ["dev-a_0", "dev-b_1"])
+            self.assertDictEqual(metrics, {"ndcg": 0.0, "map": 0.0})
+            # no relevant document
+            metrics = grouped_ranking_metrics([1, 0], [0, 0], ["dev-a_0", "dev-a_1"])
+            self.assertDictEqual(metrics, {"ndcg": 0.0, "map": 0.0})
+            # empty evaluation set
+            self.assertEqual(len(factorize_queries([])), 0)
+            self.assertDictEqual(grouped_ranking_metrics([], [], []), {"ndcg": 0.0, "map": 0.0})
+
+    @unittest.skipUnless(is_sklearn_available(), "test requires scikit-learn")
+    def test_simple_ndcg_without_complete_query(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            self.assertDictEqual(simple_ndcg(np.array([1, 0]), np.array([1, 0]), ["dev-a_0", "dev-b_1"]), {"ndcg": 0.0})
+            self.assertDictEqual(simple_ndcg(np.array([]), np.array([]), []), {"ndcg": 0.0})
+
+    @unittest.skipUnless(is_sklearn_available(), "test requires scikit-learn")
+    def test_matches_sklearn(self):
+        for seed in range(3):
+            preds, labels, guids = self.get_inputs(seed)
+            groups = factorize_queries(guids)
+            for k in [None, 3]:
+                expected_ndcg, expected_ap = [], []
+                for group in np.unique(groups):
+                    members = groups == group
+                    if members.sum() < 2:
+                        continue
+                    expected_ndcg.append(ndcg_score([labels[members]], [preds[members]], k=k))
+                    if (labels[members] >= 1).any():
+                        expected_ap.append(average_precision_score(labels[members] >= 1, preds[members]))
+
+                np.testing.assert_allclose(grouped_ndcg(preds, labels, groups, k=k), expected_ndcg, rtol=0, atol=1e-9)
+                np.testing.assert_allclose(
+                    grouped_average_precision(preds, labels, groups), expected_ap, rtol=0, atol=1e-9
+                )
+                metrics = grouped_ranking_metrics(preds, labels, guids, k=k)
+                self.assertAlmostEqual(metrics["ndcg"], np.mean(expected_ndcg), delta=1e-9)
+                self.assertAlmostEqual(metrics["map"], np.mean(expected_ap), delta=1e-9)
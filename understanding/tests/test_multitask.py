@@ -0,0 +1,58 @@
+import unittest
+
+import numpy as np
+
+from transformers import is_torch_available
+
+from .utils import require_torch
+
+
+if is_torch_available():
+    import torch
+    from torch.utils.data import TensorDataset
+    from transformers import AliasTable, MultiTaskLoader, TaskBatchSampler, task_probabilities
+
+
+@require_torch
+class MultiTaskTest(unittest.TestCase):
+    def test_task_probabilities(self):
+        self.assertListEqual(task_probabilities([1, 3]).tolist(), [0.25, 0.75])
+        self.assertListEqual(task_probabilities([1, 3], task_ratio=0.0).tolist(), [0.5, 0.5])
+
+    def test_alias_table(self):
+        probs = np.array([0.1, 0.6, 0.05, 0.25])
+        samples = AliasTable(probs).sample(np.random.RandomState(0), size=100000)
+        frequencies = np.bincount(samples, minlength=4) / len(samples)
+        self.assertTrue(np.allclose(frequencies, probs, atol=0.01))
+
+    def test_task_batch_sampler(self):
+        sampler = TaskBatchSampler(10, batch_size=4, num_replicas=1)
+        batches = list(sampler)
+        self.assertEqual(len(batches), len(sampler))
+        self.assertListEqual(sorted(sum(batches, [])), list(range(10)))
+
+        sampler.set_epoch(0, start_batch=1)
+        self.assertListEqual(list(sampler), batches[1:])
+        sampler.set_epoch(1)
+        self.assertNotEqual(list(sampler), batches)
+
+        replicas = [list(TaskBatchSampler(10, batch_size=2, num_replicas=3, rank=rank)) for rank in range(3)]
+        self.assertListEqual([len(batches) for batches in replicas], [2, 2, 2])
+        self.assertSetEqual(set(sum(sum(replicas, []), [])), set(range(10)))
+
+    def get_loader(self):
+        datasets = [TensorDataset(torch.arange(5)), TensorDataset(torch.arange(100, 103))]
+        return MultiTaskLoader(datasets, batch_size=2, seed=1, num_replicas=1)
+
+    def test_resume(self):
+        loader = self.get_loader()
+        iterator = iter(loader)
+        for _ in range(5):
+            next(iterator)
+        state = loader.state_dict()
+        expected = [(task, batch[0].tolist()) for task, batch in (next(iterator) for _ in range(10))]
+
+        resumed = self.get_loader()
+        resumed.load_state_dict(state)
+        iterator = iter(resumed)
+        self.assertListEqual([(task, batch[0].tolist()) for task, batch in (next(iterator) for _ in range(10))], expected)
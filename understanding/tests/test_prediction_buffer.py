@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+from transformers import is_torch_available
+
+from .utils import require_torch
+
+
+if is_torch_available():
+    import torch
+    from transformers import PredictionBuffer, write_predictions
+
+
+@require_torch
+class PredictionBufferTest(unittest.TestCase):
+    def test_add(self):
+        logits = torch.randn(5, 3)
+        labels = torch.tensor([0, 1, 2, 1, 0])
+        buffer = PredictionBuffer(5)
+        buffer.add(logits[:2], labels[:2])
+        buffer.add(logits[2:], labels[2:])
+        self.assertTrue(torch.equal(torch.from_numpy(buffer.preds), logits))
+        self.assertListEqual(buffer.labels.tolist(), labels.tolist())
+
+    def test_reduce(self):
+        logits = torch.randn(4, 6, 3)
+        argmax = PredictionBuffer(4, reduce="argmax")
+        argmax.add(logits)
+        self.assertListEqual(argmax.preds.tolist(), logits.argmax(-1).tolist())
+        self.assertIsNone(argmax.labels)
+
+        softmax = PredictionBuffer(4, reduce="softmax")
+        softmax.add(logits)
+        self.assertTrue(torch.allclose(torch.from_numpy(softmax.preds), torch.softmax(logits, -1)))
+
+    def test_indices(self):
+        logits = torch.randn(4, 2)
+        buffer = PredictionBuffer(4, reduce="argmax")
+        buffer.add(logits[[3, 1]], indices=torch.tensor([3, 1]))
+        buffer.add(logits[[0, 2]], indices=torch.tensor([0, 2]))
+        self.assertListEqual(buffer.preds.tolist(), logits.argmax(-1).tolist())
+
+    def test_write(self):
+        buffer = PredictionBuffer(3, reduce="argmax")
+        buffer.add(torch.tensor([[0.0, 1.0], [1.0, 0.0], [0.0, 1.0]]))
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            path = os.path.join(tmpdirname, "en.prediction")
+            buffer.write(path, lambda item: ["neg", "pos"][item], chunk_size=2)
+            with open(path) as reader:
+                self.assertEqual(reader.read(), "pos\nneg\npos\n")
+
+    def test_write_predictions(self):
+        preds = torch.tensor([1, 0, 1, 1, 0]).numpy()
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            path = os.path.join(tmpdirname, "en.prediction")
+            write_predictions(path, preds[1:4], lambda item: ["neg", "pos"][item], chunk_size=2)
+            with open(path) as reader:
+                self.assertEqual(reader.read(), "neg\npos\npos\n")
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import time
+import unittest
+
+from transformers import SharedCache, directory_signature, file_signature
+
+
+class SharedCacheTest(unittest.TestCase):
+    def write(self, path, data):
+        with open(path, "w") as writer:
+            writer.write(data)
+
+    def test_store_and_lookup(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            cache = SharedCache(os.path.join(tmpdirname, "cache"))
+            key = cache.key(split="train", max_seq_length=128)
+            self.assertEqual(key, cache.key(max_seq_length=128, split="train"))
+            self.assertNotEqual(key, cache.key(split="train", max_seq_length=256))
+            self.assertIsNone(cache.lookup(key))
+
+            path = cache.store(key, lambda path: self.write(path, "features"))
+            self.assertEqual(cache.lookup(key), path)
+            self.assertListEqual(os.listdir(cache.cache_dir), [os.path.basename(path)])
+
+    def test_failed_write(self):
+        def write_fn(path):
+            self.write(path, "partial")
+            raise RuntimeError()
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            cache = SharedCache(tmpdirname)
+            with self.assertRaises(RuntimeError):
+                cache.store("key", write_fn)
+            self.assertIsNone(cache.lookup("key"))
+            self.assertListEqual(os.listdir(tmpdirname), [])
+
+    def test_lru_eviction(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            cache = SharedCache(tmpdirname, max_size=20)
+            now = time.time()
+            for i, key in enumerate(["a", "b"]):
+                cache.store(key, lambda path: self.write(path, "0123456789"))
+                os.utime(cache.path(key), (now - 100 + i, now - 100 + i))
+            # "a" is used after "b", so "b" is the least recently used
+            cache.lookup("a")
+            cache.store("c", lambda path: self.write(path, "0123456789"))
+            self.assertIsNotNone(cache.lookup("a"))
+            self.assertIsNone(cache.lookup("b"))
+            self.assertIsNotNone(cache.lookup("c"))
+
+    def test_signatures(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            path = os.path.join(tmpdirname, "train.tsv")
+            self.write(path, "a\tb\n")
+            self.write(os.path.join(tmpdirname, "cached_train"), "features")
+            self.assertListEqual(list(directory_signature(tmpdirname).keys()), ["train.tsv"])
+            self.assertIsNone(file_signature(os.path.join(tmpdirname, "missing")))
+
+            signature = file_signature(path, hash_contents=True)
+            self.write(path, "a\tcc\n")
+            self.assertNotEqual(file_signature(path, hash_contents=True), signature)
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+
+from transformers import SquadExample, SquadFeatures, is_torch_available, load_squad_metadata, save_squad_metadata
+
+from .utils import require_torch
+
+
+if is_torch_available():
+    import torch
+    from torch.utils.data import TensorDataset
+    from transformers import load_squad_tensors, save_squad_cache
+
+
+class SquadCacheTest(unittest.TestCase):
+    def get_examples_and_features(self):
+        example = SquadExample(
+            qas_id="q0",
+            question_text="Où ?",
+            context_text="Le chat dort à Paris",
+            answer_text=None,
+            start_position_character=None,
+            title="",
+            answers=[{"text": "Paris", "answer_start": 15}],
+        )
+        feature = SquadFeatures(
+            input_ids=[0, 5, 6, 7, 2, 1],
+            attention_mask=[1, 1, 1, 1, 1, 0],
+            token_type_ids=[0] * 6,
+            cls_index=0,
+            p_mask=[1, 0, 0, 0, 1, 1],
+            example_index=0,
+            unique_id=1000000000,
+            paragraph_len=3,
+            token_is_max_context={1: True, 2: False, 3: True},
+            tokens=["<s>", "▁à", "▁Par", "is", "</s>"],
+            token_to_orig_map={1: 3, 2: 4, 3: 4},
+            start_position=0,
+            end_position=0,
+            is_impossible=False,
+        )
+        return [example], [feature]
+
+    def test_save_and_load(self):
+        examples, features = self.get_examples_and_features()
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            path = os.path.join(tmpdirname, "cached_dev_metadata")
+            save_squad_metadata(examples, features, path, max_seq_length=6, fingerprint={"split": "dev"})
+            self.assertIsNone(load_squad_metadata(path, {"split": "test"}))
+            cached_examples, cached_features = load_squad_metadata(path, {"split": "dev"})
+
+        self.assertEqual(len(cached_examples), 1)
+        self.assertEqual(cached_examples[0].qas_id, "q0")
+        self.assertListEqual(list(cached_examples[0].doc_tokens), ["Le", "chat", "dort", "à", "Paris"])
+        self.assertListEqual(cached_examples[0].doc_tokens[3:5], ["à", "Paris"])
+        self.assertListEqual(cached_examples[0].answers, examples[0].answers)
+
+        feature = cached_features[0]
+        self.assertEqual((feature.example_index, feature.unique_id, feature.paragraph_len), (0, 1000000000, 3))
+        self.assertEqual(len(feature.tokens), 5)
+        self.assertListEqual(feature.tokens[2:4], ["▁Par", "is"])
+        self.assertNotIn(0, feature.token_to_orig_map)
+        self.assertEqual(feature.token_to_orig_map[3], 4)
+        self.assertTrue(feature.token_is_max_context.get(1, False))
+        self.assertFalse(feature.token_is_max_context.get(2, False))
+        self.assertFalse(feature.token_is_max_context.get(5, False))
+
+    @require_torch
+    def test_tensors_and_metadata_in_one_file(self):
+        examples, features = self.get_examples_and_features()
+        dataset = TensorDataset(torch.tensor([features[0].input_ids]), torch.tensor([features[0].attention_mask]))
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            path = os.path.join(tmpdirname, "cached_dev")
+            save_squad_cache(examples, features, dataset, path, max_seq_length=6, fingerprint={"split": "dev"})
+            cached_dataset = load_squad_tensors(path, {"split": "dev"})
+            cached_examples, cached_features = load_squad_metadata(path, {"split": "dev"})
+
+            self.assertEqual(len(cached_dataset.tensors), 2)
+            for cached, tensor in zip(cached_dataset.tensors, dataset.tensors):
+                self.assertTrue(torch.equal(cached, tensor))
+            self.assertEqual(cached_examples[0].qas_id, "q0")
+            self.assertEqual(cached_features[0].unique_id, 1000000000)
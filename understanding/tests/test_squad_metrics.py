@@ -0,0 +1,71 @@
+import os
+import random
+import tempfile
+import unittest
+
+from transformers import SquadFeatures
+from transformers.data.metrics.squad_metrics import compute_predictions_logits, compute_predictions_logits_batched
+from transformers.data.processors.squad import SquadExample, SquadResult
+
+
+class WhitespaceTokenizer(object):
+    def convert_tokens_to_string(self, tokens):
+        return " ".join(tokens)
+
+
+class SquadMetricsTest(unittest.TestCase):
+    def get_inputs(self, num_examples=20, seq_len=24, seed=0):
+        rng = random.Random(seed)
+        words = ["the", "cat", "sat", "on", "a", "mat", "in", "Paris"]
+        examples, features, results = [], [], []
+        for example_index in range(num_examples):
+            context = " ".join(rng.choice(words) for _ in range(rng.randint(5, 15)))
+            examples.append(SquadExample("q%d" % example_index, "where ?", context, None, None, ""))
+            doc_tokens = examples[-1].doc_tokens
+            for _ in range(rng.randint(1, 3)):
+                # two question tokens, then a window of the document
+                start = rng.randint(0, len(doc_tokens) - 1)
+                window = list(range(start, min(len(doc_tokens), start + seq_len - 3)))
+                tokens = ["<s>", "where", "?"] + [doc_tokens[i] for i in window]
+                token_to_orig_map = {3 + i: orig for i, orig in enumerate(window)}
+                token_is_max_context = {position: rng.random() < 0.8 for position in token_to_orig_map}
+                features.append(
+                    SquadFeatures(
+                        input_ids=None, attention_mask=None, token_type_ids=None, cls_index=0, p_mask=None,
+                        example_index=example_index, unique_id=1000000000 + len(features),
+                        paragraph_len=len(window), token_is_max_context=token_is_max_context, tokens=tokens,
+                        token_to_orig_map=token_to_orig_map, start_position=0, end_position=0, is_impossible=False,
+                    )
+                )
+                # integer logits to exercise the ties
+                results.append(
+                    SquadResult(
+                        features[-1].unique_id,
+                        [float(rng.randint(-3, 3)) for _ in range(seq_len)],
+                        [float(rng.randint(-3, 3)) for _ in range(seq_len)],
+                    )
+                )
+        return examples, features, results
+
+    def predict(self, compute_fn, version_2_with_negative, **kwargs):
+        examples, features, results = self.get_inputs()
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            paths = [os.path.join(tmpdirname, name) for name in ["predictions", "nbest", "null_odds"]]
+            compute_fn(
+                examples, features, results, 5, 4, True, paths[0], paths[1], paths[2], False,
+                version_2_with_negative, 0.0, WhitespaceTokenizer(), **kwargs
+            )
+            outputs = []
+            for path in paths:
+                if os.path.exists(path):
+                    with open(path) as reader:
+                        outputs.append(reader.read())
+        return outputs
+
+    def test_same_predictions(self):
+        for version_2_with_negative in [False, True]:
+            expected = self.predict(compute_predictions_logits, version_2_with_negative)
+            self.assertListEqual(self.predict(compute_predictions_logits_batched, version_2_with_negative), expected)
+            self.assertListEqual(
+                self.predict(compute_predictions_logits_batched, version_2_with_negative, num_workers=2), expected
+            )
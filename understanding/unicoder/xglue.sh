@@ -4,6 +4,8 @@
 DATA_DIR=$1
 MODEL_DIR=$2
 OUTPUT_DIR=$3
+# features are shared by the tasks and by the runs of every model using the same tokenizer
+FEATURES_CACHE_DIR=${4:-$DATA_DIR/features_cache}
 
 mkdir -p $OUTPUT_DIR
 
@@ -25,7 +27,7 @@ python examples/run_xglue.py --model_type xlmr \
 --task_name xnli \
 --save_steps -1 \
 --overwrite_output_dir \
---overwrite_cache \
+--shared_cache_dir $FEATURES_CACHE_DIR \
 --evaluate_during_training \
 --logging_steps -1 \
 --logging_steps_in_sample -1 \
@@ -49,7 +51,7 @@ python examples/run_xglue.py --model_type xlmr \
 --task_name ads \
 --save_steps -1 \
 --overwrite_output_dir \
---overwrite_cache \
+--shared_cache_dir $FEATURES_CACHE_DIR \
 --evaluate_during_training \
 --logging_steps -1 \
 --logging_steps_in_sample -1 \
@@ -73,7 +75,7 @@ python examples/run_xglue.py --model_type xlmr \
 --task_name qam \
 --save_steps -1 \
 --overwrite_output_dir \
---overwrite_cache \
+--shared_cache_dir $FEATURES_CACHE_DIR \
 --evaluate_during_training \
 --logging_steps -1 \
 --logging_steps_in_sample -1 \
@@ -97,7 +99,7 @@ python examples/run_xglue.py --model_type xlmr \
 --task_name pawsx \
 --save_steps -1 \
 --overwrite_output_dir \
---overwrite_cache \
+--shared_cache_dir $FEATURES_CACHE_DIR \
 --evaluate_during_training \
 --logging_steps -1 \
 --logging_steps_in_sample -1 \
@@ -120,7 +122,7 @@ python examples/run_xglue.py --model_type xlmr \
 --task_name news \
 --save_steps -1 \
 --overwrite_output_dir \
---overwrite_cache \
+--shared_cache_dir $FEATURES_CACHE_DIR \
 --evaluate_during_training \
 --logging_steps -1 \
 --logging_steps_in_sample -1 \
@@ -144,7 +146,7 @@ python examples/run_xglue.py --model_type xlmr \
 --task_name rel \
 --save_steps -1 \
 --overwrite_output_dir \
---overwrite_cache \
+--shared_cache_dir $FEATURES_CACHE_DIR \
 --evaluate_during_training \
 --logging_steps -1 \
 --logging_steps_in_sample -1 \
@@ -172,7 +174,7 @@ CUDA_VISIBLE_DEVICES=0 python examples/run_xmrc.py --model_type xlmr  \
 --doc_stride 128  \
 --output_dir $OUTPUT_DIR/MLQA \
 --overwrite_output_dir \
---overwrite_cache \
+--shared_cache_dir $FEATURES_CACHE_DIR \
 --evaluate_during_training \
 
 
@@ -194,7 +196,7 @@ python examples/ner/run_ner.py --data_dir $DATA_DIR/NER \
 --do_eval \
 --do_predict \
 --overwrite_output_dir \
---overwrite_cache \
+--shared_cache_dir $FEATURES_CACHE_DIR \
 --logging_each_epoch \
 --evaluate_during_training \
 --learning_rate 5e-6 \
@@ -218,7 +220,7 @@ python examples/ner/run_ner.py --data_dir $DATA_DIR/POS \
 --do_eval \
 --do_predict \
 --overwrite_output_dir \
---overwrite_cache \
+--shared_cache_dir $FEATURES_CACHE_DIR \
 --logging_each_epoch \
 --evaluate_during_training \
 --learning_rate 2e-5 \